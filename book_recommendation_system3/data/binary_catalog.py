@@ -0,0 +1,204 @@
+import mmap
+import os
+import struct
+import sys
+from collections.abc import Sequence
+import numpy as np
+from models.catalog import Catalog, StringTable
+
+# 文件头：魔数, 版本, 书数, 类别数, 作者数, 字符串数
+MAGIC = b"BOOKCAT\0"
+VERSION = 1
+_HEADER = struct.Struct("<8sIIIII")
+
+
+def _aligned(offset):
+    return (offset + 7) & ~7
+
+
+def _layout(n_books, n_categories, n_authors, n_strings):
+    """按固定顺序计算每一列在文件中的 (名称, dtype, 长度, 偏移)，读写两端共用
+
+    数值列都是定长的，字符串列保存的是字符串编号，真正的 UTF-8 内容在最后的字符串堆中，
+    string_offsets[i]:string_offsets[i+1] 是第 i 个字符串在堆里的字节范围。
+    类别表预先按类别分组好书的行号：category_rows[category_offsets[c]:category_offsets[c+1]]。
+    """
+    columns = [
+        ("string_offsets", np.uint64, n_strings + 1),
+        ("book_id_strings", np.uint32, n_books),
+        ("title_strings", np.uint32, n_books),
+        ("description_strings", np.uint32, n_books),
+        ("author_codes", np.uint32, n_books),
+        ("category_codes", np.uint32, n_books),
+        ("ratings", np.float64, n_books),
+        ("ratings_counts", np.int64, n_books),
+        ("author_strings", np.uint32, n_authors),
+        ("category_strings", np.uint32, n_categories),
+        ("category_offsets", np.int64, n_categories + 1),
+        ("category_rows", np.uint32, n_books),
+    ]
+    layout = []
+    offset = _HEADER.size
+    for name, dtype, count in columns:
+        offset = _aligned(offset)
+        layout.append((name, dtype, count, offset))
+        offset += np.dtype(dtype).itemsize * count
+    return layout, _aligned(offset)
+
+
+def compile_catalog(txt_path, bin_path):
+    """把 books.txt 编译成二进制目录文件，先写临时文件再原子替换；返回书的数量"""
+    strings = []
+    heap_size = [0]
+    string_offsets = [0]
+
+    def add_string(value):
+        data = value.encode("utf-8")
+        strings.append(data)
+        heap_size[0] += len(data)
+        string_offsets.append(heap_size[0])
+        return len(strings) - 1
+
+    authors = StringTable()
+    categories = StringTable()
+    columns = {name: [] for name in ("book_id_strings", "title_strings", "description_strings",
+                                     "author_codes", "category_codes", "ratings", "ratings_counts")}
+    with open(txt_path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.startswith('#') or not line.strip():
+                continue
+            book_id, title, author, category, description, rating, ratings_count = line.strip().split('|')
+            columns["book_id_strings"].append(add_string(str(int(book_id)))) # 与文本加载一致，书号规范成整数字符串
+            columns["title_strings"].append(add_string(title))
+            columns["description_strings"].append(add_string(description))
+            columns["author_codes"].append(authors.intern(author))
+            columns["category_codes"].append(categories.intern(category))
+            columns["ratings"].append(float(rating))
+            columns["ratings_counts"].append(int(ratings_count))
+    columns["author_strings"] = [add_string(author) for author in authors.values]
+    columns["category_strings"] = [add_string(category) for category in categories.values]
+
+    category_codes = np.asarray(columns["category_codes"], dtype=np.int64)
+    counts = np.bincount(category_codes, minlength=len(categories))
+    columns["category_offsets"] = np.concatenate([[0], np.cumsum(counts)])
+    columns["category_rows"] = np.argsort(category_codes, kind="stable")
+
+    n_books = len(columns["ratings"])
+    layout, heap_start = _layout(n_books, len(categories), len(authors), len(strings))
+    columns["string_offsets"] = np.asarray(string_offsets, dtype=np.uint64) + heap_start
+
+    tmp_path = bin_path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, VERSION, n_books, len(categories), len(authors), len(strings)))
+        for name, dtype, count, offset in layout:
+            f.write(b"\0" * (offset - f.tell()))
+            f.write(np.asarray(columns[name], dtype=dtype).tobytes())
+        f.write(b"\0" * (heap_start - f.tell()))
+        for data in strings:
+            f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, bin_path)
+    return n_books
+
+
+class HeapStrings(Sequence):
+    """按行号从字符串堆中惰性解码的字符串列 (用于很少访问的简介)，之后追加的字符串保存在普通列表中"""
+
+    def __init__(self, catalog_file, string_indices):
+        self._file = catalog_file
+        self._indices = string_indices
+        self._extra = []
+
+    def __getitem__(self, row):
+        if row < len(self._indices):
+            return self._file.string(self._indices[row])
+        return self._extra[row - len(self._indices)]
+
+    def __len__(self):
+        return len(self._indices) + len(self._extra)
+
+    def append(self, value):
+        self._extra.append(value)
+
+
+class BinaryCatalog:
+    """只读、内存映射的二进制图书目录，打开时不解析任何记录"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._mmap) < _HEADER.size:
+            raise ValueError(f"{path} is too small to be a binary catalog")
+        magic, version, n_books, n_categories, n_authors, n_strings = _HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} binary catalog")
+        layout, heap_start = _layout(n_books, n_categories, n_authors, n_strings)
+        if len(self._mmap) < heap_start:
+            raise ValueError(f"{path} is truncated")
+        self.n_books = n_books
+        for name, dtype, count, offset in layout:
+            setattr(self, name, np.frombuffer(self._mmap, dtype=dtype, count=count, offset=offset))
+
+    def __len__(self):
+        return self.n_books
+
+    def string(self, index):
+        """解码字符串堆中的第 index 个字符串"""
+        start, end = self.string_offsets[index], self.string_offsets[index + 1]
+        return self._mmap[start:end].decode("utf-8")
+
+    def strings(self, indices):
+        """一次性解码一列字符串，返回列表"""
+        offsets = self.string_offsets.tolist()
+        heap = self._mmap
+        return [heap[offsets[index]:offsets[index + 1]].decode("utf-8") for index in indices.tolist()]
+
+    @property
+    def categories(self):
+        """类别名列表，顺序与 category_codes 的编码一致"""
+        return self.strings(self.category_strings)
+
+    def category_rows_of(self, code):
+        """返回某个类别编码下所有书的行号"""
+        return self.category_rows[self.category_offsets[code]:self.category_offsets[code + 1]]
+
+    def to_catalog(self):
+        """转换成可写的 Catalog：数值列复制一份；书号和书名访问频繁，在此一次性解码，简介仍按需从映射文件中解码"""
+        n = self.n_books
+        catalog = Catalog(capacity=max(n, 1))
+        catalog.size = n
+        catalog.book_ids = self.strings(self.book_id_strings)
+        catalog.titles = self.strings(self.title_strings)
+        catalog.descriptions = HeapStrings(self, self.description_strings)
+        for table, indices in ((catalog.authors, self.author_strings), (catalog.categories, self.category_strings)):
+            table.values = self.strings(indices)
+            table.codes = {value: code for code, value in enumerate(table.values)}
+        catalog.author_codes[:n] = self.author_codes
+        catalog.category_codes[:n] = self.category_codes
+        catalog.ratings_counts[:n] = self.ratings_counts
+        catalog.rating_sums[:n] = self.ratings * self.ratings_counts
+        catalog.ratings[:n] = np.where(self.ratings_counts > 0, np.round(self.ratings, 2), 0.0)
+        return catalog
+
+    def close(self):
+        self._mmap.close()
+
+
+def open_catalog(txt_path, bin_path=None):
+    """打开 txt_path 对应的二进制目录，二进制文件不存在或比文本文件旧时先重新编译"""
+    bin_path = bin_path if bin_path else os.path.splitext(txt_path)[0] + ".bin"
+    if not os.path.exists(bin_path) or os.path.getmtime(bin_path) < os.path.getmtime(txt_path):
+        compile_catalog(txt_path, bin_path)
+    return BinaryCatalog(bin_path)
+
+
+if __name__ == "__main__":
+    # 用法：python -m data.binary_catalog data/books.txt [data/books.bin]
+    if len(sys.argv) < 2:
+        print("Usage: python -m data.binary_catalog BOOKS_TXT [BOOKS_BIN]")
+        sys.exit(1)
+    source = sys.argv[1]
+    target = sys.argv[2] if len(sys.argv) > 2 else os.path.splitext(source)[0] + ".bin"
+    print(f"Compiled {compile_catalog(source, target)} books into {target}")
@@ -0,0 +1,221 @@
+import os
+import queue
+from itertools import islice
+import threading
+import time
+
+class RatingLog:
+    """只追加写入的评分日志 (data/user_ratings.txt)
+
+    每条记录一行 "用户名,书名,评分"，同一 (用户, 书) 的多条记录以最后一条为准。
+    append() 只把记录放入队列，真正的写盘、批量 fsync 和日志压缩都在后台线程中完成，
+    因此不会阻塞 Tk 主线程；同一进程内只有这一个线程写文件，也不会互相覆盖。
+    后台线程写盘出错后停止，之后的 append() 和 flush() 会抛出这个异常，而不是悄悄丢弃记录或一直等待。
+    """
+    def __init__(self, file_path, fsync_every=32, fsync_interval=1.0, compact_threshold=10000):
+        self.file_path = file_path
+        self.fsync_every = fsync_every # 累计多少条记录做一次 fsync
+        self.fsync_interval = fsync_interval # 有未同步记录时最长多少秒做一次 fsync
+        self.compact_threshold = compact_threshold # 日志行数超过该值且大部分是旧记录时压缩
+        self._queue = queue.Queue()
+        self._lock = threading.Lock() # 保证写入线程出错后不会再有记录或 flush 标记进入队列
+        self._error = None # 写入线程出错时的异常
+        self._closed = False
+        self._needs_newline = False # 旧文件最后一行没有换行符，第一次写入前先补上
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    @staticmethod
+    def parse_line(line):
+        """解析一行记录，返回 (用户名, 书名, 评分)，格式不对时返回 None"""
+        line = line.strip()
+        if not line or line.startswith('#'):
+            return None
+        head, sep, rating_str = line.rpartition(',')
+        username, sep2, book_title = head.partition(',')
+        if not sep or not sep2 or not username or not book_title:
+            return None
+        try:
+            return username, book_title, float(rating_str)
+        except ValueError:
+            return None
+
+    @staticmethod
+    def format_record(username, book_title, rating):
+        if isinstance(rating, float) and rating.is_integer():
+            rating = int(rating)
+        return f"{username},{book_title},{rating}\n"
+
+    @classmethod
+    def replay(cls, file_path):
+        """流式读取日志，按顺序逐条产出 (用户名, 书名, 评分)"""
+        if not os.path.exists(file_path):
+            return
+        with open(file_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                record = cls.parse_line(line)
+                if record:
+                    yield record
+
+    @classmethod
+    def replay_chunks(cls, file_path, chunk_size=100000):
+        """流式读取日志，每次产出最多 chunk_size 条记录组成的列表"""
+        records = cls.replay(file_path)
+        while True:
+            chunk = list(islice(records, chunk_size))
+            if not chunk:
+                return
+            yield chunk
+
+    @classmethod
+    def load_latest(cls, file_path):
+        """一次遍历日志，返回 {(用户名, 书名): 评分}，后写入的记录覆盖先写入的"""
+        latest = {}
+        for username, book_title, rating in cls.replay(file_path):
+            latest[(username, book_title)] = rating
+        return latest
+
+    def _put(self, item):
+        """放入队列；写入线程已经出错或已关闭时抛出异常"""
+        with self._lock:
+            if self._error is not None:
+                raise self._error
+            if self._closed:
+                raise RuntimeError(f"Rating log '{self.file_path}' is closed")
+            self._queue.put(item)
+
+    def append(self, username, book_title, rating):
+        """追加一条评分记录 (立即返回，由后台线程写盘)"""
+        self._put((username, book_title, rating))
+
+    def flush(self, timeout=None):
+        """等待此前追加的记录全部写入并 fsync；超时返回 False，写入出错时抛出异常"""
+        done = threading.Event()
+        self._put(done)
+        finished = done.wait(timeout)
+        if self._error is not None:
+            raise self._error
+        return finished
+
+    def close(self, timeout=5):
+        """写完剩余记录后停止后台线程"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            if self._error is None:
+                self._queue.put(None)
+        self._thread.join(timeout)
+
+    def _open_for_append(self):
+        directory = os.path.dirname(self.file_path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        f = open(self.file_path, 'a', encoding='utf-8')
+        # 旧文件最后一行可能没有换行符，记下来在第一次写入时补上，避免新记录接在同一行；
+        # 没有新记录时不改动文件
+        self._needs_newline = False
+        if f.tell() > 0:
+            with open(self.file_path, 'rb') as check:
+                check.seek(-1, os.SEEK_END)
+                self._needs_newline = check.read(1) != b'\n'
+        return f
+
+    def _sync(self, f):
+        f.flush()
+        os.fsync(f.fileno())
+
+    def _fail(self, error, batch):
+        """记录写入线程的异常，唤醒所有等待 flush 的调用方；队列中剩余的记录无法再写入"""
+        with self._lock:
+            self._error = error
+        pending = list(batch)
+        while True:
+            try:
+                pending.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        lost = sum(1 for entry in pending if isinstance(entry, tuple))
+        if lost:
+            print(f"Error: {lost} rating records may not have been saved to '{self.file_path}'.")
+        for entry in pending:
+            if isinstance(entry, threading.Event):
+                entry.set()
+
+    def _run(self):
+        f = None
+        batch = []
+        try:
+            latest = self.load_latest(self.file_path) # 压缩时需要的每个 (用户, 书) 的最新评分
+            record_count = sum(1 for _ in self.replay(self.file_path))
+            f = self._open_for_append()
+            unsynced = 0
+            last_sync = time.monotonic()
+            while True:
+                try:
+                    item = self._queue.get(timeout=self.fsync_interval)
+                except queue.Empty:
+                    if unsynced:
+                        self._sync(f)
+                        unsynced, last_sync = 0, time.monotonic()
+                    continue
+
+                # 一次取出队列中所有积压的记录，合并为一次写入
+                batch = [item]
+                while True:
+                    try:
+                        batch.append(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+
+                waiters = []
+                stopping = False
+                lines = []
+                for entry in batch:
+                    if entry is None:
+                        stopping = True
+                    elif isinstance(entry, threading.Event):
+                        waiters.append(entry)
+                    else:
+                        username, book_title, rating = entry
+                        lines.append(self.format_record(username, book_title, rating))
+                        latest[(username, book_title)] = float(rating)
+                if lines:
+                    if self._needs_newline:
+                        f.write('\n')
+                        self._needs_newline = False
+                    f.write("".join(lines))
+                    unsynced += len(lines)
+                    record_count += len(lines)
+
+                if unsynced and (waiters or stopping or unsynced >= self.fsync_every
+                                 or time.monotonic() - last_sync >= self.fsync_interval):
+                    self._sync(f)
+                    unsynced, last_sync = 0, time.monotonic()
+                if record_count > self.compact_threshold and record_count > 2 * len(latest):
+                    f = self._compact(f, latest)
+                    record_count = len(latest)
+                for waiter in waiters:
+                    waiter.set()
+                if stopping:
+                    break
+        except Exception as e:
+            print(f"Error writing rating log '{self.file_path}': {e}")
+            self._fail(e, batch)
+        finally:
+            if f is not None:
+                f.close()
+
+    def _compact(self, f, latest):
+        """把日志重写为每个 (用户, 书) 只保留最新一条，写临时文件后原子替换"""
+        self._sync(f)
+        f.close()
+        tmp_path = f"{self.file_path}.compact"
+        with open(tmp_path, 'w', encoding='utf-8') as out:
+            out.writelines(self.format_record(username, book_title, rating)
+                           for (username, book_title), rating in latest.items())
+            out.flush()
+            os.fsync(out.fileno())
+        os.replace(tmp_path, self.file_path)
+        print(f"Rating log compacted to {len(latest)} records.")
+        return self._open_for_append()
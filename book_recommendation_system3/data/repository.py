@@ -0,0 +1,315 @@
+import os
+import sqlite3
+import threading
+from models.book import Book
+from models.user import User
+from models.catalog import Catalog, set_default_catalog
+from data.rating_log import RatingLog
+from data.sample_data import load_books, load_users
+
+# 数据目录，books.txt / users.txt / user_ratings.txt 都在这里
+DATA_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def format_user_line(user):
+    """按 users.txt 的格式生成一行，空字段用空字符串占位"""
+    preferences_str = ",".join(user.preferences) if user.preferences else ""
+    read_books_str = ",".join(map(str, user.read_books)) if user.read_books else ""
+    ratings_str = ",".join([f"{bid}:{rating:.1f}" for bid, rating in user.ratings.items()]) if user.ratings else ""
+    return f"{user.user_id}|{user.username}|{user.password}|{preferences_str}|{read_books_str}|{ratings_str}"
+
+
+class TextFileRepository:
+    """原有的文本文件存储：books.txt、users.txt 和只追加的评分日志 user_ratings.txt"""
+
+    def __init__(self, data_dir=DATA_DIR):
+        self.books_path = os.path.join(data_dir, "books.txt")
+        self.users_path = os.path.join(data_dir, "users.txt")
+        self.ratings_path = os.path.join(data_dir, "user_ratings.txt")
+        self.rating_log = RatingLog(self.ratings_path)
+        self._lock = threading.Lock()
+
+    def load_books(self):
+        return load_books(self.books_path)
+
+    def load_users(self):
+        return load_users(self.users_path)
+
+    def load_ratings(self):
+        """按顺序产出历史评分 (用户名, 书名, 评分)"""
+        return RatingLog.replay(self.ratings_path)
+
+    def add_user(self, user):
+        """把新用户追加到 users.txt"""
+        self.add_users([user])
+
+    def add_users(self, users):
+        """把一批新用户一次性追加到 users.txt"""
+        user_lines = "".join(format_user_line(user) + "\n" for user in users)
+        with self._lock:
+            # 检查文件末尾是否已有换行符
+            needs_newline = False
+            if os.path.exists(self.users_path) and os.path.getsize(self.users_path) > 0:
+                with open(self.users_path, 'rb') as f:
+                    f.seek(-1, os.SEEK_END) # 移动到文件末尾的前一个字节
+                    needs_newline = f.read(1) != b'\n'
+            with open(self.users_path, "a", encoding="utf-8") as f:
+                if needs_newline:
+                    f.write("\n")
+                f.write(user_lines) # 确保每个用户条目后都有换行符
+
+    def update_passwords(self, users):
+        """改写 users.txt 中这些用户的密码字段，其余内容原样保留；先写临时文件再替换，中途出错不会损坏原文件"""
+        passwords = {str(user.user_id): user.password for user in users}
+        with self._lock:
+            with open(self.users_path, "r", encoding="utf-8", newline="") as f: # 保留每行原有的换行符
+                lines = f.readlines()
+            for i, line in enumerate(lines):
+                content = line.rstrip("\r\n")
+                fields = content.split("|")
+                if not line.startswith("#") and len(fields) > 2 and fields[0] in passwords:
+                    fields[2] = passwords[fields[0]]
+                    lines[i] = "|".join(fields) + line[len(content):]
+            temp_path = self.users_path + ".tmp"
+            with open(temp_path, "w", encoding="utf-8", newline="") as f:
+                f.writelines(lines)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, self.users_path)
+
+    def save_rating(self, username, book_title, rating):
+        """评分写入评分日志，由日志的后台线程批量落盘"""
+        self.rating_log.append(username, book_title, rating)
+
+    def save_ratings(self, records):
+        for username, book_title, rating in records:
+            self.rating_log.append(username, book_title, rating)
+
+    def flush(self, timeout=None):
+        """等待此前提交的评分写入磁盘；超时返回 False，写入出错时抛出异常"""
+        return self.rating_log.flush(timeout)
+
+    def close(self):
+        self.rating_log.close()
+
+
+class SQLiteRepository:
+    """SQLite 存储 (WAL 模式)
+
+    用户名、书名和 (用户, 书) 上都有索引，查找、评分 upsert 和注册都是 O(log n)；
+    WAL 模式下读者不阻塞写者，多个进程同时写时靠 busy_timeout 排队。
+    所有 SQL 都是固定的参数化语句，由 sqlite3 的语句缓存复用预编译结果。
+    """
+
+    _SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS books (book_id TEXT PRIMARY KEY, title TEXT NOT NULL, author TEXT, "
+        "category TEXT, description TEXT, rating REAL NOT NULL DEFAULT 0, ratings_count INTEGER NOT NULL DEFAULT 0)",
+        "CREATE INDEX IF NOT EXISTS idx_books_title ON books (title)",
+        "CREATE TABLE IF NOT EXISTS users (user_id INTEGER PRIMARY KEY, username TEXT NOT NULL, password TEXT NOT NULL, "
+        "preferences TEXT NOT NULL DEFAULT '', read_books TEXT NOT NULL DEFAULT '')",
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_users_username ON users (username)",
+        "CREATE TABLE IF NOT EXISTS ratings (user_id INTEGER NOT NULL, book_id TEXT NOT NULL, rating REAL NOT NULL, "
+        "seq INTEGER NOT NULL, PRIMARY KEY (user_id, book_id)) WITHOUT ROWID",
+        "CREATE INDEX IF NOT EXISTS idx_ratings_book ON ratings (book_id)",
+        "CREATE INDEX IF NOT EXISTS idx_ratings_seq ON ratings (seq)", # MAX(seq) 走索引
+    )
+    _INSERT_BOOK = ("INSERT OR REPLACE INTO books (book_id, title, author, category, description, rating, ratings_count) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)")
+    _INSERT_USER = "INSERT INTO users (user_id, username, password, preferences, read_books) VALUES (?, ?, ?, ?, ?)"
+    # 评分按 (用户名, 书名) 写入，找不到用户或书时不插入；seq 记录写入顺序，加载时按它回放。
+    # 同名的书与内存中的书目一致，只取最先导入 (rowid 最小) 的一本
+    _UPSERT_RATING = (
+        "INSERT INTO ratings (user_id, book_id, rating, seq) "
+        "SELECT u.user_id, b.book_id, ?, (SELECT COALESCE(MAX(seq), 0) + 1 FROM ratings) "
+        "FROM users u, books b WHERE u.username = ? AND {book_condition} "
+        "ON CONFLICT (user_id, book_id) DO UPDATE SET rating = excluded.rating, seq = excluded.seq"
+    )
+    _BY_TITLE = "b.rowid = (SELECT rowid FROM books WHERE title = ? ORDER BY rowid LIMIT 1)"
+    _BY_BOOK_ID = "b.book_id = ?"
+
+    def __init__(self, db_path, batch_size=1000, busy_timeout=5.0):
+        self.db_path = db_path
+        self.batch_size = batch_size # 批量写入时每个事务包含的记录数
+        self.busy_timeout = busy_timeout
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, timeout=busy_timeout, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL") # WAL 下只在检查点 fsync
+        with self._transaction() as cursor:
+            for statement in self._SCHEMA:
+                cursor.execute(statement)
+
+    def _transaction(self):
+        return _Transaction(self._conn, self._lock)
+
+    def _query_one(self, statement, params=()):
+        with self._lock:
+            return self._conn.execute(statement, params).fetchone()
+
+    def is_empty(self):
+        return self._query_one("SELECT NOT EXISTS (SELECT 1 FROM books)")[0] == 1
+
+    def import_from(self, repository):
+        """从另一个存储 (通常是文本文件) 批量导入书籍、用户和评分"""
+        books = repository.load_books()
+        users = repository.load_users()
+        self._executemany(self._INSERT_BOOK, ((book.book_id, book.title, book.author, book.category, book.description,
+                                               book.rating, book.ratings_count) for book in books))
+        self._executemany(self._INSERT_USER, (self._user_row(user) for user in users))
+        # users.txt 中已废弃的评分列也一并导入，之后再回放评分日志
+        self.save_ratings(((user.username, book_id, rating) for user in users for book_id, rating in user.ratings.items()),
+                          by_title=False)
+        self.save_ratings(repository.load_ratings())
+        print(f"Imported {len(books)} books and {len(users)} users into {self.db_path}.")
+
+    def _executemany(self, statement, rows):
+        """把 rows 分成 batch_size 大小的事务批量执行"""
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= self.batch_size:
+                with self._transaction() as cursor:
+                    cursor.executemany(statement, batch)
+                batch = []
+        if batch:
+            with self._transaction() as cursor:
+                cursor.executemany(statement, batch)
+
+    @staticmethod
+    def _user_row(user):
+        return (user.user_id, user.username, user.password, ",".join(user.preferences),
+                ",".join(map(str, user.read_books)))
+
+    def _query_all(self, statement, params=()):
+        with self._lock:
+            return self._conn.execute(statement, params).fetchall()
+
+    def load_books(self):
+        catalog = Catalog()
+        books = [Book(*row, catalog=catalog) for row in self._query_all(
+            "SELECT book_id, title, author, category, description, rating, ratings_count FROM books ORDER BY rowid")]
+        set_default_catalog(catalog) # 注册窗口等从共享目录读取类别
+        return books
+
+    @staticmethod
+    def _make_user(row):
+        user_id, username, password, preferences, read_books = row
+        return User(user_id, username, password, preferences.split(',') if preferences else [],
+                    read_books.split(',') if read_books else [])
+
+    def load_users(self):
+        """加载用户资料；评分由 load_ratings 单独提供"""
+        return [self._make_user(row) for row in self._query_all(
+            "SELECT user_id, username, password, preferences, read_books FROM users ORDER BY user_id")]
+
+    def load_ratings(self):
+        """按写入顺序产出 (用户名, 书名, 评分)
+
+        评分可能很多，用单独的只读连接分批读取：读的是开始时的快照，也不占用共享连接的锁。
+        """
+        conn = sqlite3.connect(self.db_path, timeout=self.busy_timeout)
+        try:
+            cursor = conn.execute(
+                "SELECT u.username, b.title, r.rating FROM ratings r "
+                "JOIN users u ON u.user_id = r.user_id JOIN books b ON b.book_id = r.book_id ORDER BY r.seq")
+            while True:
+                rows = cursor.fetchmany(self.batch_size)
+                if not rows:
+                    return
+                yield from rows
+        finally:
+            conn.close()
+
+    def get_user(self, username):
+        """按用户名查找用户，走 username 唯一索引"""
+        row = self._query_one("SELECT user_id, username, password, preferences, read_books FROM users "
+                              "WHERE username = ?", (username,))
+        return self._make_user(row) if row else None
+
+    def next_user_id(self):
+        return self._query_one("SELECT COALESCE(MAX(user_id), 0) + 1 FROM users")[0]
+
+    def add_user(self, user):
+        """注册新用户，用户名重复时抛出 sqlite3.IntegrityError"""
+        with self._transaction() as cursor:
+            cursor.execute(self._INSERT_USER, self._user_row(user))
+
+    def add_users(self, users):
+        """批量注册新用户，每 batch_size 个一个事务"""
+        self._executemany(self._INSERT_USER, (self._user_row(user) for user in users))
+
+    def update_passwords(self, users):
+        self._executemany("UPDATE users SET password = ? WHERE user_id = ?",
+                          ((user.password, user.user_id) for user in users))
+
+    def save_rating(self, username, book_title, rating):
+        with self._transaction() as cursor:
+            cursor.execute(self._UPSERT_RATING.format(book_condition=self._BY_TITLE), (float(rating), username, book_title))
+
+    def save_ratings(self, records, by_title=True):
+        """批量 upsert 评分记录 (用户名, 书名或书号, 评分)，每 batch_size 条一个事务"""
+        statement = self._UPSERT_RATING.format(book_condition=self._BY_TITLE if by_title else self._BY_BOOK_ID)
+        self._executemany(statement, ((float(rating), username, book) for username, book, rating in records))
+
+    def flush(self, timeout=None):
+        """每条评分在 save_rating 返回前已经提交，无需等待"""
+        return True
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class _Transaction:
+    """串行化同一连接上的写事务：BEGIN IMMEDIATE 先拿到写锁，异常时回滚"""
+
+    def __init__(self, conn, lock):
+        self._conn = conn
+        self._lock = lock
+
+    def __enter__(self):
+        self._lock.acquire()
+        try:
+            self._conn.execute("BEGIN IMMEDIATE")
+        except Exception:
+            self._lock.release()
+            raise
+        return self._conn.cursor()
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            self._conn.execute("ROLLBACK" if exc_type else "COMMIT")
+        finally:
+            self._lock.release()
+        return False
+
+
+_repository = None
+_repository_lock = threading.Lock()
+
+
+def open_repository(backend=None):
+    """按 backend (默认读取环境变量 BOOK_STORAGE，"text" 或 "sqlite") 创建存储
+
+    SQLite 数据库路径由 BOOK_DB_PATH 指定，默认 data/books.db；数据库为空时先从文本文件导入。
+    """
+    backend = backend if backend else os.environ.get("BOOK_STORAGE", "text")
+    if backend == "text":
+        return TextFileRepository()
+    if backend == "sqlite":
+        repository = SQLiteRepository(os.environ.get("BOOK_DB_PATH", os.path.join(DATA_DIR, "books.db")))
+        if repository.is_empty():
+            text_repository = TextFileRepository()
+            repository.import_from(text_repository)
+            text_repository.close()
+        return repository
+    raise ValueError(f"Unknown storage backend '{backend}', expected 'text' or 'sqlite'")
+
+
+def get_repository():
+    """进程内共享的存储实例，第一次调用时按环境变量创建"""
+    global _repository
+    with _repository_lock:
+        if _repository is None:
+            _repository = open_repository()
+        return _repository
@@ -1,11 +1,25 @@
+import os
 from models.book import Book
 from models.user import User
+from models.catalog import set_default_catalog
+from data.binary_catalog import open_catalog
 
-def load_books():
+def load_books(file_path='data/books.txt'):
+    """加载图书数据：优先内存映射 books.bin (比books.txt旧时自动重新编译)，失败时逐行解析books.txt"""
+    if os.path.exists(file_path):
+        try:
+            catalog = open_catalog(file_path).to_catalog()
+            set_default_catalog(catalog) # 注册窗口等从共享目录读取类别
+            return catalog.books()
+        except Exception as e:
+            print(f"加载二进制图书目录失败，改为解析books.txt: {str(e)}")
+    return load_books_from_text(file_path)
+
+def load_books_from_text(file_path='data/books.txt'):
     """从books.txt加载图书数据"""
     books = []
     try:
-        with open('data/books.txt', 'r', encoding='utf-8') as f:
+        with open(file_path, 'r', encoding='utf-8') as f:
             for line in f:
                 if line.startswith('#') or not line.strip():
                     continue
@@ -23,11 +37,11 @@ def load_books():
         print("警告：books.txt文件不存在")
     return books
 
-def load_users():
+def load_users(file_path='data/users.txt'):
     """从users.txt加载用户数据"""
     users = []
     try:
-        with open('data/users.txt', 'r', encoding='utf-8') as f:
+        with open(file_path, 'r', encoding='utf-8') as f:
             for line in f:
                 if line.startswith('#') or not line.strip():
                     continue
@@ -0,0 +1,30 @@
+import queue
+import threading
+
+
+def run_in_background(widget, func, on_done, poll_ms=30):
+    """在工作线程中执行 func()，完成后在 Tk 主线程中调用 on_done(结果, 异常)
+
+    用于密码哈希、写入存储等较慢的操作，避免界面卡住。工作线程不操作控件，
+    主线程用 after() 轮询结果 (与 ChatStreamer 的队列做法一致)；widget 已销毁时不再回调。
+    """
+    results = queue.Queue(maxsize=1)
+
+    def work():
+        try:
+            results.put((func(), None))
+        except Exception as e:
+            results.put((None, e))
+
+    def poll():
+        if not widget.winfo_exists():
+            return
+        try:
+            value, error = results.get_nowait()
+        except queue.Empty:
+            widget.after(poll_ms, poll)
+            return
+        on_done(value, error)
+
+    threading.Thread(target=work, daemon=True).start()
+    widget.after(poll_ms, poll)
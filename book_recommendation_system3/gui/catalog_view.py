@@ -0,0 +1,318 @@
+import tkinter as tk
+from tkinter import ttk
+import numpy as np
+
+# 列名 -> (标题, 宽度, 对齐)
+COLUMNS = {
+    "title": ("书名", 180, tk.W),
+    "author": ("作者", 110, tk.W),
+    "category": ("类别", 80, tk.W),
+    "rating": ("评分", 50, tk.CENTER),
+    "count": ("评价数", 70, tk.CENTER),
+}
+SORTABLE = ("title", "rating", "count") # 可以点击表头排序的列
+
+
+class TitleMatcher:
+    """按书名或作者的子串做增量匹配
+
+    新的查询是上一次查询的延续 (用户继续输入) 时，只在上一次的结果中继续筛选，
+    每输入一个字不必重新扫描整个书目。书目变化后 (engine.catalog_version 改变) 自动重建。
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+        self._version = None
+        self._keys = []
+        self._last_query = None
+        self._last_rows = None
+
+    def _refresh(self):
+        if self._version != self.engine.catalog_version:
+            self._version = self.engine.catalog_version
+            self._keys = [f"{book.title}\n{book.author}".lower() for book in self.engine.books]
+            self._last_query = None
+            self._last_rows = None
+
+    def match(self, query):
+        """返回匹配 query 的书在 engine.books 中的下标数组 (按书目顺序)；query 为空时返回 None 表示全部"""
+        self._refresh()
+        query = query.strip().lower()
+        if not query:
+            return None
+        if self._last_query is not None and query.startswith(self._last_query):
+            candidates = self._last_rows.tolist()
+        else:
+            candidates = range(len(self._keys))
+        keys = self._keys
+        rows = np.fromiter((row for row in candidates if query in keys[row]), dtype=np.int64)
+        self._last_query = query
+        self._last_rows = rows
+        return rows
+
+    def titles(self, query, limit=20):
+        """匹配 query 的前 limit 个书名，用于输入提示"""
+        rows = self.match(query)
+        books = self.engine.books
+        if rows is None:
+            return [book.title for book in books[:limit]]
+        return [books[row].title for row in rows[:limit].tolist()]
+
+
+def _numeric_key(book, sort_key, descending):
+    """数值列的排序键：升序时是列的值，降序时取负，这样两种顺序都是按键升序排列"""
+    value = float(book.rating if sort_key == "rating" else book.ratings_count)
+    return -value if descending else value
+
+
+def sorted_catalog(books, sort_key, descending):
+    """按 sort_key 排序，返回 (书目下标数组, 对应的排序键数组)；值相同的书保持书目顺序，sort_key 为 None 时就是书目顺序
+
+    只有评分和评价数这样的数值列有排序键，其余为 None。
+
+    数值列按 (排序键, 下标) 升序排列，一本书的值变化后可以用二分查找只移动这一行。
+    """
+    if sort_key is None:
+        return np.arange(len(books)), None
+    if sort_key == "title":
+        order = sorted(range(len(books)), key=lambda row: books[row].title, reverse=descending)
+        return np.array(order, dtype=np.int64), None
+    keys = np.fromiter((_numeric_key(book, sort_key, descending) for book in books),
+                       dtype=np.float64, count=len(books))
+    order = np.argsort(keys, kind="stable")
+    return order, keys[order]
+
+
+def _tie_position(order, keys, key, row):
+    """在按 (排序键, 下标) 升序的数组中，(key, row) 所在或应插入的位置"""
+    begin = int(np.searchsorted(keys, key, side="left"))
+    end = int(np.searchsorted(keys, key, side="right"))
+    return begin + int(np.searchsorted(order[begin:end], row))
+
+
+def filter_order(order, rows):
+    """从排好序的 order 中取出 rows 中的书，保持排序"""
+    if rows is None:
+        return order
+    rank = np.empty(len(order), dtype=np.int64)
+    rank[order] = np.arange(len(order))
+    return rows[np.argsort(rank[rows], kind="stable")]
+
+
+class CatalogView:
+    """虚拟化的书目表格
+
+    Treeview 中只放当前可见的几十行，滚动时按偏移量重新填充这些行；
+    排序和搜索只改变下标数组 (NumPy)，不会为整个书目创建 Tk 条目，十万本书也能立即显示。
+    引擎的全文检索索引就绪后，搜索框按 BM25 相关度 (最后一个词按前缀) 显示前 max_results 本，
+    索引建好之前退回到书名/作者的子串匹配。
+    """
+
+    def __init__(self, parent, engine, on_select=None, rows=15, max_results=2000):
+        self.engine = engine
+        self.max_results = max_results
+        self.on_select = on_select # on_select(书) 在选中一行时调用
+        self.matcher = TitleMatcher(engine)
+        self.visible_rows = rows
+        self.offset = 0 # 第一行可见行在 order 中的位置
+        self.sort_key = None
+        self.descending = False
+        self.order = np.arange(0)
+        # 整个书目按当前列排好的顺序，书目版本或排序列变化时才重新排序
+        self._sorted_state = None # (排序列, 是否降序, 书目版本)
+        self._sorted_order = None
+        self._sorted_keys = None
+        self._row_keys = None # 每本书 (按 engine.books 下标) 当前的排序键
+        self._row_of_book = {} # id(书) -> 在 engine.books 中的下标
+        self._query = ""
+        self._search_job = None
+
+        self.frame = ttk.Frame(parent)
+        self.frame.grid_rowconfigure(1, weight=1)
+        self.frame.grid_columnconfigure(0, weight=1)
+
+        # 搜索框：边输入边筛选
+        search_frame = ttk.Frame(self.frame)
+        search_frame.grid(row=0, column=0, columnspan=2, sticky=(tk.W, tk.E), pady=(0, 5))
+        ttk.Label(search_frame, text="搜索:").pack(side=tk.LEFT)
+        self.search_var = tk.StringVar()
+        search_entry = ttk.Entry(search_frame, textvariable=self.search_var)
+        search_entry.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
+        self.search_var.trace_add("write", lambda *args: self._schedule_search())
+        self.count_label = ttk.Label(search_frame, text="")
+        self.count_label.pack(side=tk.LEFT)
+
+        self.tree = ttk.Treeview(self.frame, columns=list(COLUMNS), show="headings", height=rows, selectmode="browse")
+        for column, (text, width, anchor) in COLUMNS.items():
+            command = (lambda c=column: self.sort_by(c)) if column in SORTABLE else ""
+            self.tree.heading(column, text=text, command=command)
+            self.tree.column(column, width=width, anchor=anchor, stretch=column == "title")
+        self.tree.grid(row=1, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
+        # 滚动条不跟 Treeview 绑定，位置由整个 order 的偏移量决定
+        self.scrollbar = ttk.Scrollbar(self.frame, orient=tk.VERTICAL, command=self._on_scrollbar)
+        self.scrollbar.grid(row=1, column=1, sticky=(tk.N, tk.S))
+
+        self.detail_label = ttk.Label(self.frame, text="", wraplength=480, justify=tk.LEFT)
+        self.detail_label.grid(row=2, column=0, columnspan=2, sticky=(tk.W, tk.E), pady=(5, 0))
+
+        self.tree.bind("<<TreeviewSelect>>", self._on_tree_select)
+        self.tree.bind("<MouseWheel>", lambda e: self.scroll(-3 if e.delta > 0 else 3) or "break")
+        self.tree.bind("<Button-4>", lambda e: self.scroll(-3) or "break") # Linux 滚轮
+        self.tree.bind("<Button-5>", lambda e: self.scroll(3) or "break")
+        self.tree.bind("<Up>", lambda e: self._move_selection(-1))
+        self.tree.bind("<Down>", lambda e: self._move_selection(1))
+        self.tree.bind("<Prior>", lambda e: self.scroll(-self.visible_rows) or "break")
+        self.tree.bind("<Next>", lambda e: self.scroll(self.visible_rows) or "break")
+        self.tree.bind("<Configure>", self._on_resize)
+        self.refresh()
+
+    def grid(self, **kwargs):
+        self.frame.grid(**kwargs)
+
+    def _matching_rows(self):
+        """搜索结果在 engine.books 中的下标，按相关度 (子串匹配时按书目顺序) 排列；没有搜索时返回 None"""
+        if not self._query.strip():
+            return None
+        if self.engine.search_index is not None:
+            return self.engine.search_books_rows(self._query, n=self.max_results, prefix=True)[0]
+        return self.matcher.match(self._query)
+
+    def _full_order(self):
+        """整个书目的排序结果；书目变化或换了排序列时重新排序，否则直接复用"""
+        state = (self.sort_key, self.descending, self.engine.catalog_version)
+        if state != self._sorted_state:
+            books = self.engine.books
+            self._sorted_order, self._sorted_keys = sorted_catalog(books, self.sort_key, self.descending)
+            if self._sorted_keys is not None:
+                self._row_keys = np.empty_like(self._sorted_keys)
+                self._row_keys[self._sorted_order] = self._sorted_keys
+            self._row_of_book = {id(book): row for row, book in enumerate(books)}
+            self._sorted_state = state
+        return self._sorted_order
+
+    def refresh(self):
+        """书目或搜索条件变化后重新计算排序和筛选，保持当前滚动位置
+
+        书目没变时复用已排好的顺序；单本书的评分变化请调用 refresh_book。
+        """
+        rows = self._matching_rows()
+        if rows is not None and self.sort_key is None:
+            self.order = rows # 没有点击表头排序时保持相关度顺序
+        else:
+            self.order = filter_order(self._full_order(), rows)
+        self.count_label.config(text=f"共 {len(self.order)} 本")
+        self._render()
+
+    def refresh_book(self, book):
+        """一本书的评分变化后只把这一行移到新的位置 (二分查找)，不重新排序整个书目"""
+        if self._sorted_state != (self.sort_key, self.descending, self.engine.catalog_version):
+            self.refresh()
+            return
+        if self._sorted_keys is None: # 按书名或书目顺序排列时位置不变，只需刷新显示的评分
+            self._render()
+            return
+        row = self._row_of_book.get(id(book))
+        if row is None:
+            return
+        new_key = _numeric_key(book, self.sort_key, self.descending)
+        old_key = self._row_keys[row]
+        if new_key != old_key:
+            order, keys = self._sorted_order, self._sorted_keys
+            position = _tie_position(order, keys, old_key, row)
+            order, keys = np.delete(order, position), np.delete(keys, position)
+            position = _tie_position(order, keys, new_key, row)
+            self._sorted_order = np.insert(order, position, row)
+            self._sorted_keys = np.insert(keys, position, new_key)
+            self._row_keys[row] = new_key
+        self.refresh()
+
+    def sort_by(self, column):
+        """按列排序，再次点击同一列时切换升降序；评分和评价数默认从高到低"""
+        if self.sort_key == column:
+            self.descending = not self.descending
+        else:
+            self.sort_key = column
+            self.descending = column != "title"
+        for name, (text, _, _) in COLUMNS.items():
+            arrow = (" ▼" if self.descending else " ▲") if name == column else ""
+            self.tree.heading(name, text=text + arrow)
+        self.offset = 0
+        self._sorted_state = None # 点击表头时总是按最新的数据重新排序
+        self.refresh()
+
+    def _schedule_search(self):
+        # 连续输入时只在停顿 150 毫秒后搜索一次
+        if self._search_job is not None:
+            self.frame.after_cancel(self._search_job)
+        self._search_job = self.frame.after(150, self._run_search)
+
+    def _run_search(self):
+        self._search_job = None
+        self._query = self.search_var.get()
+        self.offset = 0
+        self.refresh()
+
+    def scroll(self, rows):
+        self._set_offset(self.offset + rows)
+
+    def _set_offset(self, offset):
+        offset = max(0, min(offset, len(self.order) - self.visible_rows))
+        if offset != self.offset:
+            self.offset = offset
+            self._render()
+
+    def _on_scrollbar(self, action, amount, unit=None):
+        if action == "moveto":
+            self._set_offset(int(float(amount) * len(self.order)))
+        elif action == "scroll":
+            step = self.visible_rows if unit == "pages" else 1
+            self.scroll(int(amount) * step)
+
+    def _on_resize(self, event):
+        row_height = int(float(ttk.Style().lookup("Treeview", "rowheight") or 20))
+        rows = max((event.height - row_height) // row_height, 1) # 减去表头
+        if rows != self.visible_rows:
+            self.visible_rows = rows
+            self._render()
+
+    def _render(self):
+        """只把 order[offset:offset+visible_rows] 这些行放进 Treeview"""
+        self.offset = max(0, min(self.offset, len(self.order) - self.visible_rows))
+        selected = self.tree.selection()
+        self.tree.delete(*self.tree.get_children())
+        books = self.engine.books
+        for row in self.order[self.offset:self.offset + self.visible_rows].tolist():
+            book = books[row]
+            self.tree.insert("", tk.END, iid=str(row), values=(book.title, book.author, book.category,
+                                                                f"{book.rating:.1f}", book.ratings_count))
+        if selected and self.tree.exists(selected[0]):
+            self.tree.selection_set(selected[0])
+        total = len(self.order)
+        if total:
+            self.scrollbar.set(self.offset / total, min((self.offset + self.visible_rows) / total, 1.0))
+        else:
+            self.scrollbar.set(0.0, 1.0)
+
+    def _move_selection(self, step):
+        """键盘上下移动选中行，到达可见区域边缘时滚动"""
+        children = self.tree.get_children()
+        if not children:
+            return "break"
+        selected = self.tree.selection()
+        index = children.index(selected[0]) + step if selected else 0
+        if index < 0 or index >= len(children):
+            self.scroll(step)
+            children = self.tree.get_children()
+            index = max(0, min(index, len(children) - 1))
+        self.tree.selection_set(children[index])
+        self.tree.focus(children[index])
+        return "break"
+
+    def _on_tree_select(self, event=None):
+        selected = self.tree.selection()
+        if not selected:
+            return
+        book = self.engine.books[int(selected[0])]
+        self.detail_label.config(text=f"《{book.title}》 {book.author} | {book.category}\n简介: {book.description}")
+        if self.on_select:
+            self.on_select(book)
@@ -0,0 +1,156 @@
+import os
+import queue
+import threading
+import tkinter as tk
+
+# DeepSeek 兼容 OpenAI 接口；密钥和地址从环境变量读取，不再写在代码里
+DEFAULT_BASE_URL = "https://api.deepseek.com"
+DEFAULT_MODEL = "deepseek-chat"
+
+
+class ChatStreamer:
+    """把流式对话回复渲染到 Tk 文本框中
+
+    后台线程只负责读取流并把增量文本放入队列；Tk 主线程每帧用 after() 取出队列中的全部内容，
+    合并成一次 insert，避免每个 token 都触发一次界面刷新，也不会在工作线程里操作控件。
+    OpenAI 客户端 (内部是带连接池的 httpx 客户端) 只创建一次，在多条消息之间复用。
+    传入 cache (models.chat_context.ResponseCache) 时，完整结束的回复按 cache_key 缓存，重复的问题不再请求API。
+    """
+
+    def __init__(self, master, text_widget, on_finished=None, fps=30, api_key=None, base_url=None, model=None,
+                 cache=None):
+        self.master = master
+        self.text_widget = text_widget
+        self.on_finished = on_finished # 回复结束 (完成、出错或停止) 后在主线程中调用
+        self.frame_ms = max(int(1000 / fps), 1)
+        self.api_key = api_key if api_key else os.environ.get("DEEPSEEK_API_KEY")
+        self.base_url = base_url if base_url else os.environ.get("DEEPSEEK_BASE_URL", DEFAULT_BASE_URL)
+        self.model = model if model else os.environ.get("DEEPSEEK_MODEL", DEFAULT_MODEL)
+        self.cache = cache
+        self._client = None
+        self._client_lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._generation = 0 # 每条消息一个编号，停止后旧消息残留在队列中的内容会被丢弃
+        self._active = False
+        self._stream = None
+        self._cancel = threading.Event()
+        self._drain_job = None
+
+    @property
+    def is_active(self):
+        return self._active
+
+    def _get_client(self):
+        with self._client_lock:
+            if self._client is None:
+                if not self.api_key:
+                    raise RuntimeError("未设置 DEEPSEEK_API_KEY 环境变量")
+                from openai import OpenAI
+                self._client = OpenAI(api_key=self.api_key, base_url=self.base_url)
+            return self._client
+
+    def start(self, messages, cache_key=None):
+        """开始一条新的流式回复
+
+        messages 可以是消息列表，也可以是返回消息列表的函数 (在工作线程中调用，适合检索等较慢的准备工作)。
+        """
+        self._generation += 1
+        self._cancel = threading.Event()
+        self._active = True
+        cached = self.cache.get(cache_key) if self.cache is not None and cache_key is not None else None
+        if cached is not None:
+            self._queue.put((self._generation, "text", cached))
+            self._queue.put((self._generation, "done", None))
+        else:
+            worker = threading.Thread(target=self._read_stream,
+                                      args=(messages, self._generation, self._cancel, cache_key), daemon=True)
+            worker.start()
+        if self._drain_job is not None:
+            self.master.after_cancel(self._drain_job)
+        self._drain_job = self.master.after(self.frame_ms, self._drain)
+
+    def stop(self):
+        """立即取消当前回复：关闭底层 HTTP 响应，并丢弃尚未显示的内容"""
+        if not self._active:
+            return
+        self._cancel.set()
+        stream = self._stream
+        if stream is not None:
+            try:
+                stream.close()
+            except Exception:
+                pass
+        self._generation += 1
+        self._finish()
+
+    def _read_stream(self, messages, generation, cancel, cache_key=None):
+        """工作线程：读取流，把增量文本放入队列"""
+        try:
+            if callable(messages):
+                messages = messages()
+            if cancel.is_set():
+                return
+            stream = self._get_client().chat.completions.create(model=self.model, messages=messages, stream=True)
+            if generation == self._generation:
+                self._stream = stream # 供 stop() 关闭连接
+            if cancel.is_set(): # 建立连接期间已被停止
+                stream.close()
+                return
+            parts = []
+            for chunk in stream:
+                if cancel.is_set():
+                    break
+                if chunk.choices and chunk.choices[0].delta and chunk.choices[0].delta.content:
+                    parts.append(chunk.choices[0].delta.content)
+                    self._queue.put((generation, "text", parts[-1]))
+            if not cancel.is_set() and self.cache is not None and cache_key is not None:
+                self.cache.put(cache_key, "".join(parts)) # 只缓存完整结束的回复
+            self._queue.put((generation, "done", None))
+        except Exception as e:
+            if not cancel.is_set(): # 被手动停止时关闭连接引发的异常不算错误
+                self._queue.put((generation, "error", e))
+
+    def _drain(self):
+        """主线程：每帧取出队列中的全部内容，合并后一次性插入"""
+        self._drain_job = None
+        parts = []
+        finished = None
+        while True:
+            try:
+                generation, kind, payload = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if generation != self._generation:
+                continue # 已停止的旧回复
+            if kind == "text":
+                parts.append(payload)
+            else:
+                finished = (kind, payload)
+                break
+        if parts or finished:
+            self.text_widget.config(state=tk.NORMAL)
+            if parts:
+                self.text_widget.insert(tk.END, "".join(parts))
+            if finished:
+                kind, payload = finished
+                self.text_widget.insert(tk.END, "\n\n" if kind == "done" else f"\n发生错误: {payload}\n\n")
+            self.text_widget.config(state=tk.DISABLED)
+            self.text_widget.see(tk.END)
+        if finished:
+            self._finish(finished[1] if finished[0] == "error" else None)
+        elif self._active:
+            self._drain_job = self.master.after(self.frame_ms, self._drain)
+
+    def _finish(self, error=None):
+        self._active = False
+        self._stream = None
+        if self.on_finished:
+            self.on_finished(error)
+
+    def close(self):
+        """停止当前回复并关闭复用的 HTTP 客户端"""
+        self.stop()
+        with self._client_lock:
+            if self._client is not None:
+                self._client.close()
+                self._client = None
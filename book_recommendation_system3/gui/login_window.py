@@ -1,17 +1,17 @@
 import tkinter as tk
 from tkinter import ttk, messagebox
-from models.user import User
 from gui.register_window import RegisterWindow
+from gui.background import run_in_background
 import os # 新增导入 os 模块
 
 class LoginWindow:
-    def __init__(self, master, users, on_login_success):
+    def __init__(self, master, directory, on_login_success):
         self.master = master
         self.master.withdraw()  # 先隐藏主窗口
 
         self.top = tk.Toplevel(master) # 修改为 Toplevel
         self.top.title("图书推荐系统 - 用户登录") # 修改窗口标题
-        self.users = users
+        self.directory = directory # UserDirectory：按用户名的哈希索引和密码校验
         self.on_login_success = on_login_success
 
         # 设置窗口大小和位置
@@ -33,6 +33,7 @@ class LoginWindow:
     def on_closing(self):
         """处理窗口关闭事件"""
         if messagebox.askokcancel("退出", "确定要退出程序吗？", parent=self.top):
+            self.directory.close() # 写完刚注册还在排队的用户
             self.top.destroy()
             self.master.destroy()  # 确保主程序也被关闭
 
@@ -63,10 +64,10 @@ class LoginWindow:
         self.password_entry.place(x=120, y=140)
 
         # 按钮
-        login_button = ttk.Button(self.top, text="登录", command=self.login, width=10)
-        login_button.place(x=70, y=200)
+        self.login_button = ttk.Button(self.top, text="登录", command=self.login, width=10)
+        self.login_button.place(x=70, y=200)
 
-        recover_button = ttk.Button(self.top, text="找回密码", command=self.show_recover_password, width=10)
+        recover_button = ttk.Button(self.top, text="修改密码", command=self.show_change_password, width=10)
         recover_button.place(x=180, y=200)
 
         register_button = ttk.Button(self.top, text="注册", command=self.show_register_window, width=22)
@@ -95,33 +96,36 @@ class LoginWindow:
             return
 
         # 先检查用户名是否存在
-        user_exists = any(u.username == username for u in self.users)
-        if not user_exists:
+        if username not in self.directory:
             messagebox.showerror("错误", "用户名不存在！")
             self.username_var.set("")  # 清空用户名
             self.password_var.set("")  # 清空密码
             self.username_entry.focus()  # 焦点设置到用户名框
             return
 
-        # 检查密码是否正确
-        user = next((u for u in self.users if u.username == username and u.password == password), None)
+        # 检查密码是否正确 (与保存的加盐哈希比较)；哈希较慢，在工作线程中计算
+        self.login_button.config(state=tk.DISABLED) # 校验期间防止重复提交
+        run_in_background(self.top, lambda: self.directory.authenticate(username, password), self._on_authenticated)
+
+    def _on_authenticated(self, user, error):
+        self.login_button.config(state=tk.NORMAL)
         if user:
             self.on_login_success(user)  # 先调用登录成功的回调
             self.master.deiconify()  # 显示主窗口
             self.top.destroy()  # 销毁登录窗口
         else:
-            messagebox.showerror("错误", "密码错误！")
+            messagebox.showerror("错误", f"登录失败：{error}" if error else "密码错误！")
             self.password_var.set("")  # 只清空密码
             self.password_entry.focus()  # 焦点设置到密码框
 
-    def show_recover_password(self):
-        """显示找回密码窗口"""
+    def show_change_password(self):
+        """显示修改密码窗口：必须输入当前密码 (密码只保存哈希，无法找回原密码)"""
         recover_window = tk.Toplevel(self.top)
-        recover_window.title("找回密码")
+        recover_window.title("修改密码")
 
         # 设置窗口大小和位置
         window_width = 250
-        window_height = 150
+        window_height = 280
         screen_width = recover_window.winfo_screenwidth()
         screen_height = recover_window.winfo_screenheight()
         x = (screen_width - window_width) // 2
@@ -132,7 +136,7 @@ class LoginWindow:
         recover_window.transient(self.top)
         recover_window.grab_set()
 
-        # 创建找回密码界面
+        # 创建修改密码界面
         frame = ttk.Frame(recover_window, padding="20")
         frame.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
 
@@ -141,27 +145,52 @@ class LoginWindow:
         self.recover_username_entry = ttk.Entry(frame)
         self.recover_username_entry.grid(row=1, column=0, sticky=(tk.W, tk.E), pady=5)
 
-        def recover_password():
-            # 直接从输入框获取用户名
+        ttk.Label(frame, text="请输入当前密码:").grid(row=2, column=0, sticky=tk.W, pady=5)
+        self.recover_current_entry = ttk.Entry(frame, show="*")
+        self.recover_current_entry.grid(row=3, column=0, sticky=(tk.W, tk.E), pady=5)
+
+        ttk.Label(frame, text="请输入新密码:").grid(row=4, column=0, sticky=tk.W, pady=5)
+        self.recover_password_entry = ttk.Entry(frame, show="*")
+        self.recover_password_entry.grid(row=5, column=0, sticky=(tk.W, tk.E), pady=5)
+
+        def on_changed(user, error):
+            change_button.config(state=tk.NORMAL)
+            if error is not None:
+                messagebox.showerror("错误", f"保存新密码失败：{error}", parent=recover_window)
+            elif user is None:
+                messagebox.showerror("错误", "用户名或当前密码错误！", parent=recover_window)
+            else:
+                messagebox.showinfo("修改密码", f"用户 {user.username} 的密码已修改，请使用新密码登录。", parent=recover_window)
+                recover_window.destroy()
+
+        def change_password():
+            # 直接从输入框获取用户名、当前密码和新密码
             username = self.recover_username_entry.get().strip()
+            current_password = self.recover_current_entry.get().strip()
+            new_password = self.recover_password_entry.get().strip()
             if not username:
                 messagebox.showwarning("警告", "请输入用户名！")
                 return
+            if not current_password:
+                messagebox.showwarning("警告", "请输入当前密码！")
+                return
+            if not new_password:
+                messagebox.showwarning("警告", "请输入新密码！")
+                return
 
-            user = next((u for u in self.users if u.username == username), None)
-            if user:
-                messagebox.showinfo("找回密码", f"用户 {username} 的密码是: {user.password}")
-                recover_window.destroy()
-            else:
-                messagebox.showerror("错误", "用户名不存在！")
+            # 校验和哈希在工作线程中进行，密码随批量写入存储，写入成功后才提示修改成功
+            change_button.config(state=tk.DISABLED)
+            run_in_background(recover_window, lambda: self.directory.change_password(
+                username, current_password, new_password, wait=True, immediate=False), on_changed)
 
-        ttk.Button(frame, text="找回密码", command=recover_password).grid(row=2, column=0, pady=20)
+        change_button = ttk.Button(frame, text="修改密码", command=change_password)
+        change_button.grid(row=6, column=0, pady=10)
 
         # 设置初始焦点
         self.recover_username_entry.focus()
 
     def show_register_window(self):
-        RegisterWindow(self.top, self.users, self.on_register_success)
+        RegisterWindow(self.top, self.directory, self.on_register_success)
 
     def on_register_success(self, user):
         messagebox.showinfo("成功", f"注册成功，欢迎 {user.username}!")
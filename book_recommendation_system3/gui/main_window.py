@@ -2,13 +2,19 @@ import tkinter as tk
 from tkinter import ttk, messagebox
 from PIL import Image, ImageTk
 import os
-import threading # <--- 添加 threading 导入
-from models.recommendation_engine import RecommendationEngine
+import threading
+from models.recommendation_engine import RecommendationEngine, PROJECT_ROOT
+from models.trainer import BackgroundTrainer
+from models.user_directory import UserDirectory
 from models.user import User
 from models.book import Book
 from data.sample_data import load_sample_data
+from data.repository import get_repository
 from gui.login_window import LoginWindow
-from openai import OpenAI # <--- 添加 OpenAI 导入
+from gui.background import run_in_background
+from gui.chat_stream import ChatStreamer
+from gui.catalog_view import CatalogView, TitleMatcher
+from models.chat_context import ResponseCache
 
 class MainWindow:
     def __init__(self, master, books, users): # 添加 books 和 users 参数
@@ -24,26 +30,47 @@ class MainWindow:
         self.master.geometry(f"{window_width}x{window_height}+{x}+{y}")
         self.master.protocol("WM_DELETE_WINDOW", self.on_closing) # 添加关闭事件处理
 
-        self.engine = RecommendationEngine()
+        # 存储层：文本文件或 SQLite，由环境变量 BOOK_STORAGE 选择
+        self.repository = get_repository()
+        # 用户目录：登录、注册共用的用户名索引，新用户和密码修改批量写入存储
+        # 训练好的模型按数据指纹缓存在 data/model_cache 中，数据没变时启动不必重新训练
+        self.engine = RecommendationEngine(cache_dir=os.path.join(PROJECT_ROOT, "data", "model_cache"),
+                                           user_directory=UserDirectory(repository=self.repository))
+        # 模型在后台线程中训练：启动时一次，之后每累计一定数量的新评分或隔一段时间再训练
+        self.training_status = "推荐模型准备中..." # 由训练线程写入，主线程定时读取显示
+        self.trainer = BackgroundTrainer(self.engine, progress_callback=self.on_training_progress)
         self.books = books 
         self.users = users 
         self.setup_data() 
         self.current_user = None
-        self.ai_thread = None # 用于跟踪AI线程
-        self.stop_ai_event = threading.Event() # 用于停止AI线程的事件
+        self.chat_streamer = None # AI对话的流式渲染器，创建对话标签页时初始化
         self.show_login_window()
         
     def setup_data(self):
         # 加载示例数据
         # self.books, self.users = load_sample_data() # 不再需要重新加载
-        for book in self.books:
-            self.engine.add_book(book)
-        for user in self.users:
-            self.engine.add_user(user)
+        # 一次性导入书籍、用户和历史评分；推荐模型交给后台训练，窗口不必等待
+        # 模型就绪之前推荐会退回到类别和高评分策略
+        self.engine.bulk_load(self.books, self.users, self.repository.load_ratings(), build_models=False)
+        self.trainer.request_retrain()
+        # 全文检索索引也在后台构建，建好之前搜索框使用子串匹配
+        threading.Thread(target=self.engine.build_search_index, daemon=True).start()
+
+    def on_training_progress(self, stage, fraction):
+        """训练线程的进度回调，只记录状态，由主线程的定时器刷新界面"""
+        stages = {"start": "推荐模型训练中...", "cf": "正在训练协同过滤模型...", "content": "正在训练内容推荐模型...",
+                  "done": "正在切换到新模型...", "swapped": "推荐模型已就绪", "failed": "推荐模型训练失败，使用旧模型"}
+        self.training_status = f"{stages.get(stage, stage)} ({int(fraction * 100)}%)"
+
+    def poll_training_status(self):
+        """每隔500毫秒把训练状态刷新到推荐页的状态标签上"""
+        if hasattr(self, 'training_status_label') and self.training_status_label.winfo_exists():
+            self.training_status_label.config(text=self.training_status)
+            self.master.after(500, self.poll_training_status)
     
     def show_login_window(self):
         """显示登录窗口"""
-        LoginWindow(self.master, self.users, self.on_login_success)
+        LoginWindow(self.master, self.engine.user_directory, self.on_login_success)
     
     def on_login_success(self, user):
         """登录成功回调"""
@@ -88,15 +115,10 @@ class MainWindow:
         self.all_books_frame.grid_rowconfigure(0, weight=1)
         self.all_books_frame.grid_columnconfigure(0, weight=1)
         
-        # 创建图书列表
-        self.books_text = tk.Text(self.all_books_frame, height=15, width=60)
-        self.books_text.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S)) 
-        books_scrollbar = ttk.Scrollbar(self.all_books_frame, orient=tk.VERTICAL, command=self.books_text.yview)
-        books_scrollbar.grid(row=0, column=1, sticky=(tk.N, tk.S))
-        self.books_text['yscrollcommand'] = books_scrollbar.set
-        
-        # 显示所有图书
-        self.display_all_books()
+        # 图书列表：只渲染可见的行，支持按评分/评价数排序和边输入边搜索
+        # 选中的书会同步到"图书评分"页的输入框
+        self.catalog_view = CatalogView(self.all_books_frame, self.engine, on_select=self.select_book_to_rate)
+        self.catalog_view.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
         
         # 创建"推荐系统"标签页
         self.recommend_frame = ttk.Frame(self.notebook)
@@ -120,6 +142,11 @@ class MainWindow:
         # 推荐按钮
         ttk.Button(self.recommend_frame, text="获取推荐", command=self.show_recommendations).grid(row=0, column=2, padx=5)
         
+        # 模型训练状态
+        self.training_status_label = ttk.Label(self.recommend_frame, text=self.training_status)
+        self.training_status_label.grid(row=1, column=2, sticky=tk.W, pady=(5,0))
+        self.poll_training_status()
+
         # 推荐结果显示区域
         #ttk.Label(self.recommend_frame, text="推荐图书:").grid(row=2, column=0, sticky=tk.W, pady=(10,0))
         self.result_text = tk.Text(self.recommend_frame, height=10, width=50)
@@ -146,17 +173,6 @@ class MainWindow:
         self.main_frame.grid_rowconfigure(0, weight=1)
         self.main_frame.grid_columnconfigure(0, weight=1)
     
-    def display_all_books(self):
-        """显示所有图书"""
-        self.books_text.delete(1.0, tk.END)
-        for book in self.books:
-            self.books_text.insert(tk.END, f"书名: {book.title}\n")
-            self.books_text.insert(tk.END, f"作者: {book.author}\n")
-            self.books_text.insert(tk.END, f"类别: {book.category}\n")
-            self.books_text.insert(tk.END, f"评分: {book.rating}\n")
-            self.books_text.insert(tk.END, f"简介: {book.description}\n")
-            self.books_text.insert(tk.END, "-" * 50 + "\n")
-    
     def show_recommendations(self):
         """显示推荐结果"""
         if self.current_user:
@@ -169,10 +185,14 @@ class MainWindow:
 
     def on_closing(self):
         """处理主窗口关闭事件"""
-        if self.ai_thread and self.ai_thread.is_alive():
-            self.stop_ai_event.set() # 尝试停止AI线程
-            self.ai_thread.join(timeout=1) # 等待线程一小段时间
+        if self.chat_streamer:
+            self.chat_streamer.stop() # 立即取消正在进行的AI回复
         if messagebox.askokcancel("退出", "确定要退出程序吗?"):
+            if self.chat_streamer:
+                self.chat_streamer.close()
+            self.trainer.close(timeout=1)
+            self.engine.user_directory.close() # 写完排队中的新用户和密码修改
+            self.repository.close() # 写完尚未落盘的评分
             self.master.quit()
             self.master.destroy()
 
@@ -182,11 +202,13 @@ class MainWindow:
 
         ttk.Label(self.rating_frame, text="选择图书:").grid(row=0, column=0, padx=5, pady=5, sticky=tk.W)
         self.book_to_rate_var = tk.StringVar()
-        book_titles = [book.title for book in self.books]
-        self.book_rating_combobox = ttk.Combobox(self.rating_frame, textvariable=self.book_to_rate_var, values=book_titles, state="readonly", width=40)
+        # 输入书名或作者的一部分，下拉列表只放匹配的前20本，不再装入整个书目
+        self.rating_title_matcher = TitleMatcher(self.engine)
+        self.book_rating_combobox = ttk.Combobox(self.rating_frame, textvariable=self.book_to_rate_var, width=40,
+                                                 postcommand=self.update_rating_suggestions)
         self.book_rating_combobox.grid(row=0, column=1, padx=5, pady=5, sticky=(tk.W, tk.E))
-        if book_titles:
-            self.book_rating_combobox.current(0)
+        self.book_rating_combobox.bind("<KeyRelease>", self.update_rating_suggestions)
+        self.update_rating_suggestions()
 
         ttk.Label(self.rating_frame, text="选择评分:").grid(row=1, column=0, padx=5, pady=5, sticky=tk.W)
         self.rating_var = tk.IntVar(value=3) # 默认3星
@@ -201,6 +223,21 @@ class MainWindow:
         submit_rating_button = ttk.Button(self.rating_frame, text="提交评分", command=self.submit_rating)
         submit_rating_button.grid(row=2, column=1, padx=5, pady=10, sticky=tk.E)
 
+    def update_rating_suggestions(self, event=None):
+        """按当前输入更新评分页下拉列表中的候选书名"""
+        if event is not None and event.keysym in ("Up", "Down", "Return", "Escape"):
+            return
+        query = self.book_to_rate_var.get()
+        if self.engine.search_index is not None and query.strip():
+            titles = [book.title for book in self.engine.suggest_books(query, n=20)]
+        else:
+            titles = self.rating_title_matcher.titles(query, limit=20)
+        self.book_rating_combobox['values'] = titles
+
+    def select_book_to_rate(self, book):
+        """在"所有图书"页选中一本书时，把它填入评分页"""
+        self.book_to_rate_var.set(book.title)
+
     def submit_rating(self):
         """提交用户对图书的评分"""
         if not self.current_user:
@@ -213,6 +250,11 @@ class MainWindow:
         if not book_title:
             messagebox.showwarning("提示", "请选择一本图书进行评分！")
             return
+        # 书名可以手动输入，先确认书目中有这本书
+        selected_book = self.engine.get_book_by_title(book_title)
+        if selected_book is None:
+            messagebox.showwarning("提示", f"书目中没有《{book_title}》，请从下拉列表中选择！")
+            return
         
         # 确认评分
         confirm = messagebox.askyesno("确认评分", f"您确定要为《{book_title}》评分为 {rating} 星吗？")
@@ -220,58 +262,36 @@ class MainWindow:
             return
 
         try:
-            # 获取data文件夹的路径，确保与books.txt, users.txt在同一目录下
-            base_data_path = os.path.join(os.path.dirname(__file__), '..', 'data')
-            if not os.path.exists(base_data_path):
-                os.makedirs(base_data_path) # 如果data目录不存在则创建
-            
-            ratings_file_path = os.path.join(base_data_path, "user_ratings.txt")
-            
-            # 检查是否已对该书评过分，如果评过则更新，否则追加
-            updated = False
-            lines = []
-            if os.path.exists(ratings_file_path):
-                with open(ratings_file_path, 'r', encoding='utf-8') as f_read:
-                    for line in f_read:
-                        parts = line.strip().split(',')
-                        if len(parts) == 3 and parts[0] == self.current_user.username and parts[1] == book_title:
-                            lines.append(f"{self.current_user.username},{book_title},{rating}\n")
-                            updated = True
-                        else:
-                            lines.append(line)
-            
-            if not updated:
-                lines.append(f"{self.current_user.username},{book_title},{rating}\n")
-
-            with open(ratings_file_path, 'w', encoding='utf-8') as f_write:
-                f_write.writelines(lines)
+            # 只追加一条记录，写盘和压缩由评分日志的后台线程完成，不阻塞界面；
+            # 写入线程已经出错时这里直接抛出异常
+            self.repository.save_rating(self.current_user.username, book_title, rating)
 
-            messagebox.showinfo("成功", f"《{book_title}》评分 {rating} 已保存！")
-            
             # 更新 RecommendationEngine 中的用户评分数据（如果需要实时更新推荐）
-            # 首先找到对应的Book对象
-            selected_book = next((book for book in self.books if book.title == book_title), None)
-            if selected_book:
-                # 假设User对象有一个方法可以更新或添加评分
-                # self.current_user.add_rating(selected_book.book_id, rating) # 需要User类支持
-                # 或者直接更新引擎中的用户对书的评分记录
-                self.engine.add_rating(self.current_user, selected_book, rating)
-                print(f"Debug: Rating added to engine for user {self.current_user.username}, book {selected_book.title}, rating {rating}")
+            # 假设User对象有一个方法可以更新或添加评分
+            # self.current_user.add_rating(selected_book.book_id, rating) # 需要User类支持
+            # 或者直接更新引擎中的用户对书的评分记录
+            self.engine.add_rating(self.current_user, selected_book, rating)
+            self.trainer.notify_rating() # 累计到一定数量后在后台重新训练
+            self.catalog_view.refresh_book(selected_book) # 书的评分变了，按评分排序时只移动这一行
+            print(f"Debug: Rating added to engine for user {self.current_user.username}, book {selected_book.title}, rating {rating}")
 
         except Exception as e:
             messagebox.showerror("错误", f"保存评分失败: {e}")
             print(f"保存评分时出错: {e}")
-
-    def display_all_books(self):
-        """显示所有图书"""
-        self.books_text.delete(1.0, tk.END)
-        for book in self.books:
-            self.books_text.insert(tk.END, f"书名: {book.title}\n")
-            self.books_text.insert(tk.END, f"作者: {book.author}\n")
-            self.books_text.insert(tk.END, f"类别: {book.category}\n")
-            self.books_text.insert(tk.END, f"评分: {book.rating}\n")
-            self.books_text.insert(tk.END, f"简介: {book.description}\n")
-            self.books_text.insert(tk.END, "-" * 50 + "\n")
+            return
+        # 等评分真正写入磁盘后再提示“已保存”
+        run_in_background(self.master, lambda: self.repository.flush(timeout=10.0),
+                          lambda saved, error: self._on_rating_saved(book_title, rating, saved, error))
+
+    def _on_rating_saved(self, book_title, rating, saved, error):
+        """评分写盘完成后在主线程中提示结果"""
+        if error is not None:
+            messagebox.showerror("错误", f"保存评分失败: {error}")
+            print(f"保存评分时出错: {error}")
+        elif not saved:
+            messagebox.showwarning("提示", f"《{book_title}》评分 {rating} 已提交，正在写入磁盘，请稍候。")
+        else:
+            messagebox.showinfo("成功", f"《{book_title}》评分 {rating} 已保存！")
 
     def create_ai_chat_widgets(self):
         """创建AI对话标签页的控件"""
@@ -298,10 +318,15 @@ class MainWindow:
         self.stop_ai_button = ttk.Button(self.ai_chat_frame, text="停止", command=self.stop_ai_response, state=tk.DISABLED)
         self.stop_ai_button.grid(row=1, column=2, padx=5, pady=5, sticky=tk.E)
 
+        # 复用同一个客户端；API 密钥和地址来自环境变量 DEEPSEEK_API_KEY / DEEPSEEK_BASE_URL
+        # 相同的问题 (同一用户，书目、模型和该用户的评分都未变化) 在10分钟内直接使用缓存的回复
+        self.chat_streamer = ChatStreamer(self.master, self.chat_history_text, on_finished=self._finalize_ai_response,
+                                          cache=ResponseCache(max_size=256, ttl=600.0))
+
     def stop_ai_response(self):
         """停止当前的AI响应"""
-        if self.ai_thread and self.ai_thread.is_alive():
-            self.stop_ai_event.set() # 设置事件，通知线程停止
+        if self.chat_streamer and self.chat_streamer.is_active:
+            self.chat_streamer.stop() # 立即关闭连接，结束后回调 _finalize_ai_response
             self.chat_history_text.config(state=tk.NORMAL)
             self.chat_history_text.insert(tk.END, "\n[AI响应已停止]\n")
             self.chat_history_text.config(state=tk.DISABLED)
@@ -315,83 +340,32 @@ class MainWindow:
             messagebox.showwarning("提示", "请输入您想发送的内容！")
             return
 
-        if self.ai_thread and self.ai_thread.is_alive():
+        if self.chat_streamer.is_active:
             messagebox.showwarning("提示", "AI正在回复中，请稍候或点击停止后再发送新消息。")
             return
 
-        # 在对话历史中显示用户消息
+        # 在对话历史中显示用户消息和AI回复前缀
         self.chat_history_text.config(state=tk.NORMAL)
         self.chat_history_text.insert(tk.END, f"您: {user_message}\n")
+        self.chat_history_text.insert(tk.END, "AI: ") # AI回复前缀
         self.chat_history_text.config(state=tk.DISABLED)
         self.chat_history_text.see(tk.END) # 滚动到底部
         self.user_input_entry.delete(0, tk.END) # 清空输入框
 
-        # 显示AI正在回复的初始提示
-        self.chat_history_text.config(state=tk.NORMAL)
-        self.chat_history_text.insert(tk.END, "AI: ") # AI回复前缀
-        self.chat_history_text.config(state=tk.DISABLED)
-        self.chat_history_text.see(tk.END)
-        self.master.update_idletasks() # 强制更新UI
-
         self.send_button.config(state=tk.DISABLED)
         self.stop_ai_button.config(state=tk.NORMAL)
-        self.stop_ai_event.clear() # 重置停止事件
 
-        # 创建并启动新线程处理API调用
-        self.ai_thread = threading.Thread(target=self._get_deepseek_response, args=(user_message,))
-        self.ai_thread.daemon = True # 设置为守护线程，主程序退出时线程也退出
-        self.ai_thread.start()
+        # 后台线程检索书目、读取流式回复，主线程按固定帧率批量显示
+        user = self.current_user
+        self.chat_streamer.start(lambda: self.engine.chat_messages(user, user_message),
+                                 cache_key=self.engine.chat_cache_key(user, user_message))
 
-    def _get_deepseek_response(self, user_message):
-        try:
-            client = OpenAI(api_key="***", base_url="https://api.deepseek.com")//使用自己申请的api
-            messages = [
-                {"role": "system", "content": "You are a helpful assistant"},
-                {"role": "user", "content": user_message},
-            ]
-            
-            response_stream = client.chat.completions.create(
-                model="deepseek-chat",
-                messages=messages,
-                stream=True
-            )
-            
-            self.chat_history_text.config(state=tk.NORMAL)
-            for chunk in response_stream:
-                if self.stop_ai_event.is_set(): # 检查是否需要停止
-                    break 
-                if chunk.choices and chunk.choices[0].delta and chunk.choices[0].delta.content:
-                    ai_content_part = chunk.choices[0].delta.content
-                    self.chat_history_text.insert(tk.END, ai_content_part)
-                    self.chat_history_text.see(tk.END) 
-                    self.master.update_idletasks() 
-            
-            if not self.stop_ai_event.is_set():
-                self.chat_history_text.insert(tk.END, "\n\n")
-            self.chat_history_text.config(state=tk.DISABLED)
-            self.chat_history_text.see(tk.END)
-
-        except Exception as e:
-            if not self.stop_ai_event.is_set(): # 只有在未被手动停止时才显示错误
-                self.chat_history_text.config(state=tk.NORMAL)
-                current_content = self.chat_history_text.get("1.0", tk.END)
-                if current_content.endswith("AI: "):
-                    self.chat_history_text.insert(tk.END, f"发生错误: {e}\n\n")
-                else: 
-                    self.chat_history_text.insert(tk.END, f"\nAI: 发生错误: {e}\n\n")
-                self.chat_history_text.config(state=tk.DISABLED)
-                self.chat_history_text.see(tk.END)
-                # messagebox.showerror("API错误", f"与Deepseek API通信失败: {e}") # 不在线程中直接调用messagebox
-                self.master.after(0, lambda: messagebox.showerror("API错误", f"与Deepseek API通信失败: {e}"))
-        finally:
-            # 确保按钮状态在线程结束时恢复
-            self.master.after(0, self._finalize_ai_response)
-
-    def _finalize_ai_response(self):
+    def _finalize_ai_response(self, error=None):
         """在AI响应完成后（成功、失败或停止）恢复按钮状态"""
         self.send_button.config(state=tk.NORMAL)
         self.stop_ai_button.config(state=tk.DISABLED)
-        self.stop_ai_event.clear()
+        if error is not None:
+            messagebox.showerror("API错误", f"与Deepseek API通信失败: {error}")
 
 # 主程序入口 (如果直接运行此文件进行测试)
 if __name__ == '__main__':
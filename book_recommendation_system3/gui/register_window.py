@@ -1,14 +1,16 @@
 import tkinter as tk
 from tkinter import ttk, messagebox
-from models.user import User
+from models.catalog import default_catalog
+from data.binary_catalog import open_catalog
+from gui.background import run_in_background
 import os # 新增导入 os
 
 class RegisterWindow:
-    def __init__(self, master, users, on_register_success):
+    def __init__(self, master, directory, on_register_success):
         self.master = master
         self.top = tk.Toplevel(master)
         self.top.title("用户注册")
-        self.users = users
+        self.directory = directory # UserDirectory：查重、分配用户号、哈希密码并批量写入存储
         self.on_register_success = on_register_success
 
         # 设置窗口大小和位置
@@ -25,26 +27,22 @@ class RegisterWindow:
         self.create_widgets()
 
     def load_book_categories(self):
-        """从 books.txt 加载并返回唯一的书籍类别列表"""
-        categories = set()
+        """返回唯一的书籍类别列表：优先读取已加载的共享目录，否则读取二进制目录中预先计算的类别表"""
+        categories = default_catalog().category_names()
+        if categories:
+            return categories
         try:
             # 获取当前脚本所在的目录，然后构建 books.txt 的绝对路径
             current_dir = os.path.dirname(os.path.abspath(__file__))
             books_file_path = os.path.join(current_dir, '..', 'data', 'books.txt')
-            
-            with open(books_file_path, "r", encoding="utf-8") as f:
-                for line in f:
-                    if line.strip() and not line.startswith("#"):
-                        parts = line.strip().split('|')
-                        if len(parts) > 3:
-                            category = parts[3].strip()
-                            if category:
-                                categories.add(category)
+            catalog_file = open_catalog(books_file_path)
+            categories = [name for code, name in enumerate(catalog_file.categories) if len(catalog_file.category_rows_of(code))]
+            catalog_file.close()
         except FileNotFoundError:
             messagebox.showerror("错误", f"无法找到书籍数据文件: {books_file_path}")
         except Exception as e:
             messagebox.showerror("错误", f"加载书籍类别失败: {str(e)}")
-        return sorted(list(categories))
+        return sorted(categories)
 
     def create_widgets(self):
         # 创建主框架
@@ -104,7 +102,8 @@ class RegisterWindow:
                     row_num += 1
 
         # 注册按钮
-        ttk.Button(main_frame, text="注册", command=self.register).grid(row=4, column=0, columnspan=2, pady=20) # 行号调整为4
+        self.register_button = ttk.Button(main_frame, text="注册", command=self.register)
+        self.register_button.grid(row=4, column=0, columnspan=2, pady=20) # 行号调整为4
 
         # 设置容器权重
         categories_container.rowconfigure(0, weight=1)
@@ -140,50 +139,31 @@ class RegisterWindow:
             return
 
         # 检查用户名重复
-        if any(u.username == username for u in self.users):
+        if username in self.directory:
             messagebox.showerror("错误", "用户名已存在！")
             self.clear_entries()
             self.username_entry.focus()
             return
 
-        # 生成用户ID
-        new_user_id = max([u.user_id for u in self.users] + [0]) + 1
-        new_user = User(new_user_id, username, password, preferences)
-        self.users.append(new_user)
-        self.save_user_to_file(new_user)
+        # 分配用户ID、哈希密码并写入存储 (文本文件或 SQLite)；在工作线程中进行，
+        # 与同一时段的其他注册一起批量写入，写入成功后才提示注册成功
+        self.register_button.config(state=tk.DISABLED)
+        run_in_background(self.top, lambda: self.directory.register(username, password, preferences,
+                                                                    wait=True, immediate=False),
+                          self._on_registered)
+
+    def _on_registered(self, new_user, error):
+        self.register_button.config(state=tk.NORMAL)
+        if isinstance(error, ValueError):
+            messagebox.showerror("错误", f"注册失败：{str(error)}", parent=self.top)
+            return
+        if error is not None:
+            messagebox.showerror("错误", f"保存用户数据失败：{str(error)}", parent=self.top)
+            return
 
         self.on_register_success(new_user)
         self.top.destroy()
 
-    def save_user_to_file(self, user):
-        """按指定格式写入文件，确保空字段用空字符串占位"""
-        preferences_str = ",".join(user.preferences) if user.preferences else ""
-        read_books_str = ",".join(map(str, user.read_books)) if user.read_books else ""
-        ratings_str = ",".join([f"{bid}:{rating:.1f}" for bid, rating in user.ratings.items()]) if user.ratings else ""
-        
-        # 构建 users.txt 的绝对路径
-        current_dir = os.path.dirname(os.path.abspath(__file__))
-        users_file_path = os.path.join(current_dir, '..', 'data', 'users.txt')
-
-        user_line = f"{user.user_id}|{user.username}|{user.password}|{preferences_str}|{read_books_str}|{ratings_str}"
-
-        try:
-            # 检查文件末尾是否已有换行符
-            needs_newline = True
-            if os.path.exists(users_file_path) and os.path.getsize(users_file_path) > 0:
-                with open(users_file_path, 'rb+') as f: # 以二进制读写模式打开
-                    f.seek(-1, os.SEEK_END) # 移动到文件末尾的前一个字节
-                    if f.read(1) == b'\n':
-                        needs_newline = False
-            
-            with open(users_file_path, "a", encoding="utf-8") as f:
-                if needs_newline and os.path.getsize(users_file_path) > 0: # 如果文件非空且需要换行
-                    f.write("\n")
-                f.write(user_line)
-                f.write("\n") # 确保每个用户条目后都有换行符
-        except Exception as e:
-            messagebox.showerror("错误", f"保存用户失败：{str(e)}")
-
     def clear_entries(self):
         """清空所有输入框内容"""
         self.username_entry.delete(0, tk.END)
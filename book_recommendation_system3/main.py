@@ -1,10 +1,11 @@
 import tkinter as tk
 from gui.main_window import MainWindow
-from data.sample_data import load_sample_data
+from data.repository import get_repository
 
 def main():
-    # 获取图书和用户数据
-    books, users = load_sample_data()
+    # 获取图书和用户数据，存储后端由环境变量 BOOK_STORAGE 选择 (text 或 sqlite)
+    repository = get_repository()
+    books, users = repository.load_books(), repository.load_users()
 
     root = tk.Tk()
     root.title("图书推荐系统")
@@ -1,17 +1,58 @@
+from .catalog import default_catalog
+
+
 class Book:
-    def __init__(self, book_id, title, author, category, description, rating=0.0, ratings_count=0):
-        self.book_id = str(book_id) # 确保book_id是字符串
-        self.title = title
-        self.author = author
-        self.category = category
-        self.description = description
-        # 内部存储总评分和，以便精确计算平均分
-        self._total_rating_sum = float(rating) * int(ratings_count)
-        self.ratings_count = int(ratings_count)
-        if self.ratings_count > 0:
-            self.rating = round(self._total_rating_sum / self.ratings_count, 2)
-        else:
-            self.rating = 0.0
+    """图书：列式目录 Catalog 中一行的轻量视图，数据本身保存在目录的数组里"""
+
+    __slots__ = ("_catalog", "_row")
+
+    def __init__(self, book_id, title, author, category, description, rating=0.0, ratings_count=0, catalog=None):
+        self._catalog = catalog if catalog is not None else default_catalog()
+        self._row = self._catalog.add_book(book_id, title, author, category, description, rating, ratings_count)
+
+    @classmethod
+    def view(cls, catalog, row):
+        """返回目录中已有的第 row 行的视图，不追加新行"""
+        book = object.__new__(cls)
+        book._catalog = catalog
+        book._row = row
+        return book
+
+    @property
+    def catalog(self):
+        return self._catalog
+
+    @property
+    def row(self):
+        return self._row
+
+    @property
+    def book_id(self):
+        return self._catalog.book_ids[self._row] # 添加时已确保book_id是字符串
+
+    @property
+    def title(self):
+        return self._catalog.titles[self._row]
+
+    @property
+    def author(self):
+        return self._catalog.authors[self._catalog.author_codes[self._row]]
+
+    @property
+    def category(self):
+        return self._catalog.categories[self._catalog.category_codes[self._row]]
+
+    @property
+    def description(self):
+        return self._catalog.descriptions[self._row]
+
+    @property
+    def rating(self):
+        return float(self._catalog.ratings[self._row])
+
+    @property
+    def ratings_count(self):
+        return int(self._catalog.ratings_counts[self._row])
 
     def add_rating(self, new_rating):
         """为这本书添加一个新的评分，并更新平均分和评分总数"""
@@ -22,13 +63,21 @@ class Book:
                 # 可以选择是否接受无效评分，或在此处抛出错误/忽略
                 # return # 如果决定忽略无效评分
 
-            self._total_rating_sum += new_rating
-            self.ratings_count += 1
-            if self.ratings_count > 0:
-                self.rating = round(self._total_rating_sum / self.ratings_count, 2)
-            # else 分支已在 __init__ 中处理，此处 ratings_count 必大于0
+            self._catalog.add_ratings(self._row, new_rating, 1)
         except ValueError:
             print(f"Error: New rating '{new_rating}' is not a valid number for book '{self.title}'.")
 
+    def add_ratings(self, rating_sum, count):
+        """批量添加 count 个评分 (总和为 rating_sum)，用于从文件批量加载评分"""
+        self._catalog.add_ratings(self._row, rating_sum, count)
+
+    def __eq__(self, other):
+        if not isinstance(other, Book):
+            return NotImplemented
+        return self._catalog is other._catalog and self._row == other._row
+
+    def __hash__(self):
+        return hash((id(self._catalog), self._row))
+
     def __str__(self):
         return f"{self.title} by {self.author} (评分: {self.rating:.1f}/5.0, {self.ratings_count}人评价)"
\ No newline at end of file
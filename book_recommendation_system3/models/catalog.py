@@ -0,0 +1,326 @@
+import threading
+from collections.abc import Mapping
+import numpy as np
+from scipy.sparse import csr_matrix
+
+
+class StringTable:
+    """字符串驻留表：相同的字符串只保存一份，其余地方用整数编码引用"""
+
+    def __init__(self):
+        self.values = []
+        self.codes = {}
+
+    def intern(self, value):
+        """返回字符串的编码，第一次出现时分配新编码"""
+        code = self.codes.get(value)
+        if code is None:
+            code = len(self.values)
+            self.codes[value] = code
+            self.values.append(value)
+        return code
+
+    def code_of(self, value):
+        """返回字符串的编码，不存在时返回 -1"""
+        return self.codes.get(value, -1)
+
+    def __getitem__(self, code):
+        return self.values[code]
+
+    def __len__(self):
+        return len(self.values)
+
+
+def _grown(array, capacity):
+    """返回容量扩大到 capacity 的数组副本，多出的部分填0"""
+    grown = np.zeros(capacity, dtype=array.dtype)
+    grown[:len(array)] = array
+    return grown
+
+
+class Catalog:
+    """列式图书目录
+
+    每本书是一行：评分总和、评分数、平均分、作者编码、类别编码保存在 NumPy 数组中，
+    作者和类别通过 StringTable 驻留，书号、书名和简介保存在列表中。
+    Book 对象只是 (目录, 行号) 的视图，不再各自持有 __dict__。
+    """
+
+    def __init__(self, capacity=1024):
+        self.size = 0
+        self.book_ids = []
+        self.titles = []
+        self.descriptions = []
+        self.authors = StringTable()
+        self.categories = StringTable()
+        self.author_codes = np.zeros(capacity, dtype=np.int32)
+        self.category_codes = np.zeros(capacity, dtype=np.int32)
+        self.rating_sums = np.zeros(capacity, dtype=np.float64)
+        self.ratings_counts = np.zeros(capacity, dtype=np.int64)
+        self.ratings = np.zeros(capacity, dtype=np.float64) # 平均分，保留两位小数
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self.size
+
+    def _ensure_capacity(self, size):
+        """容量不足时按倍数扩容所有数值列"""
+        capacity = len(self.ratings)
+        if size <= capacity:
+            return
+        while capacity < size:
+            capacity *= 2
+        self.author_codes = _grown(self.author_codes, capacity)
+        self.category_codes = _grown(self.category_codes, capacity)
+        self.rating_sums = _grown(self.rating_sums, capacity)
+        self.ratings_counts = _grown(self.ratings_counts, capacity)
+        self.ratings = _grown(self.ratings, capacity)
+
+    def add_book(self, book_id, title, author, category, description, rating=0.0, ratings_count=0):
+        """追加一本书，返回它的行号"""
+        ratings_count = int(ratings_count)
+        rating_sum = float(rating) * ratings_count
+        with self._lock:
+            row = self.size
+            self._ensure_capacity(row + 1)
+            self.book_ids.append(str(book_id))
+            self.titles.append(title)
+            self.descriptions.append(description)
+            self.author_codes[row] = self.authors.intern(author)
+            self.category_codes[row] = self.categories.intern(category)
+            self.rating_sums[row] = rating_sum
+            self.ratings_counts[row] = ratings_count
+            self.ratings[row] = round(rating_sum / ratings_count, 2) if ratings_count > 0 else 0.0
+            self.size = row + 1
+        return row
+
+    def add_ratings(self, row, rating_sum, count):
+        """为一行追加 count 个评分 (总和为 rating_sum)"""
+        if count <= 0:
+            return
+        with self._lock:
+            self.rating_sums[row] += float(rating_sum)
+            self.ratings_counts[row] += int(count)
+            self.ratings[row] = round(self.rating_sums[row] / self.ratings_counts[row], 2)
+
+    def add_ratings_bulk(self, rows, rating_sums, counts):
+        """为多行同时追加评分，rows 中可以有重复"""
+        rows = np.asarray(rows, dtype=np.int64)
+        if not len(rows):
+            return
+        with self._lock:
+            np.add.at(self.rating_sums, rows, np.asarray(rating_sums, dtype=np.float64))
+            np.add.at(self.ratings_counts, rows, np.asarray(counts, dtype=np.int64))
+            touched = np.unique(rows)
+            rated = touched[self.ratings_counts[touched] > 0]
+            self.ratings[rated] = np.round(self.rating_sums[rated] / self.ratings_counts[rated], 2)
+
+    def category_names(self):
+        """返回目录中至少有一本书的类别名，按名称排序"""
+        codes = np.unique(self.category_codes[:self.size])
+        return sorted(self.categories[code] for code in codes.tolist())
+
+    def book(self, row):
+        """返回第 row 行的 Book 视图"""
+        from .book import Book
+        return Book.view(self, row)
+
+    def books(self):
+        """按行号顺序返回所有书的视图"""
+        from .book import Book
+        view = Book.view
+        return [view(self, row) for row in range(self.size)]
+
+
+class RatingStore:
+    """列式评分存储
+
+    已冻结的评分按用户行保存为 CSR (indptr, indices, data)，indices 是书号在 book_ids 中的编码。
+    新评分先写入尾部的 COO 缓冲 (按用户分组的字典，原地修改)，累计 freeze_threshold 条后与 CSR 合并成新的 CSR。
+    (CSR, 尾部) 作为一个快照整体替换；单点读取无需加锁，遍历某个用户的尾部时在锁内复制这一行。
+    批量导入用 set_ratings 直接与 CSR 合并，不经过尾部缓冲。
+    """
+
+    def __init__(self, freeze_threshold=100000):
+        self.book_ids = StringTable()
+        self.freeze_threshold = freeze_threshold
+        self.n_users = 0
+        self._tail_size = 0
+        self._lock = threading.Lock()
+        self._state = (np.zeros(1, dtype=np.int64), np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.float64), {})
+
+    def add_user(self):
+        """分配一个新的用户行号"""
+        with self._lock:
+            row = self.n_users
+            self.n_users += 1
+        return row
+
+    def set_rating(self, row, book_id, rating):
+        """写入 (覆盖) 用户对某本书的评分"""
+        with self._lock:
+            code = self.book_ids.intern(str(book_id))
+            tail = self._state[3]
+            tail_row = tail.get(row)
+            if tail_row is None:
+                tail_row = tail[row] = {}
+            if code not in tail_row:
+                self._tail_size += 1
+            tail_row[code] = float(rating)
+            if self._tail_size >= self.freeze_threshold:
+                self._freeze_locked()
+
+    def set_ratings(self, rows, book_ids, ratings):
+        """批量写入 (覆盖) 评分：rows、book_ids、ratings 一一对应，同一 (用户, 书) 以后出现的为准"""
+        with self._lock:
+            codes = np.fromiter(map(self.book_ids.intern, map(str, book_ids)), dtype=np.int64, count=len(book_ids))
+            self._freeze_locked(np.asarray(rows, dtype=np.int64), codes, np.asarray(ratings, dtype=np.float64))
+
+    def _tail_row(self, state, row):
+        """复制某个用户的尾部缓冲 (写入者会原地修改它)"""
+        tail_row = state[3].get(row)
+        if not tail_row:
+            return {}
+        with self._lock:
+            return dict(tail_row)
+
+    def _frozen_row(self, state, row):
+        """返回某个用户在已冻结 CSR 中的 (书编码, 评分) 切片"""
+        indptr, indices, data, _ = state
+        if row + 1 >= len(indptr):
+            return indices[:0], data[:0]
+        start, end = indptr[row], indptr[row + 1]
+        return indices[start:end], data[start:end]
+
+    def get_rating(self, row, book_id, default=None):
+        """读取用户对某本书的评分"""
+        code = self.book_ids.code_of(str(book_id))
+        if code < 0:
+            return default
+        state = self._state
+        tail_row = state[3].get(row)
+        if tail_row and code in tail_row:
+            return tail_row[code]
+        codes, ratings = self._frozen_row(state, row)
+        pos = np.searchsorted(codes, code)
+        if pos < len(codes) and codes[pos] == code:
+            return float(ratings[pos])
+        return default
+
+    def row_items(self, row):
+        """返回用户所有评分的 (书号, 评分) 列表"""
+        state = self._state
+        tail_row = self._tail_row(state, row)
+        codes, ratings = self._frozen_row(state, row)
+        values = self.book_ids.values
+        items = [(values[code], rating) for code, rating in zip(codes.tolist(), ratings.tolist()) if code not in tail_row]
+        items.extend((values[code], rating) for code, rating in tail_row.items())
+        return items
+
+    def row_size(self, row):
+        """返回用户的评分数量"""
+        state = self._state
+        tail_row = self._tail_row(state, row)
+        codes, _ = self._frozen_row(state, row)
+        if not tail_row:
+            return len(codes)
+        return len(tail_row) + sum(1 for code in codes.tolist() if code not in tail_row)
+
+    def freeze(self):
+        """把尾部缓冲合并进 CSR"""
+        with self._lock:
+            self._freeze_locked()
+
+    def _freeze_locked(self, extra_rows=None, extra_codes=None, extra_data=None):
+        """把尾部缓冲和额外的 COO 评分 (优先级最高) 合并进 CSR"""
+        indptr, indices, data, tail = self._state
+        if extra_rows is None:
+            extra_rows, extra_codes, extra_data = np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0)
+        if not tail and not len(extra_rows) and len(indptr) == self.n_users + 1:
+            return
+        old_rows = np.repeat(np.arange(len(indptr) - 1, dtype=np.int64), np.diff(indptr))
+        tail_rows = np.fromiter((row for row, tail_row in tail.items() for _ in tail_row), dtype=np.int64, count=self._tail_size)
+        tail_codes = np.fromiter((code for tail_row in tail.values() for code in tail_row), dtype=np.int64, count=self._tail_size)
+        tail_data = np.fromiter((rating for tail_row in tail.values() for rating in tail_row.values()), dtype=np.float64, count=self._tail_size)
+        rows = np.concatenate([old_rows, tail_rows, extra_rows])
+        codes = np.concatenate([indices.astype(np.int64), tail_codes, extra_codes])
+        ratings = np.concatenate([data, tail_data, extra_data])
+        # 同一 (用户, 书) 以后写入的评分为准
+        keys = rows * max(len(self.book_ids), 1) + codes
+        _, last_from_end = np.unique(keys[::-1], return_index=True)
+        keep = len(keys) - 1 - last_from_end # np.unique 结果按 key 排序，即按 (用户, 书编码) 排序
+        rows, codes, ratings = rows[keep], codes[keep], ratings[keep]
+        new_indptr = np.zeros(self.n_users + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=self.n_users), out=new_indptr[1:])
+        self._state = (new_indptr, codes.astype(np.int32), ratings, {})
+        self._tail_size = 0
+
+    def to_csr(self):
+        """冻结后返回 n_users × len(book_ids) 的 scipy CSR 评分矩阵，列为书号编码"""
+        self.freeze()
+        indptr, indices, data, _ = self._state
+        return csr_matrix((data, indices, indptr), shape=(self.n_users, len(self.book_ids)))
+
+
+class RatingsView(Mapping):
+    """User.ratings：{书号: 评分} 的只读映射视图，数据保存在 RatingStore 中"""
+
+    __slots__ = ("_store", "_row")
+
+    def __init__(self, store, row):
+        self._store = store
+        self._row = row
+
+    def __getitem__(self, book_id):
+        rating = self._store.get_rating(self._row, book_id)
+        if rating is None:
+            raise KeyError(book_id)
+        return rating
+
+    def get(self, book_id, default=None):
+        return self._store.get_rating(self._row, book_id, default)
+
+    def __contains__(self, book_id):
+        return self._store.get_rating(self._row, book_id) is not None
+
+    def __iter__(self):
+        return iter([book_id for book_id, _ in self._store.row_items(self._row)])
+
+    def __len__(self):
+        return self._store.row_size(self._row)
+
+    def items(self):
+        return self._store.row_items(self._row)
+
+    def __repr__(self):
+        return repr(dict(self.items()))
+
+
+_default_catalog = None
+_default_rating_store = None
+_default_lock = threading.Lock()
+
+
+def default_catalog():
+    """未显式指定目录的 Book 共用的全局目录"""
+    global _default_catalog
+    with _default_lock:
+        if _default_catalog is None:
+            _default_catalog = Catalog()
+        return _default_catalog
+
+
+def set_default_catalog(catalog):
+    """替换全局目录，例如换成从二进制目录文件加载的目录"""
+    global _default_catalog
+    with _default_lock:
+        _default_catalog = catalog
+
+
+def default_rating_store():
+    """未显式指定评分存储的 User 共用的全局评分存储"""
+    global _default_rating_store
+    with _default_lock:
+        if _default_rating_store is None:
+            _default_rating_store = RatingStore()
+        return _default_rating_store
@@ -0,0 +1,109 @@
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+from scipy.sparse import csr_matrix
+from sklearn.preprocessing import normalize
+from .nlp_utils import TextVectorizer, normalize_text
+from .ranking import top_n_indices
+
+SYSTEM_PROMPT = ("你是一个图书推荐系统中的AI助手。回答时优先推荐下面列出的本馆书籍，"
+                 "推荐书目外的书时请说明本馆没有收录。")
+DESCRIPTION_LIMIT = 80 # 注入提示词时每本书简介保留的字数
+
+
+def book_document(book):
+    """用于检索的书籍文本：标题、作者、类别和简介"""
+    return " ".join(part for part in (book.title, book.author, book.category, book.description) if part)
+
+
+class CatalogRetriever:
+    """基于 TF-IDF 的书目检索：把书籍文本和问题映射到同一个向量空间，按余弦相似度取前k本"""
+
+    def __init__(self, books):
+        self.books = list(books)
+        self.vectorizer = None
+        self.tfidf_matrix = None
+        documents = [book_document(book) for book in self.books]
+        if any(documents):
+            try:
+                self.vectorizer = TextVectorizer()
+                self.tfidf_matrix = normalize(csr_matrix(self.vectorizer.fit_transform(documents), dtype=np.float64),
+                                              norm='l2', axis=1)
+            except ValueError as e: # 预处理后词表为空
+                print(f"Warning: Could not build catalog retrieval index: {e}")
+                self.vectorizer = None
+
+    def search(self, query, k=5):
+        """返回与 query 最相关的 [(书, 相似度)]，相似度为0的书不返回"""
+        if self.vectorizer is None or not query.strip():
+            return []
+        query_vector = normalize(self.vectorizer.transform([query]), norm='l2', axis=1)
+        scores = np.asarray((self.tfidf_matrix @ query_vector.T).todense()).ravel()
+        return [(self.books[i], float(scores[i])) for i in top_n_indices(scores, k) if scores[i] > 0]
+
+
+class ResponseCache:
+    """AI回复的 LRU 缓存，每项在 ttl 秒后过期"""
+
+    def __init__(self, max_size=256, ttl=600.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict() # key -> (过期时间, 回复)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def normalize(prompt):
+        """忽略大小写、标点和中文之间空白的差别，使重复的问题命中同一项"""
+        return normalize_text(prompt)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, response):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, response)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def format_book_line(book):
+    description = book.description if book.description else ""
+    if len(description) > DESCRIPTION_LIMIT:
+        description = description[:DESCRIPTION_LIMIT] + "…"
+    return f"- 《{book.title}》 {book.author} | {book.category} | 评分 {book.rating:.1f} ({book.ratings_count}人) | {description}"
+
+
+def build_chat_messages(user_message, relevant_books=(), recommended_books=(), username=None):
+    """构造带书目上下文的对话消息：相关书籍和为当前用户推荐的书籍写入系统提示词"""
+    sections = [SYSTEM_PROMPT]
+    if relevant_books:
+        sections.append("与问题相关的本馆书籍：\n" + "\n".join(format_book_line(book) for book in relevant_books))
+    if recommended_books:
+        who = f"用户 {username} " if username else "当前用户"
+        sections.append(f"推荐系统为{who}推荐的书籍：\n" + "\n".join(format_book_line(book) for book in recommended_books))
+    return [
+        {"role": "system", "content": "\n\n".join(sections)},
+        {"role": "user", "content": user_message},
+    ]
@@ -1,88 +1,571 @@
+from collections import defaultdict
 import numpy as np
 from scipy.sparse import csr_matrix
-from sklearn.metrics.pairwise import cosine_similarity
-from collections import defaultdict
+from sklearn.preprocessing import normalize
+from .ranking import top_n_indices, top_unrated
+
+
+def top_k_cosine_neighbors(matrix, k, chunk_size=256):
+    """分块计算稀疏矩阵各行之间的余弦相似度，每行只保留最相似的前k行（不含自身）
+
+    返回 (neighbor_indices, neighbor_sims)，形状均为 (n_rows, k)，按相似度降序排列；
+    只保留相似度大于0的邻居，不足k个时用 -1 / 0 填充。
+    每次只在内存中保留 chunk_size × n_rows 的稠密块，而不是完整的 n_rows × n_rows 矩阵。
+    """
+    n_rows = matrix.shape[0]
+    neighbor_indices = np.full((n_rows, k), -1, dtype=np.int32)
+    neighbor_sims = np.zeros((n_rows, k), dtype=np.float32)
+    k = max(0, min(k, n_rows - 1)) # 行数不足时实际能找到的邻居数
+    if k == 0 or matrix.nnz == 0:
+        return neighbor_indices, neighbor_sims
+
+    normalized = normalize(csr_matrix(matrix, dtype=np.float32), norm='l2', axis=1)
+    normalized_t = normalized.T.tocsr()
+    for start in range(0, n_rows, chunk_size):
+        stop = min(start + chunk_size, n_rows)
+        sims = (normalized[start:stop] @ normalized_t).toarray()
+        local_rows = np.arange(stop - start)
+        sims[local_rows, local_rows + start] = -np.inf # 排除自身
+
+        top = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+        top_sims = np.take_along_axis(sims, top, axis=1)
+        # 相似度降序；相似度相同时与 np.argsort(...)[::-1] 一致，索引大的在前
+        order = np.lexsort((-top, -top_sims), axis=1)
+        top = np.take_along_axis(top, order, axis=1)
+        top_sims = np.take_along_axis(top_sims, order, axis=1)
+
+        valid = top_sims > 0 # 不相似或负相关的用户不会参与推荐，无需保存
+        neighbor_indices[start:stop, :k] = np.where(valid, top, -1)
+        neighbor_sims[start:stop, :k] = np.where(valid, top_sims, 0)
+    return neighbor_indices, neighbor_sims
+
+
+def _sort_neighbor_rows(neighbor_indices, neighbor_sims, rows):
+    """将邻居表中指定行重新按相似度降序排列，无效邻居 (-1) 排在最后"""
+    if len(rows) == 0:
+        return
+    indices = neighbor_indices[rows]
+    sims = np.where(indices >= 0, neighbor_sims[rows], -np.inf)
+    order = np.lexsort((-indices, -sims), axis=1)
+    indices = np.take_along_axis(indices, order, axis=1)
+    sims = np.take_along_axis(sims, order, axis=1)
+    valid = sims > 0
+    neighbor_indices[rows] = np.where(valid, indices, -1)
+    neighbor_sims[rows] = np.where(valid, sims, 0)
+
+
+def create_user_item_matrix(users, book_id_map, n_books):
+    """根据用户对象的评分创建 len(users) × n_books 的用户-物品评分矩阵 (稀疏矩阵)"""
+    rows, cols, data = [], [], []
+    for user_idx, user in enumerate(users):
+        for book_id, rating in user.ratings.items():
+            if book_id in book_id_map:
+                rows.append(user_idx)
+                cols.append(book_id_map[book_id])
+                data.append(rating)
+    # 处理完全没有评分数据的情况
+    if not data:
+        return csr_matrix((len(users), n_books), dtype=np.float32)
+    matrix = csr_matrix((data, (rows, cols)), shape=(len(users), n_books), dtype=np.float32)
+    matrix.eliminate_zeros() # 0分不算作评过分
+    matrix.sort_indices() # 增量更新时用二分查找定位元素
+    return matrix
+
 
 class UserBasedCollaborativeFiltering:
-    def __init__(self, users, books):
+    def __init__(self, users, books, n_neighbors=50, chunk_size=256, merge_threshold=1000):
         self.users = users
         self.books = books
-        self.user_id_map = {user.user_id: i for i, user in enumerate(users)}
-        self.book_id_map = {book.book_id: i for i, book in enumerate(books)}
-        self.n_users = len(users)
-        self.n_books = len(books)
+        self.n_neighbors = n_neighbors # 每个用户保留的最相似邻居数量
+        self.chunk_size = chunk_size # 分块计算相似度时每块的用户数
+        self.merge_threshold = merge_threshold # 增量评分累积到多少条时并入主评分矩阵
+        self.build_similarity_matrix()
+
+    def build_similarity_matrix(self):
+        """根据当前的用户和书籍对象全量重建评分矩阵和邻居表"""
+        self.user_id_map = {user.user_id: i for i, user in enumerate(self.users)}
+        self.book_id_map = {book.book_id: i for i, book in enumerate(self.books)}
+        self.n_users = len(self.users)
+        self.n_books = len(self.books)
         self.user_item_matrix = self._create_user_item_matrix()
-        self.user_similarity_matrix = self._calculate_user_similarity()
+        self._refresh_derived_matrices()
+        self.user_norms = self._calculate_user_norms()
+        self.neighbor_indices, self.neighbor_sims = self._calculate_user_similarity()
+        self._synced_users = self.n_users # users 列表中已纳入模型的对象数
+        self._reset_incremental_state()
+
+    def _reset_incremental_state(self):
+        # 新增的 (用户, 书籍) 评分按追加顺序记在这几个列表里，避免每次评分都重建CSR矩阵
+        self._pending_rows = []
+        self._pending_cols = []
+        self._pending_data = []
+        self._pending_positions = {} # (用户下标, 书籍下标) -> 在上面列表中的位置
+        self._pending_by_user = defaultdict(list) # 用户下标 -> 该用户增量评分的位置
+        self._pending_matrices = None
+        self._neighbor_rows = None # 反向索引：用户下标 -> 邻居表中列出该用户的行，首次增量更新时构建
 
     def _create_user_item_matrix(self):
         """创建用户-物品评分矩阵 (稀疏矩阵)"""
-        rows, cols, data = [], [], []
-        for user_idx, user in enumerate(self.users):
-            for book_id, rating in user.ratings.items():
-                if book_id in self.book_id_map:
-                    rows.append(user_idx)
-                    cols.append(self.book_id_map[book_id])
-                    data.append(rating)
-        # 处理完全没有评分数据的情况
-        if not data:
-            return csr_matrix((self.n_users, self.n_books), dtype=np.float32)
-        return csr_matrix((data, (rows, cols)), shape=(self.n_users, self.n_books), dtype=np.float32)
+        return create_user_item_matrix(self.users, self.book_id_map, self.n_books)
+
+    def get_state(self):
+        """导出可保存到磁盘的模型数据 (会先并入尚未合并的增量评分)"""
+        self._sync_users_and_books()
+        self._merge_pending_ratings()
+        return {
+            "user_ids": list(self.user_id_map.keys()),
+            "book_ids": [book.book_id for book in self.books],
+            "user_item_matrix": self.user_item_matrix,
+            "user_norms": self.user_norms,
+            "neighbor_indices": self.neighbor_indices,
+            "neighbor_sims": self.neighbor_sims,
+        }
+
+    @classmethod
+    def from_state(cls, users, books, state, n_neighbors=50, chunk_size=256, merge_threshold=1000):
+        """从保存的模型数据恢复，跳过训练；数据与当前的用户、书籍或参数不一致时返回 None"""
+        if (state["user_ids"] != [user.user_id for user in users]
+                or state["book_ids"] != [book.book_id for book in books]
+                or state["neighbor_indices"].shape[1] != n_neighbors):
+            return None
+        model = cls.__new__(cls)
+        model.users = users
+        model.books = books
+        model.n_neighbors = n_neighbors
+        model.chunk_size = chunk_size
+        model.merge_threshold = merge_threshold
+        model.user_id_map = {user.user_id: i for i, user in enumerate(users)}
+        model.book_id_map = {book.book_id: i for i, book in enumerate(books)}
+        model.n_users = len(users)
+        model.n_books = len(books)
+        model.user_item_matrix = state["user_item_matrix"]
+        model.user_item_matrix.sort_indices()
+        model._refresh_derived_matrices()
+        model.user_norms = state["user_norms"]
+        model.neighbor_indices = state["neighbor_indices"]
+        model.neighbor_sims = state["neighbor_sims"]
+        model._synced_users = model.n_users
+        model._reset_incremental_state()
+        return model
+
+    def _refresh_derived_matrices(self):
+        """根据评分矩阵重建指示矩阵和转置矩阵 (书籍 × 用户)"""
+        self.rated_indicator = self._create_rated_indicator()
+        self.item_user_matrix = self.user_item_matrix.T.tocsr()
+        self.item_user_matrix.sort_indices()
+
+    def _create_rated_indicator(self):
+        """创建与评分矩阵结构相同、值全为1的指示矩阵，用于累加相似度权重"""
+        indicator = self.user_item_matrix.copy()
+        indicator.data[:] = 1.0
+        return indicator
+
+    def _calculate_user_norms(self):
+        """每个用户评分向量的L2范数，增量更新相似度时使用"""
+        squared = self.user_item_matrix.multiply(self.user_item_matrix).sum(axis=1)
+        return np.sqrt(np.asarray(squared, dtype=np.float64).ravel())
 
     def _calculate_user_similarity(self):
-        """计算用户之间的相似度 (基于评分)"""
-        if self.user_item_matrix.nnz == 0: # 如果矩阵全为0
-             return np.identity(self.n_users) # 返回单位矩阵，表示用户只与自己相似
-        # 注意：cosine_similarity 期望稠密矩阵或特定类型的稀疏矩阵
-        # 如果用户数量很大，直接计算稠密矩阵可能会内存不足
-        # 可以考虑使用 pairwise_distances_chunked 或其他优化方法
-        return cosine_similarity(self.user_item_matrix)
+        """计算用户之间的相似度 (基于评分)，只保留每个用户的前 n_neighbors 个邻居"""
+        # 矩阵全为0时返回空的邻居表，表示用户只与自己相似
+        return top_k_cosine_neighbors(self.user_item_matrix, self.n_neighbors, self.chunk_size)
+
+    @property
+    def user_similarity_matrix(self):
+        """以稀疏矩阵形式返回截断后的用户相似度 (n_users × n_users，每行最多 n_neighbors 个非零值)"""
+        valid = self.neighbor_indices >= 0
+        rows = np.nonzero(valid)[0]
+        return csr_matrix((self.neighbor_sims[valid], (rows, self.neighbor_indices[valid])),
+                          shape=(self.n_users, self.n_users), dtype=np.float32)
+
+    def _sync_users_and_books(self):
+        """把构建模型之后才追加到 users / books 列表中的对象纳入模型 (只扩展矩阵形状，不重建)"""
+        new_users = [user for user in self.users[self._synced_users:] if user.user_id not in self.user_id_map]
+        self._synced_users = len(self.users)
+        self._extend(new_users)
+
+    def _extend(self, new_users):
+        """为新用户和 books 列表中新追加的书籍扩展矩阵形状
+
+        新用户只登记在模型自己的 user_id_map 中，不会写回共享的 users 列表。
+        """
+        new_books = self.books[self.n_books:]
+        if not new_users and not new_books:
+            return
+        for user in new_users:
+            self.user_id_map[user.user_id] = len(self.user_id_map)
+        for book in new_books:
+            self.book_id_map[book.book_id] = len(self.book_id_map)
+        self.n_users = len(self.user_id_map)
+        self.n_books = len(self.books)
+
+        shape = (self.n_users, self.n_books)
+        self.user_item_matrix.resize(shape)
+        self.rated_indicator.resize(shape)
+        self.item_user_matrix.resize((self.n_books, self.n_users))
+        if new_users:
+            n_new = len(new_users)
+            self.user_norms = np.concatenate([self.user_norms, np.zeros(n_new)])
+            self.neighbor_indices = np.vstack([self.neighbor_indices,
+                                               np.full((n_new, self.n_neighbors), -1, dtype=np.int32)])
+            self.neighbor_sims = np.vstack([self.neighbor_sims,
+                                            np.zeros((n_new, self.n_neighbors), dtype=np.float32)])
+        self._pending_matrices = None
+
+    @staticmethod
+    def _find_in_row(matrix, row, col):
+        """在已排序的CSR矩阵中二分查找 (row, col) 在 data 中的位置，不存在返回 -1"""
+        begin, end = matrix.indptr[row], matrix.indptr[row + 1]
+        pos = begin + np.searchsorted(matrix.indices[begin:end], col)
+        if pos < end and matrix.indices[pos] == col:
+            return pos
+        return -1
+
+    def _get_pending_matrices(self):
+        """返回尚未并入主矩阵的增量评分矩阵及其指示矩阵，没有增量时返回 (None, None)
+
+        只在预测时按需构建并缓存到下一条增量评分为止；增量更新相似度时直接使用列表，不构建矩阵。
+        """
+        if not self._pending_data:
+            return None, None
+        if self._pending_matrices is None:
+            pending = csr_matrix((self._pending_data, (self._pending_rows, self._pending_cols)),
+                                 shape=(self.n_users, self.n_books), dtype=np.float32)
+            indicator = pending.copy()
+            indicator.data[:] = 1.0
+            self._pending_matrices = (pending, indicator)
+        return self._pending_matrices
+
+    def _merge_pending_ratings(self):
+        """将增量评分一次性并入主评分矩阵"""
+        pending, _ = self._get_pending_matrices()
+        if pending is None:
+            return
+        self.user_item_matrix = (self.user_item_matrix + pending).tocsr()
+        self.user_item_matrix.sort_indices()
+        self._refresh_derived_matrices()
+        neighbor_rows = self._neighbor_rows
+        self._reset_incremental_state()
+        self._neighbor_rows = neighbor_rows # 合并评分不改变邻居表
+
+    def update_user_rating(self, user, book_id, rating):
+        """增量更新一条新增或修改的评分
+
+        只修改该用户在评分矩阵中的一个元素、该用户的范数以及与他有共同评分的用户之间的相似度，
+        不重建整个CSR矩阵和邻居表。
+        """
+        self._sync_users_and_books()
+        if user.user_id not in self.user_id_map:
+            self._extend([user])
+        book_idx = self.book_id_map.get(str(book_id))
+        if book_idx is None:
+            print(f"Warning: Book '{book_id}' is not known to the collaborative filtering model.")
+            return
+        rating = float(rating)
+        if rating <= 0:
+            return # 0分不算作评过分
+
+        user_idx = self.user_id_map[user.user_id]
+        pos = self._find_in_row(self.user_item_matrix, user_idx, book_idx)
+        if pos >= 0: # 已有的评分直接原地修改，矩阵结构不变
+            old_rating = float(self.user_item_matrix.data[pos])
+            self.user_item_matrix.data[pos] = rating
+            self.item_user_matrix.data[self._find_in_row(self.item_user_matrix, book_idx, user_idx)] = rating
+        else:
+            old_rating = self._add_pending_rating(user_idx, book_idx, rating)
+
+        squared_norm = self.user_norms[user_idx] ** 2 - old_rating ** 2 + rating ** 2
+        self.user_norms[user_idx] = np.sqrt(max(squared_norm, 0.0))
+        self._update_user_neighbors(user_idx)
+
+        if len(self._pending_data) >= self.merge_threshold:
+            self._merge_pending_ratings()
+
+    def _add_pending_rating(self, user_idx, book_idx, rating):
+        """追加或修改一条增量评分，返回原来的增量评分 (没有则为0)"""
+        self._pending_matrices = None
+        pos = self._pending_positions.get((user_idx, book_idx))
+        if pos is not None:
+            old_rating = self._pending_data[pos]
+            self._pending_data[pos] = rating
+            return old_rating
+        self._pending_positions[(user_idx, book_idx)] = len(self._pending_data)
+        self._pending_by_user[user_idx].append(len(self._pending_data))
+        self._pending_rows.append(user_idx)
+        self._pending_cols.append(book_idx)
+        self._pending_data.append(rating)
+        return 0.0
+
+    def _user_rating_items(self, user_idx):
+        """返回某用户评过分的书籍下标和评分 (包含尚未合并的增量评分)"""
+        begin, end = self.user_item_matrix.indptr[user_idx], self.user_item_matrix.indptr[user_idx + 1]
+        book_indices = list(self.user_item_matrix.indices[begin:end])
+        ratings = list(self.user_item_matrix.data[begin:end])
+        for pos in self._pending_by_user.get(user_idx, ()):
+            book_indices.append(self._pending_cols[pos])
+            ratings.append(self._pending_data[pos])
+        return np.asarray(book_indices, dtype=np.int64), np.asarray(ratings, dtype=np.float64)
+
+    def _get_neighbor_rows(self):
+        """反向索引：用户下标 -> 邻居表中包含该用户的行号集合"""
+        if self._neighbor_rows is None:
+            rows, cols = np.nonzero(self.neighbor_indices >= 0)
+            neighbors = self.neighbor_indices[rows, cols]
+            order = np.argsort(neighbors, kind="stable")
+            neighbors, rows = neighbors[order], rows[order]
+            bounds = np.flatnonzero(np.diff(neighbors)) + 1
+            self._neighbor_rows = defaultdict(set)
+            if len(neighbors):
+                starts = np.concatenate([[0], bounds])
+                for neighbor, group in zip(neighbors[starts].tolist(), np.split(rows, bounds)):
+                    self._neighbor_rows[neighbor] = set(group.tolist())
+        return self._neighbor_rows
+
+    def _update_user_neighbors(self, user_idx):
+        """重新计算某用户与其他用户的相似度，并更新双方的邻居表
+
+        只涉及与该用户评过同一本书的用户。其他用户的邻居表中如果因此腾出位置，
+        不会从全体用户中重新补齐，直到下一次 build_similarity_matrix 全量重建。
+        """
+        if self.n_neighbors == 0:
+            return
+        book_indices, ratings = self._user_rating_items(user_idx)
+
+        # 点积：通过转置矩阵只访问评过这些书的用户
+        dots = np.zeros(self.n_users, dtype=np.float64)
+        if len(book_indices):
+            base = self.item_user_matrix[book_indices]
+            dots += np.asarray(base.T @ ratings).ravel()
+            if self._pending_data:
+                row_vector = np.zeros(self.n_books, dtype=np.float64)
+                row_vector[book_indices] = ratings
+                pending_cols = np.asarray(self._pending_cols, dtype=np.int64)
+                pending_data = np.asarray(self._pending_data, dtype=np.float64)
+                np.add.at(dots, self._pending_rows, pending_data * row_vector[pending_cols])
+        denominator = self.user_norms * self.user_norms[user_idx]
+        sims = np.divide(dots, denominator, out=np.zeros_like(dots), where=denominator > 0)
+        sims[user_idx] = 0.0 # 排除自身
+
+        neighbor_rows = self._get_neighbor_rows()
+
+        # 目标用户自己的邻居表
+        top = [i for i in top_n_indices(sims, self.n_neighbors) if sims[i] > 0]
+        for neighbor in self.neighbor_indices[user_idx][self.neighbor_indices[user_idx] >= 0].tolist():
+            neighbor_rows[neighbor].discard(user_idx)
+        for neighbor in top:
+            neighbor_rows[int(neighbor)].add(user_idx)
+        self.neighbor_indices[user_idx] = -1
+        self.neighbor_sims[user_idx] = 0.0
+        self.neighbor_indices[user_idx, :len(top)] = top
+        self.neighbor_sims[user_idx, :len(top)] = sims[top]
+
+        # 其他用户邻居表中已有该用户的，更新相似度 (通过反向索引定位，不扫描整张邻居表)
+        rows_with_user = np.array(sorted(neighbor_rows[user_idx]), dtype=np.int64)
+        cols_with_user = np.argmax(self.neighbor_indices[rows_with_user] == user_idx, axis=1)
+        self.neighbor_sims[rows_with_user, cols_with_user] = sims[rows_with_user]
+        dropped = sims[rows_with_user] <= 0
+        self.neighbor_indices[rows_with_user[dropped], cols_with_user[dropped]] = -1
+        neighbor_rows[user_idx].difference_update(rows_with_user[dropped].tolist())
+
+        # 新的相似度超过其他用户邻居表中最小值的，替换掉最后一个邻居
+        contains = np.zeros(self.n_users, dtype=bool)
+        contains[rows_with_user] = True
+        last_sims = np.where(self.neighbor_indices[:, -1] >= 0, self.neighbor_sims[:, -1], 0.0)
+        insert_rows = np.nonzero((sims > last_sims) & ~contains)[0]
+        for row, replaced in zip(insert_rows.tolist(), self.neighbor_indices[insert_rows, -1].tolist()):
+            if replaced >= 0:
+                neighbor_rows[replaced].discard(row)
+        neighbor_rows[user_idx].update(insert_rows.tolist())
+        self.neighbor_indices[insert_rows, -1] = user_idx
+        self.neighbor_sims[insert_rows, -1] = sims[insert_rows]
+
+        _sort_neighbor_rows(self.neighbor_indices, self.neighbor_sims,
+                            np.union1d(rows_with_user, insert_rows))
+
+    def _neighbor_weight_matrix(self, user_indices, k_neighbors):
+        """构造 len(user_indices) × n_users 的稀疏权重矩阵，每行是该用户前k个正相似度邻居的相似度"""
+        neighbors = self.neighbor_indices[user_indices, :k_neighbors]
+        sims = self.neighbor_sims[user_indices, :k_neighbors]
+        valid = (neighbors >= 0) & (sims > 0) # 忽略不相似或负相关的用户
+        rows = np.nonzero(valid)[0]
+        return csr_matrix((sims[valid], (rows, neighbors[valid])),
+                          shape=(len(user_indices), self.n_users), dtype=np.float32)
+
+    def _predict_block(self, user_indices, k_neighbors):
+        """用稀疏矩阵乘法一次算出一组用户对所有书籍的预测评分
+
+        返回 len(user_indices) × n_books 的CSR矩阵：非零位置是至少有一个邻居评过分的书籍，
+        值为邻居评分按相似度加权的平均值 sum(sim * rating) / sum(sim)。
+        """
+        weights = self._neighbor_weight_matrix(user_indices, k_neighbors)
+        numerator = weights @ self.user_item_matrix
+        denominator = weights @ self.rated_indicator
+        pending_ratings, pending_indicator = self._get_pending_matrices()
+        if pending_ratings is not None:
+            numerator = numerator + weights @ pending_ratings
+            denominator = denominator + weights @ pending_indicator
+        numerator = numerator.tocsr()
+        denominator = denominator.tocsr()
+        # 权重与评分都为正数，分子与分母的稀疏结构完全相同，排序后可直接逐元素相除
+        numerator.sort_indices()
+        denominator.sort_indices()
+        numerator.data /= denominator.data
+        return numerator
+
+    def _warn_if_truncated(self, k_neighbors):
+        if k_neighbors > self.n_neighbors:
+            print(f"Warning: k_neighbors={k_neighbors} exceeds the neighbor index size {self.n_neighbors}, "
+                  f"using {self.n_neighbors} neighbors.")
 
     def recommend(self, target_user, n=5, k_neighbors=10):
         """为目标用户推荐书籍"""
+        return [book for book, _ in self.recommend_scored(target_user, n, k_neighbors)]
+
+    def recommend_scored(self, target_user, n=5, k_neighbors=10):
+        """为目标用户推荐书籍，返回 [(书, 预测评分)]，按分数从高到低"""
         if target_user.user_id not in self.user_id_map:
             return [] # 用户不存在
         
         target_user_idx = self.user_id_map[target_user.user_id]
         
-        if self.user_similarity_matrix is None or self.user_similarity_matrix.shape[0] == 0:
+        if self.neighbor_indices.shape[1] == 0:
             return [] # 无法计算相似度
-            
-        user_similarities = self.user_similarity_matrix[target_user_idx]
-        
-        # 找到最相似的k个邻居 (排除自己)
-        similar_users_indices = np.argsort(user_similarities)[::-1][1:k_neighbors+1]
-        
-        book_scores = defaultdict(float)
-        books_weighted_sum_similarity = defaultdict(float)
-
-        for neighbor_idx in similar_users_indices:
-            neighbor_similarity = user_similarities[neighbor_idx]
-            if neighbor_similarity <= 0: # 忽略不相似或负相关的用户
-                continue
-            
-            # 获取邻居评分过的书籍 (稠密矩阵访问)
-            # neighbor_ratings_sparse = self.user_item_matrix[neighbor_idx]
-            # neighbor_rated_books_indices = neighbor_ratings_sparse.indices
-            # neighbor_ratings_values = neighbor_ratings_sparse.data
-            
-            # 遍历所有书籍，看邻居是否评过分
-            for book_idx in range(self.n_books):
-                book_id_rev_map = {v: k for k, v in self.book_id_map.items()}
-                current_book_id = book_id_rev_map.get(book_idx)
-
-                # 目标用户未评分的书籍
-                if current_book_id and current_book_id not in target_user.ratings:
-                    neighbor_rating = self.user_item_matrix[neighbor_idx, book_idx]
-                    if neighbor_rating > 0: # 邻居对这本书有过评分
-                        book_scores[current_book_id] += neighbor_similarity * neighbor_rating
-                        books_weighted_sum_similarity[current_book_id] += neighbor_similarity
-        
-        predicted_scores = {}
-        for book_id, score_sum in book_scores.items():
-            if books_weighted_sum_similarity[book_id] > 0:
-                predicted_scores[self.books[self.book_id_map[book_id]]] = score_sum / books_weighted_sum_similarity[book_id]
-            else:
-                predicted_scores[self.books[self.book_id_map[book_id]]] = 0 # 避免除以零
-
-        sorted_recommendations = sorted(predicted_scores.items(), key=lambda item: item[1], reverse=True)
-        return [book for book, score in sorted_recommendations[:n]]
\ No newline at end of file
+
+        self._warn_if_truncated(k_neighbors)
+        predictions = self._predict_block([target_user_idx], k_neighbors)
+        return top_unrated(self.books, self.book_id_map, target_user, predictions.data, n, predictions.indices, scored=True)
+
+    def recommend_many(self, target_users, n=5, k_neighbors=10, block_size=256):
+        """批量为多个用户推荐书籍，返回与 target_users 顺序一一对应的推荐列表
+
+        每次取 block_size 个用户，用一次稀疏矩阵乘法算出整块用户的预测评分，
+        内存占用只与块大小有关。
+        """
+        results = [[] for _ in target_users]
+        if self.neighbor_indices.shape[1] == 0:
+            return results # 无法计算相似度
+
+        known = [(pos, self.user_id_map[user.user_id]) for pos, user in enumerate(target_users)
+                 if user.user_id in self.user_id_map] # 不存在的用户推荐为空
+        self._warn_if_truncated(k_neighbors)
+        for start in range(0, len(known), block_size):
+            block = known[start:start + block_size]
+            predictions = self._predict_block([user_idx for _, user_idx in block], k_neighbors)
+            for row, (pos, _) in enumerate(block):
+                begin, end = predictions.indptr[row], predictions.indptr[row + 1]
+                results[pos] = top_unrated(self.books, self.book_id_map, target_users[pos], predictions.data[begin:end], n,
+                                             predictions.indices[begin:end])
+        return results
+
+
+class ItemBasedCollaborativeFiltering:
+    """基于物品的协同过滤
+
+    书籍之间的相似度只依赖相对稳定的目录和全体评分，可以离线预计算为截断的 top-k 邻居表；
+    推荐时只需汇总目标用户评过分的书籍的邻居，单次请求的开销与用户历史长度成正比，与用户总数无关。
+    """
+    def __init__(self, users, books, n_neighbors=50, chunk_size=256):
+        self.users = users
+        self.books = books
+        self.n_neighbors = n_neighbors # 每本书保留的最相似书籍数量
+        self.chunk_size = chunk_size # 分块计算相似度时每块的书籍数
+        self.build_similarity_matrix()
+
+    def build_similarity_matrix(self):
+        """根据当前的评分重新计算书籍邻居表"""
+        self.book_id_map = {book.book_id: i for i, book in enumerate(self.books)}
+        self.n_books = len(self.books)
+        user_item_matrix = create_user_item_matrix(self.users, self.book_id_map, self.n_books)
+        self.neighbor_indices, self.neighbor_sims = top_k_cosine_neighbors(
+            user_item_matrix.T.tocsr(), self.n_neighbors, self.chunk_size)
+        self._create_item_similarity_matrix()
+
+    def _create_item_similarity_matrix(self):
+        """稀疏形式的邻居表：第j行是书籍j的邻居及相似度"""
+        valid = self.neighbor_indices >= 0
+        rows = np.nonzero(valid)[0]
+        self.item_similarity_matrix = csr_matrix((self.neighbor_sims[valid], (rows, self.neighbor_indices[valid])),
+                                                 shape=(self.n_books, self.n_books), dtype=np.float32)
+
+    def get_state(self):
+        """导出可保存到磁盘的模型数据"""
+        return {
+            "book_ids": [book.book_id for book in self.books[:self.n_books]],
+            "neighbor_indices": self.neighbor_indices,
+            "neighbor_sims": self.neighbor_sims,
+        }
+
+    @classmethod
+    def from_state(cls, users, books, state, n_neighbors=50, chunk_size=256):
+        """从保存的模型数据恢复，跳过训练；数据与当前书籍或参数不一致时返回 None"""
+        if (state["book_ids"] != [book.book_id for book in books]
+                or state["neighbor_indices"].shape[1] != n_neighbors):
+            return None
+        model = cls.__new__(cls)
+        model.users = users
+        model.books = books
+        model.n_neighbors = n_neighbors
+        model.chunk_size = chunk_size
+        model.book_id_map = {book.book_id: i for i, book in enumerate(books)}
+        model.n_books = len(books)
+        model.neighbor_indices = state["neighbor_indices"]
+        model.neighbor_sims = state["neighbor_sims"]
+        model._create_item_similarity_matrix()
+        return model
+
+    def update_user_rating(self, user, book_id, rating):
+        """记录一条新评分
+
+        用户历史在推荐时直接从 user.ratings 读取，新评分立即生效；
+        书籍邻居表是离线结果，等下一次 build_similarity_matrix 时再刷新。
+        """
+        if str(book_id) not in self.book_id_map:
+            print(f"Warning: Book '{book_id}' is not known to the item-based model.")
+
+    def _history_matrix(self, target_users):
+        """用户当前评分构成的 len(target_users) × n_books 稀疏矩阵"""
+        rows, cols, data = [], [], []
+        for row, user in enumerate(target_users):
+            for book_id, rating in user.ratings.items():
+                book_idx = self.book_id_map.get(book_id)
+                if book_idx is not None and rating > 0:
+                    rows.append(row)
+                    cols.append(book_idx)
+                    data.append(rating)
+        return csr_matrix((data, (rows, cols)), shape=(len(target_users), self.n_books), dtype=np.float32)
+
+    def _predict_block(self, target_users):
+        """按用户评过分的书籍汇总其邻居，预测评分为 sum(sim * rating) / sum(sim)"""
+        history = self._history_matrix(target_users)
+        indicator = history.copy()
+        indicator.data[:] = 1.0
+        numerator = (history @ self.item_similarity_matrix).tocsr()
+        denominator = (indicator @ self.item_similarity_matrix).tocsr()
+        # 相似度与评分都为正数，分子与分母的稀疏结构完全相同
+        numerator.sort_indices()
+        denominator.sort_indices()
+        numerator.data /= denominator.data
+        return numerator
+
+    def recommend(self, target_user, n=5):
+        """为目标用户推荐书籍"""
+        return [book for book, _ in self.recommend_scored(target_user, n)]
+
+    def recommend_scored(self, target_user, n=5):
+        """为目标用户推荐书籍，返回 [(书, 预测评分)]，按分数从高到低"""
+        if not target_user.ratings:
+            return [] # 没有评分历史
+        predictions = self._predict_block([target_user])
+        return top_unrated(self.books, self.book_id_map, target_user, predictions.data, n, predictions.indices, scored=True)
+
+    def recommend_many(self, target_users, n=5, block_size=256):
+        """批量为多个用户推荐书籍，返回与 target_users 顺序一一对应的推荐列表"""
+        results = []
+        for start in range(0, len(target_users), block_size):
+            block = target_users[start:start + block_size]
+            predictions = self._predict_block(block)
+            for row, user in enumerate(block):
+                begin, end = predictions.indptr[row], predictions.indptr[row + 1]
+                results.append(top_unrated(self.books, self.book_id_map, user, predictions.data[begin:end], n,
+                                               predictions.indices[begin:end]))
+        return results
\ No newline at end of file
@@ -1,36 +1,148 @@
+import numpy as np
+from scipy.sparse import csr_matrix, identity
+from sklearn.preprocessing import normalize
 from .nlp_utils import TextVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
+from .ranking import top_unrated
+from .collaborative_filtering import top_k_cosine_neighbors
+
+
+def _row_positions(matrix, rows):
+    """返回CSR矩阵中若干行的全部元素在 indices/data 中的位置 (按行依次拼接)，以及每行的元素个数"""
+    starts = matrix.indptr[rows]
+    lengths = matrix.indptr[np.asarray(rows) + 1] - starts
+    offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+    return offsets + np.arange(lengths.sum()), lengths
+
 
 class ContentBasedRecommender:
-    def __init__(self, books):
+    dense_profile_limit = 4000000 # 种子平均向量转为稠密计算时允许的最大元素数
+
+    def __init__(self, books, n_neighbors=None):
         self.books = books
         self.book_ids = [book.book_id for book in books]
         self.book_index_map = {book_id: i for i, book_id in enumerate(self.book_ids)}
-        self.similarity_matrix = self._calculate_similarity_matrix()
+        self.vectorizer = None
+        # 只保存L2归一化后的稀疏TF-IDF矩阵，两本书的余弦相似度就是对应行的点积
+        self.tfidf_matrix = self._calculate_tfidf_matrix()
+        # 可选：为每本书预先保存最相似的 n_neighbors 本书，推荐时只在这些邻居中打分
+        self.n_neighbors = n_neighbors
+        self.neighbor_matrix = self._calculate_neighbor_matrix() if n_neighbors else None
+        self.term_matrix = self._calculate_term_matrix()
 
-    def _calculate_similarity_matrix(self):
-        """计算书籍之间的内容相似度矩阵"""
+    def _calculate_tfidf_matrix(self):
+        """计算书籍内容的TF-IDF矩阵 (行已L2归一化)"""
         # 假设每本书籍对象有一个 'get_content_features_text' 方法，返回用于比较的文本
         # 例如，可以是 "标题 类别 简介 标签 作者"
         # 或者直接使用 book.description
         documents = [book.description if book.description else "" for book in self.books] 
+        num_books = len(documents)
         
-        if not any(documents): # 如果所有描述都为空
-            # 返回一个单位矩阵或零矩阵，表示没有内容相似性信息
-            num_books = len(self.books)
-            return [[(1.0 if i == j else 0.0) for j in range(num_books)] for i in range(num_books)]
-            
-        vectorizer = TextVectorizer()
-        tfidf_matrix = vectorizer.fit_transform(documents)
-        if tfidf_matrix is None or tfidf_matrix.shape[0] == 0:
-            num_books = len(self.books)
-            return [[(1.0 if i == j else 0.0) for j in range(num_books)] for i in range(num_books)]
-        
-        return cosine_similarity(tfidf_matrix) # 使用sklearn的余弦相似度
+        if any(documents):
+            try:
+                self.vectorizer = TextVectorizer()
+                tfidf_matrix = self.vectorizer.fit_transform(documents)
+                if tfidf_matrix is not None and tfidf_matrix.shape[0] == num_books:
+                    return normalize(csr_matrix(tfidf_matrix, dtype=np.float64), norm='l2', axis=1)
+            except ValueError as e: # 预处理后词表为空
+                print(f"Warning: Could not build TF-IDF features: {e}")
+            self.vectorizer = None
 
-    def recommend(self, user, n=5):
-        """为用户推荐内容相似的书籍"""
-        # 找到用户评分高或喜欢的书籍作为种子
+        # 没有可用的内容信息时用单位矩阵 (稀疏存储)，表示每本书只与自己相似
+        return identity(num_books, dtype=np.float64, format='csr')
+
+    def _calculate_neighbor_matrix(self):
+        """预计算每本书的 top-k 相似书籍，返回稀疏相似度矩阵 (包含自身，与完整余弦相似度的对角线一致)"""
+        neighbor_indices, neighbor_sims = top_k_cosine_neighbors(self.tfidf_matrix, self.n_neighbors)
+        num_books = self.tfidf_matrix.shape[0]
+        valid = neighbor_indices >= 0
+        rows = np.nonzero(valid)[0]
+        neighbors = csr_matrix((neighbor_sims[valid], (rows, neighbor_indices[valid])),
+                               shape=(num_books, num_books), dtype=np.float32)
+        has_content = np.asarray(self.tfidf_matrix.getnnz(axis=1) > 0, dtype=np.float32)
+        return (neighbors + csr_matrix((has_content, (np.arange(num_books), np.arange(num_books))),
+                                       shape=(num_books, num_books))).tocsr()
+
+    def _calculate_term_matrix(self):
+        """TF-IDF矩阵的转置 (词项 × 书籍)，单个用户推荐时按种子的词项只访问含这些词的书籍"""
+        if self.neighbor_matrix is not None:
+            return None
+        return self.tfidf_matrix.T.tocsr()
+
+    def get_state(self):
+        """导出可保存到磁盘的模型数据：TF-IDF矩阵、可选的邻居矩阵以及词表和IDF"""
+        state = {"book_ids": self.book_ids, "tfidf_matrix": self.tfidf_matrix, "vocabulary": None}
+        if self.neighbor_matrix is not None:
+            state["neighbor_matrix"] = self.neighbor_matrix
+        if self.vectorizer is not None:
+            vocabulary, idf = self.vectorizer.get_vocabulary()
+            state["vocabulary"] = vocabulary
+            state["idf"] = idf
+        return state
+
+    @classmethod
+    def from_state(cls, books, state, n_neighbors=None):
+        """从保存的模型数据恢复，跳过向量化；数据与当前书籍或参数不一致时返回 None"""
+        if state["book_ids"] != [book.book_id for book in books] or ("neighbor_matrix" in state) != bool(n_neighbors):
+            return None
+        model = cls.__new__(cls)
+        model.books = books
+        model.book_ids = [book.book_id for book in books]
+        model.book_index_map = {book_id: i for i, book_id in enumerate(model.book_ids)}
+        model.tfidf_matrix = state["tfidf_matrix"]
+        model.n_neighbors = n_neighbors
+        model.neighbor_matrix = state.get("neighbor_matrix")
+        model.term_matrix = model._calculate_term_matrix()
+        model.vectorizer = None
+        if state["vocabulary"] is not None:
+            model.vectorizer = TextVectorizer()
+            model.vectorizer.set_vocabulary(state["vocabulary"], state["idf"])
+        return model
+
+    def _seed_weight_matrix(self, seed_lists):
+        """每个种子列表一行、种子位置为 1/种子数 的稀疏矩阵，左乘相似度即得到平均相似度
+
+        列数取训练时的书籍数 (TF-IDF 矩阵的行数)；之后通过 add_book 追加的书籍不在模型中，
+        既不会作为种子，也不会被推荐，直到重新训练。
+        """
+        rows, cols, weights = [], [], []
+        for row, seeds in enumerate(seed_lists):
+            rows.extend([row] * len(seeds))
+            cols.extend(seeds)
+            weights.extend([1.0 / len(seeds)] * len(seeds))
+        return csr_matrix((weights, (rows, cols)), shape=(len(seed_lists), self.tfidf_matrix.shape[0]), dtype=np.float64)
+
+    def _average_similarities(self, seed_lists):
+        """计算每组种子与全部书籍的平均余弦相似度，返回 len(seed_lists) × n_books 的稠密数组
+
+        平均相似度 = 种子向量的平均值与各书籍向量的点积，只需两次稀疏乘法，无需完整的相似度矩阵。
+        """
+        seed_weights = self._seed_weight_matrix(seed_lists)
+        if self.neighbor_matrix is not None:
+            return (seed_weights @ self.neighbor_matrix).toarray()
+        seed_profiles = seed_weights @ self.tfidf_matrix
+        if seed_profiles.shape[0] * seed_profiles.shape[1] <= self.dense_profile_limit:
+            # 种子平均向量较小时转为稠密，稀疏矩阵×稠密矩阵比稀疏×稀疏快得多
+            return np.asarray(self.tfidf_matrix @ seed_profiles.T.toarray()).T
+        return (self.tfidf_matrix @ seed_profiles.T).T.toarray()
+
+    def _single_average_similarities(self, seeds):
+        """单组种子与全部书籍的平均余弦相似度 (与 _average_similarities 的一行相同)
+
+        种子平均向量只有少数词项非零，沿转置矩阵收集含这些词的书籍并用 bincount 累加，
+        开销与这些词项的出现次数成正比，不必与全部书籍的TF-IDF向量逐一做点积。
+        """
+        if self.term_matrix is None:
+            return self._average_similarities([seeds])[0]
+        positions, _ = _row_positions(self.tfidf_matrix, seeds)
+        terms = self.tfidf_matrix.indices[positions]
+        weights = self.tfidf_matrix.data[positions] / len(seeds)
+        positions, lengths = _row_positions(self.term_matrix, terms)
+        return np.bincount(self.term_matrix.indices[positions],
+                           weights=np.repeat(weights, lengths) * self.term_matrix.data[positions],
+                           minlength=self.tfidf_matrix.shape[0])
+
+    def _seed_indices(self, user):
+        """找到用户评分高或喜欢的书籍作为种子，返回它们在相似度矩阵中的下标"""
         # 这里简化为使用用户的偏好类别下的书籍，或者用户评分过的书籍
         seed_books_indices = []
         for book_id, rating in user.ratings.items():
@@ -45,21 +157,40 @@ class ContentBasedRecommender:
                     seed_books_indices.append(self.book_index_map[book.book_id])
                     if len(seed_books_indices) > 5: # 取少量种子即可
                         break
-        
+        return seed_books_indices
+
+    def recommend(self, user, n=5):
+        """为用户推荐内容相似的书籍"""
+        return [book for book, _ in self.recommend_scored(user, n)]
+
+    def recommend_scored(self, user, n=5):
+        """为用户推荐内容相似的书籍，返回 [(书, 与种子书籍的平均相似度)]，按分数从高到低"""
+        seed_books_indices = self._seed_indices(user)
         if not seed_books_indices:
             return [] # 没有种子书籍，无法进行内容推荐
 
-        # 计算候选书籍的平均相似度
-        candidate_scores = {}
-        for i in range(len(self.books)):
-            if self.books[i].book_id not in user.ratings: # 未评分的书籍
-                avg_sim = 0
-                for seed_idx in seed_books_indices:
-                    avg_sim += self.similarity_matrix[seed_idx][i]
-                if seed_books_indices: # 避免除以零
-                    avg_sim /= len(seed_books_indices)
-                candidate_scores[self.books[i]] = avg_sim
-        
-        # 按相似度排序并返回top N
-        sorted_candidates = sorted(candidate_scores.items(), key=lambda item: item[1], reverse=True)
-        return [book for book, score in sorted_candidates[:n]]
\ No newline at end of file
+        scores = self._single_average_similarities(seed_books_indices)
+        return top_unrated(self.books, self.book_index_map, user, scores, n, scored=True)
+
+    def recommend_many(self, users, n=5, block_size=256):
+        """批量为多个用户推荐内容相似的书籍，返回与 users 顺序一一对应的推荐列表
+
+        每块用户的种子构成一个 block_size × n_books 的稀疏平均权重矩阵，
+        经两次稀疏乘法即得到整块用户对所有书籍的平均相似度。
+        """
+        results = [[] for _ in users]
+        seeded = []
+        for pos, user in enumerate(users):
+            seeds = self._seed_indices(user)
+            if seeds: # 没有种子书籍的用户无法进行内容推荐
+                seeded.append((pos, seeds))
+        if not seeded:
+            return results
+
+        for start in range(0, len(seeded), block_size):
+            block = seeded[start:start + block_size]
+            block_scores = self._average_similarities([seeds for _, seeds in block])
+
+            for row, (pos, _) in enumerate(block):
+                results[pos] = top_unrated(self.books, self.book_index_map, users[pos], block_scores[row], n)
+        return results
\ No newline at end of file
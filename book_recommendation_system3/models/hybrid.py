@@ -0,0 +1,119 @@
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+
+class Strategy:
+    """混合推荐中的一个策略
+
+    func(user, n) 返回按分数从高到低排列的 (书, 分数) 可迭代对象，可以是生成器；
+    weight 是融合时的权重，timeout 是从请求开始算起的截止时间 (秒)。
+    """
+
+    def __init__(self, name, func, weight=1.0, timeout=0.2):
+        self.name = name
+        self.func = func
+        self.weight = weight
+        self.timeout = timeout
+
+
+class HybridRecommender:
+    """并行混合推荐执行器
+
+    所有策略同时提交到线程池，每个策略只等到自己的截止时间；
+    超时的策略使用截止时已经产出的部分候选 (生成器式的策略能给出部分结果)，
+    之后它的结果会被丢弃。各策略的分数先在自身候选内做 min-max 归一化，再按权重加和排序。
+    返回列表的策略超时后无法中断，仍占着一个线程；每个策略最多只有一个这样卡住的任务，
+    它结束之前该策略在后续请求中直接按超时处理，不再提交新任务，线程池因此不会被耗尽。
+    """
+
+    def __init__(self, strategies, max_workers=None):
+        self.strategies = [strategy for strategy in strategies if strategy.weight > 0]
+        # 超时的策略可能仍占着线程，多留一倍的线程给后续请求
+        self._executor = ThreadPoolExecutor(max_workers=max_workers if max_workers else 2 * max(len(self.strategies), 1),
+                                            thread_name_prefix="hybrid")
+        self._lock = threading.Lock()
+        self._stuck = {} # 策略名 -> 超时后仍在运行的任务
+        self.timeouts = defaultdict(int) # 每个策略超时的次数
+        self.failures = defaultdict(int) # 每个策略抛出异常的次数
+
+    @staticmethod
+    def _collect(strategy, user, n, buffer, cancel):
+        """在工作线程中消费策略的结果，边产出边写入 buffer，请求结束后停止"""
+        for item in strategy.func(user, n):
+            if cancel.is_set():
+                return
+            buffer.append(item)
+            if len(buffer) >= n:
+                return
+
+    def run(self, user, n):
+        """并行执行所有策略，返回 ({策略名: [(书, 分数)]}, 超时的策略名列表, 抛出异常的策略名列表)"""
+        start = time.monotonic()
+        cancel = threading.Event()
+        jobs = []
+        timed_out = []
+        failed = []
+        for strategy in self.strategies:
+            with self._lock:
+                stuck = self._stuck.get(strategy.name)
+                if stuck is not None and stuck.done():
+                    del self._stuck[strategy.name]
+                elif stuck is not None: # 上次超时的任务还没结束，本次直接按超时处理
+                    self.timeouts[strategy.name] += 1
+                    timed_out.append(strategy.name)
+                    continue
+            buffer = []
+            future = self._executor.submit(self._collect, strategy, user, n, buffer, cancel)
+            jobs.append((strategy, buffer, future))
+
+        results = {}
+        for strategy, buffer, future in sorted(jobs, key=lambda job: job[0].timeout):
+            try:
+                future.result(timeout=max(start + strategy.timeout - time.monotonic(), 0))
+            except TimeoutError:
+                with self._lock:
+                    self.timeouts[strategy.name] += 1
+                    self._stuck[strategy.name] = future
+                timed_out.append(strategy.name)
+            except Exception as e:
+                with self._lock:
+                    self.failures[strategy.name] += 1
+                failed.append(strategy.name)
+                print(f"Hybrid strategy '{strategy.name}' failed: {e}")
+            results[strategy.name] = list(buffer) # 截止时的快照
+        cancel.set()
+        return results, timed_out, failed
+
+    def fuse(self, results, exclude, n):
+        """按权重融合各策略的归一化分数，跳过 exclude 中的书号，返回分数最高的n个 (书, 融合分数)"""
+        fused = defaultdict(float)
+        books = {}
+        for strategy in self.strategies:
+            candidates = [(book, score) for book, score in results.get(strategy.name, ()) if book.book_id not in exclude]
+            if not candidates:
+                continue
+            low = min(score for _, score in candidates)
+            span = max(score for _, score in candidates) - low
+            for book, score in candidates:
+                fused[book.book_id] += strategy.weight * ((score - low) / span if span > 0 else 1.0)
+                books.setdefault(book.book_id, book)
+        # 排序是稳定的，分数相同时先出现的 (高优先级策略的) 候选在前
+        ranked = sorted(fused, key=lambda book_id: -fused[book_id])
+        return [(books[book_id], fused[book_id]) for book_id in ranked[:n]]
+
+    def recommend(self, user, n=10, candidates_per_strategy=None):
+        """并行执行并融合，返回 ([(书, 融合分数)], 超时的策略名列表, 抛出异常的策略名列表)
+
+        两个列表有任何一个非空时结果是降级的。
+        """
+        results, timed_out, failed = self.run(user, candidates_per_strategy if candidates_per_strategy else n * 2)
+        return self.fuse(results, user.ratings, n), timed_out, failed
+
+    def stats(self):
+        with self._lock:
+            return {"timeouts": dict(self.timeouts), "failures": dict(self.failures)}
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
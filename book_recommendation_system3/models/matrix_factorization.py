@@ -0,0 +1,142 @@
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from .collaborative_filtering import create_user_item_matrix
+from .ranking import top_unrated
+
+class ALSRecommender:
+    """基于交替最小二乘 (ALS) 矩阵分解的推荐器
+
+    把稀疏的用户-物品评分矩阵分解为用户因子矩阵和书籍因子矩阵 (均为float32)，
+    评分越稀疏，这种低秩表示通常比基于邻居的方法更稳健。
+    推荐时只需一次稠密的矩阵-向量乘法加 top-n 选择。
+    """
+    def __init__(self, users, books, factors=32, regularization=0.1, iterations=10, n_threads=None, random_state=0):
+        self.users = users
+        self.books = books
+        self.factors = factors # 隐因子数量
+        self.regularization = regularization # 正则化系数 (按每行评分数加权)
+        self.iterations = iterations # 交替迭代次数
+        self.n_threads = n_threads # 求解时使用的线程数，None或1表示不使用线程池
+        self.random_state = random_state
+        self.fit()
+
+    def fit(self):
+        """在当前评分上训练用户因子和书籍因子"""
+        self.user_id_map = {user.user_id: i for i, user in enumerate(self.users)}
+        self.book_id_map = {book.book_id: i for i, book in enumerate(self.books)}
+        self.n_users = len(self.users)
+        self.n_books = len(self.books)
+        user_item_matrix = create_user_item_matrix(self.users, self.book_id_map, self.n_books)
+        item_user_matrix = user_item_matrix.T.tocsr()
+
+        rng = np.random.default_rng(self.random_state)
+        self.user_factors = rng.normal(scale=0.1, size=(self.n_users, self.factors)).astype(np.float32)
+        self.item_factors = rng.normal(scale=0.1, size=(self.n_books, self.factors)).astype(np.float32)
+        if user_item_matrix.nnz == 0:
+            return
+
+        executor = ThreadPoolExecutor(max_workers=self.n_threads) if self.n_threads and self.n_threads > 1 else None
+        try:
+            for _ in range(self.iterations):
+                # 固定书籍因子求解用户因子，再固定用户因子求解书籍因子
+                self._solve_all(user_item_matrix, self.item_factors, self.user_factors, executor)
+                self._solve_all(item_user_matrix, self.user_factors, self.item_factors, executor)
+        finally:
+            if executor:
+                executor.shutdown()
+
+    def get_state(self):
+        """导出可保存到磁盘的模型数据"""
+        return {
+            "user_ids": list(self.user_id_map.keys()),
+            "book_ids": [book.book_id for book in self.books[:self.n_books]],
+            "user_factors": self.user_factors,
+            "item_factors": self.item_factors,
+        }
+
+    @classmethod
+    def from_state(cls, users, books, state, factors=32, regularization=0.1, iterations=10, n_threads=None, random_state=0):
+        """从保存的模型数据恢复，跳过训练；数据与当前的用户、书籍或参数不一致时返回 None"""
+        if (state["user_ids"] != [user.user_id for user in users]
+                or state["book_ids"] != [book.book_id for book in books]
+                or state["item_factors"].shape[1] != factors):
+            return None
+        model = cls.__new__(cls)
+        model.users = users
+        model.books = books
+        model.factors = factors
+        model.regularization = regularization
+        model.iterations = iterations
+        model.n_threads = n_threads
+        model.random_state = random_state
+        model.user_id_map = {user.user_id: i for i, user in enumerate(users)}
+        model.book_id_map = {book.book_id: i for i, book in enumerate(books)}
+        model.n_users = len(users)
+        model.n_books = len(books)
+        model.user_factors = state["user_factors"]
+        model.item_factors = state["item_factors"]
+        return model
+
+    def build_similarity_matrix(self):
+        """与其他协同过滤模型保持相同的接口：在全部评分上重新训练"""
+        self.fit()
+
+    def _solve_rows(self, matrix, fixed_factors, target_factors, rows):
+        """对每一行求解正则化最小二乘：(Y^T Y + λ·n_r·I) x = Y^T r"""
+        identity = np.eye(self.factors)
+        for row in rows:
+            begin, end = matrix.indptr[row], matrix.indptr[row + 1]
+            if begin == end:
+                target_factors[row] = 0.0 # 没有评分的行无法估计，预测分为0
+                continue
+            fixed = fixed_factors[matrix.indices[begin:end]].astype(np.float64)
+            ratings = matrix.data[begin:end].astype(np.float64)
+            a = fixed.T @ fixed + self.regularization * (end - begin) * identity
+            target_factors[row] = np.linalg.solve(a, fixed.T @ ratings)
+
+    def _solve_all(self, matrix, fixed_factors, target_factors, executor=None, chunk_size=512):
+        """求解所有行；提供线程池时按块并行 (NumPy 的线性代数运算会释放GIL)"""
+        n_rows = matrix.shape[0]
+        if executor is None:
+            self._solve_rows(matrix, fixed_factors, target_factors, range(n_rows))
+            return
+        futures = [executor.submit(self._solve_rows, matrix, fixed_factors, target_factors,
+                                   range(start, min(start + chunk_size, n_rows)))
+                   for start in range(0, n_rows, chunk_size)]
+        for future in futures:
+            future.result()
+
+    def update_user_rating(self, user, book_id, rating):
+        """新增或修改评分后，固定书籍因子只重新求解该用户的因子 (fold-in)"""
+        if user.user_id not in self.user_id_map:
+            self.user_id_map[user.user_id] = self.n_users
+            self.n_users += 1
+            self.user_factors = np.vstack([self.user_factors, np.zeros((1, self.factors), dtype=np.float32)])
+        if str(book_id) not in self.book_id_map:
+            print(f"Warning: Book '{book_id}' is not known to the ALS model.")
+        user_idx = self.user_id_map[user.user_id]
+        history = create_user_item_matrix([user], self.book_id_map, self.n_books)
+        self._solve_rows(history, self.item_factors, self.user_factors[user_idx:user_idx + 1], [0])
+
+    def recommend(self, target_user, n=5):
+        """为目标用户推荐书籍"""
+        return [book for book, _ in self.recommend_scored(target_user, n)]
+
+    def recommend_scored(self, target_user, n=5):
+        """为目标用户推荐书籍，返回 [(书, 预测偏好分)]，按分数从高到低"""
+        if target_user.user_id not in self.user_id_map or not target_user.ratings:
+            return [] # 用户不存在或没有评分
+        scores = self.item_factors @ self.user_factors[self.user_id_map[target_user.user_id]]
+        return top_unrated(self.books, self.book_id_map, target_user, scores, n, scored=True)
+
+    def recommend_many(self, target_users, n=5, block_size=256):
+        """批量为多个用户推荐书籍，返回与 target_users 顺序一一对应的推荐列表"""
+        results = [[] for _ in target_users]
+        known = [(pos, self.user_id_map[user.user_id]) for pos, user in enumerate(target_users)
+                 if user.user_id in self.user_id_map and user.ratings]
+        for start in range(0, len(known), block_size):
+            block = known[start:start + block_size]
+            block_scores = self.user_factors[[user_idx for _, user_idx in block]] @ self.item_factors.T
+            for row, (pos, _) in enumerate(block):
+                results[pos] = top_unrated(self.books, self.book_id_map, target_users[pos], block_scores[row], n)
+        return results
@@ -0,0 +1,88 @@
+import hashlib
+import json
+import os
+import shutil
+import numpy as np
+from scipy.sparse import issparse, load_npz, save_npz
+
+# 模型数据格式变化时修改此版本号，旧缓存会自动失效
+CACHE_VERSION = "2"
+
+def data_fingerprint(books, users=(), extra=""):
+    """对实际载入的书籍、用户和评分求SHA-256指纹
+
+    指纹只取决于内存中的数据，与数据来自文本文件、SQLite 还是 bulk_load 的参数无关。
+    """
+    digest = hashlib.sha256(f"{CACHE_VERSION}|{extra}".encode("utf-8"))
+    for book in books:
+        fields = (book.book_id, book.title, book.author, book.category, book.description or "")
+        digest.update("\x1f".join(fields).encode("utf-8") + b"\x1e")
+    for user in users:
+        ratings = "\x1f".join(f"{book_id}={rating!r}" for book_id, rating in sorted(user.ratings.items()))
+        digest.update(f"{user.user_id}|{ratings}\x1e".encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+class ModelCache:
+    """按数据指纹在磁盘上保存和加载训练好的模型
+
+    每个模型的状态是一个字典：NumPy数组保存为 .npy (加载时内存映射)，
+    scipy稀疏矩阵保存为 .npz，其余可JSON序列化的值 (如id列表、词表) 保存在 meta.json 中。
+    目录结构为 cache_dir/<模型名>/<指纹>/...，每个模型各有指纹 (如内容模型只取决于书籍)，
+    数据一变，指纹随之变化，旧缓存不再命中。
+    """
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+
+    def load(self, name, fingerprint):
+        """加载与指纹匹配的模型状态，没有缓存或缓存损坏时返回 None"""
+        model_dir = os.path.join(self.cache_dir, name, fingerprint)
+        meta_path = os.path.join(model_dir, "meta.json")
+        if not os.path.exists(meta_path):
+            return None
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            state = meta["values"]
+            for key in meta["arrays"]:
+                # 写时复制的内存映射：加载几乎不花时间，增量更新也不会改动缓存文件
+                state[key] = np.load(os.path.join(model_dir, f"{key}.npy"), mmap_mode="c")
+            for key in meta["sparse"]:
+                state[key] = load_npz(os.path.join(model_dir, f"{key}.npz")).tocsr()
+            return state
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Warning: Ignoring unreadable model cache '{model_dir}': {e}")
+            return None
+
+    def save(self, name, fingerprint, state):
+        """按指纹保存模型状态；先写入临时目录再重命名，避免留下写了一半的缓存"""
+        model_dir = os.path.join(self.cache_dir, name, fingerprint)
+        tmp_dir = f"{model_dir}.tmp-{os.getpid()}"
+        try:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            os.makedirs(tmp_dir)
+            meta = {"arrays": [], "sparse": [], "values": {}}
+            for key, value in state.items():
+                if issparse(value):
+                    save_npz(os.path.join(tmp_dir, f"{key}.npz"), value.tocsr(), compressed=False)
+                    meta["sparse"].append(key)
+                elif isinstance(value, np.ndarray):
+                    np.save(os.path.join(tmp_dir, f"{key}.npy"), value)
+                    meta["arrays"].append(key)
+                else:
+                    meta["values"][key] = value
+            with open(os.path.join(tmp_dir, "meta.json"), "w", encoding="utf-8") as f:
+                json.dump(meta, f, ensure_ascii=False)
+            shutil.rmtree(model_dir, ignore_errors=True)
+            os.replace(tmp_dir, model_dir)
+            self._prune(name, fingerprint)
+        except (OSError, TypeError, ValueError) as e:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            print(f"Warning: Could not save model cache '{model_dir}': {e}")
+
+    def _prune(self, name, fingerprint):
+        """删除该模型其他指纹 (即旧数据) 的缓存目录"""
+        model_root = os.path.join(self.cache_dir, name)
+        for entry in os.listdir(model_root):
+            is_fingerprint = len(entry) == len(fingerprint) and all(c in "0123456789abcdef" for c in entry)
+            if is_fingerprint and entry != fingerprint:
+                shutil.rmtree(os.path.join(model_root, entry), ignore_errors=True)
\ No newline at end of file
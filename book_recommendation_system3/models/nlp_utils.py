@@ -1,35 +1,145 @@
-import nltk
-from sklearn.feature_extraction.text import TfidfVectorizer
+import multiprocessing
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache
+import numpy as np
+from sklearn.feature_extraction.text import TfidfVectorizer, ENGLISH_STOP_WORDS
 from sklearn.metrics.pairwise import cosine_similarity
-# nltk.download('punkt') # 首次运行时可能需要下载
+# nltk 改为按需导入：use_nltk=False 时完全不需要安装或导入 nltk
+# 使用 nltk 时首次运行可能需要下载：
+# nltk.download('punkt')
 # nltk.download('stopwords')
 
-def preprocess_text(text):
-    """文本预处理：分词、去除停用词、词干提取等"""
+# 中日韩统一表意文字、扩展A区和兼容表意文字
+_CJK_CHARS = '\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff'
+_CJK_RUN_PATTERN = re.compile(f'[{_CJK_CHARS}]+')
+_WORD_PATTERN = re.compile(f'[^\\W_{_CJK_CHARS}]+') # 非中文的字母数字词
+_RUN_PATTERN = re.compile(f'(?P<cjk>[{_CJK_CHARS}]+)|[^\\W_{_CJK_CHARS}]+')
+
+@lru_cache(maxsize=None)
+def get_stopwords(use_nltk=False):
+    """返回英文停用词集合 (frozenset，整个进程只加载一次)"""
+    if use_nltk:
+        import nltk
+        return frozenset(nltk.corpus.stopwords.words('english'))
+    return frozenset(ENGLISH_STOP_WORDS)
+
+def cjk_ngrams(run, n=2):
+    """把一段连续的中文切成字符n-gram (默认二元组)，不足n个字时整段作为一个词"""
+    if len(run) <= n:
+        return [run]
+    return [run[i:i + n] for i in range(len(run) - n + 1)]
+
+def _tokenize_non_cjk(segment, use_nltk):
+    if use_nltk:
+        import nltk
+        return [word for word in nltk.word_tokenize(segment) if word.isalnum()]
+    return _WORD_PATTERN.findall(segment)
+
+def text_runs(text):
+    """把文本切成连续的中文段和其余的字母数字词 (丢弃标点和空白)，按出现顺序返回 [(是否中文, 片段)]"""
+    return [(match.lastgroup == 'cjk', match.group()) for match in _RUN_PATTERN.finditer(text)]
+
+def normalize_text(text):
+    """忽略大小写、标点和空白的差别：词之间只保留一个空格，与中文相邻的空白全部去掉"""
+    parts = []
+    previous_cjk = True
+    for is_cjk, run in text_runs(text.lower()):
+        if parts and not (is_cjk or previous_cjk):
+            parts.append(' ')
+        parts.append(run)
+        previous_cjk = is_cjk
+    return ''.join(parts)
+
+def tokenize(text, use_nltk=False):
+    """分词：中文按字符二元组切分，其余文字按单词切分 (可选用 nltk.word_tokenize)"""
+    if not use_nltk: # 与 text_runs 相同的切分，直接遍历匹配以免构造中间列表
+        tokens = []
+        for match in _RUN_PATTERN.finditer(text):
+            if match.lastgroup:
+                tokens.extend(cjk_ngrams(match.group()))
+            else:
+                tokens.append(match.group())
+        return tokens
+    tokens = []
+    position = 0
+    for match in _CJK_RUN_PATTERN.finditer(text):
+        if match.start() > position:
+            tokens.extend(_tokenize_non_cjk(text[position:match.start()], use_nltk))
+        tokens.extend(cjk_ngrams(match.group()))
+        position = match.end()
+    if position < len(text):
+        tokens.extend(_tokenize_non_cjk(text[position:], use_nltk))
+    return tokens
+
+def preprocess_text(text, use_nltk=False):
+    """文本预处理：分词、去除停用词等"""
     if not text: # 处理空文本的情况
         return ""
-    tokens = nltk.word_tokenize(text.lower())
-    stopwords = nltk.corpus.stopwords.words('english') # 或其他语言
+    stopwords = get_stopwords(use_nltk)
     # 可以进一步进行词干提取或词形还原
-    processed_tokens = [word for word in tokens if word.isalnum() and word not in stopwords]
+    processed_tokens = [word for word in tokenize(text.lower(), use_nltk) if word not in stopwords]
     return " ".join(processed_tokens)
 
+def _preprocess_batch(documents, use_nltk):
+    """在子进程中处理一批文档 (需要是模块级函数才能被进程池序列化)"""
+    return [preprocess_text(doc, use_nltk) for doc in documents]
+
 class TextVectorizer:
-    def __init__(self):
-        self.vectorizer = TfidfVectorizer()
+    def __init__(self, use_nltk=False, n_jobs=None, batch_size=2000, parallel_threshold=20000):
+        # 预处理结果已经是空格分隔的词，按空白切分即可保留单字词
+        self.vectorizer = TfidfVectorizer(token_pattern=r"(?u)\S+")
         self.tfidf_matrix = None
+        self.use_nltk = use_nltk # 是否使用 nltk 的分词器和停用词表
+        self.n_jobs = n_jobs # 预处理使用的进程数，负数表示全部CPU，None或1 (默认) 表示在当前进程处理
+        self.batch_size = batch_size # 每个子进程任务处理的文档数
+        self.parallel_threshold = parallel_threshold # 文档数达到该值才启用进程池
+
+    def preprocess(self, documents):
+        """预处理一组文档；设置了 n_jobs 且文档数达到 parallel_threshold 时分批交给进程池并行处理
+
+        进程池使用 spawn 方式启动子进程：调用方 (如GUI的后台训练) 通常已经有其他线程在运行，
+        fork 会把其他线程持有的锁原样复制到子进程中，可能导致子进程死锁。
+        """
+        documents = list(documents)
+        max_workers = self.n_jobs or 1
+        if max_workers < 0: # 负数表示使用全部CPU
+            max_workers = os.cpu_count() or 1
+        if max_workers == 1 or len(documents) < self.parallel_threshold:
+            return _preprocess_batch(documents, self.use_nltk)
+
+        batches = [documents[i:i + self.batch_size] for i in range(0, len(documents), self.batch_size)]
+        try:
+            with ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+                results = executor.map(_preprocess_batch, batches, [self.use_nltk] * len(batches))
+                return [doc for batch in results for doc in batch]
+        except (OSError, BrokenProcessPool) as e: # 无法创建子进程时退回到当前进程
+            print(f"Warning: parallel preprocessing failed, falling back to a single process: {e}")
+            return _preprocess_batch(documents, self.use_nltk)
 
     def fit_transform(self, documents):
         """对文档集合进行TF-IDF向量化"""
-        processed_docs = [preprocess_text(doc) for doc in documents]
+        processed_docs = self.preprocess(documents)
         self.tfidf_matrix = self.vectorizer.fit_transform(processed_docs)
         return self.tfidf_matrix
 
     def transform(self, documents):
         """对新文档进行TF-IDF转换 (使用已fit的vectorizer)"""
-        processed_docs = [preprocess_text(doc) for doc in documents]
+        processed_docs = self.preprocess(documents)
         return self.vectorizer.transform(processed_docs)
 
+    def get_vocabulary(self):
+        """返回已fit的词表 (词 -> 列号) 和IDF数组，用于保存到磁盘"""
+        vocabulary = {term: int(index) for term, index in self.vectorizer.vocabulary_.items()}
+        return vocabulary, self.vectorizer.idf_
+
+    def set_vocabulary(self, vocabulary, idf):
+        """从保存的词表和IDF恢复，之后可直接调用 transform 而无需重新fit"""
+        self.vectorizer.vocabulary_ = vocabulary
+        self.vectorizer.idf_ = np.asarray(idf)
+
     def get_similarity_matrix(self):
         """计算TF-IDF矩阵的余弦相似度矩阵"""
         if self.tfidf_matrix is not None:
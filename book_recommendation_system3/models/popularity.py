@@ -0,0 +1,75 @@
+import bisect
+import heapq
+import threading
+from itertools import islice
+
+
+class PopularityIndex:
+    """按 (评分, 评分数) 从高到低排列的全局和分类有序索引
+
+    每本书对应一个条目 (-评分, -评分数, 加入顺序, 书)，保存在用 bisect 维护的有序列表中，
+    评分变化时只移动这一本书的条目；取前N本只需切片，不再对整个书目排序。
+    加入顺序保证了并列时的先后与按 (评分, 评分数) 稳定倒序排序的结果一致。
+    """
+
+    def __init__(self, books=()):
+        self._lock = threading.Lock()
+        self.rebuild(books)
+
+    @staticmethod
+    def _entry(book, seq):
+        return (-book.rating, -book.ratings_count, seq, book)
+
+    def rebuild(self, books):
+        """用 books 重建全部索引"""
+        entries = sorted(self._entry(book, seq) for seq, book in enumerate(books))
+        by_category = {}
+        for entry in entries: # entries 已有序，按顺序追加后每个分类的列表也是有序的
+            by_category.setdefault(entry[3].category, []).append(entry)
+        with self._lock:
+            self._entries = entries
+            self._by_category = by_category
+            self._entry_of = {entry[3]: entry for entry in entries}
+            self._next_seq = len(entries)
+
+    def add(self, book):
+        """加入一本新书"""
+        with self._lock:
+            if book in self._entry_of:
+                return
+            entry = self._entry(book, self._next_seq)
+            self._next_seq += 1
+            self._entry_of[book] = entry
+            bisect.insort(self._entries, entry)
+            bisect.insort(self._by_category.setdefault(book.category, []), entry)
+
+    def update(self, book):
+        """书的评分或评分数变化后调用，把它移动到新的位置"""
+        with self._lock:
+            old = self._entry_of.get(book)
+            if old is None:
+                entry = self._entry(book, self._next_seq)
+                self._next_seq += 1
+            else:
+                entry = self._entry(book, old[2])
+                if entry[:2] == old[:2]:
+                    return
+                for entries in (self._entries, self._by_category[book.category]):
+                    del entries[bisect.bisect_left(entries, old)]
+            self._entry_of[book] = entry
+            bisect.insort(self._entries, entry)
+            bisect.insort(self._by_category.setdefault(book.category, []), entry)
+
+    def top(self, n):
+        """评分最高的n本书"""
+        with self._lock:
+            return [entry[3] for entry in self._entries[:n]]
+
+    def top_in_categories(self, categories, n):
+        """若干分类合在一起评分最高的n本书"""
+        with self._lock:
+            slices = [self._by_category.get(category, [])[:n] for category in dict.fromkeys(categories)]
+        return [entry[3] for entry in islice(heapq.merge(*slices), n)]
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,44 @@
+import numpy as np
+
+def top_n_indices(scores, n):
+    """返回 scores 中分数最高的 n 个元素的下标 (按分数降序)
+
+    先用 argpartition 在 O(len(scores)) 内选出前n个，再只对这n个排序，
+    避免对全部候选做完整排序。分数相同时下标小的在前，与稳定排序的结果一致。
+    """
+    scores = np.asarray(scores)
+    if n <= 0 or scores.size == 0:
+        return np.empty(0, dtype=np.intp)
+    if n < scores.size:
+        kth_score = scores[np.argpartition(-scores, n - 1)[n - 1]] # 第n大的分数
+        above = np.flatnonzero(scores > kth_score)
+        ties = np.flatnonzero(scores == kth_score)[:n - above.size]
+        candidates = np.concatenate([above, ties])
+    else:
+        candidates = np.arange(scores.size)
+    order = np.lexsort((candidates, -scores[candidates]))
+    return candidates[order]
+
+
+def top_unrated(books, index_map, user, scores, n, candidate_indices=None, scored=False):
+    """屏蔽用户已评分的书籍后，取分数最高的n本；scored 为 True 时返回 [(书, 分数)]
+
+    index_map 是书号到 books 下标的映射。candidate_indices 为 None 时 scores 是 index_map 中全部书籍的稠密分数
+    (已评分的书会被原地置为 -inf)；否则 scores[i] 是书 candidate_indices[i] 的分数 (稀疏预测)。
+    books 可以比模型训练时更长，之后追加的书籍不会被返回。
+    """
+    rated_indices = [index_map[book_id] for book_id in user.ratings if book_id in index_map]
+    if candidate_indices is None:
+        scores[rated_indices] = -np.inf
+        top = top_n_indices(scores, min(n, scores.size - len(set(rated_indices))))
+        rows = top
+    else:
+        if rated_indices:
+            unrated = ~np.isin(candidate_indices, rated_indices)
+            candidate_indices = candidate_indices[unrated]
+            scores = scores[unrated]
+        top = top_n_indices(scores, n)
+        rows = candidate_indices[top]
+    if scored:
+        return [(books[row], float(scores[i])) for row, i in zip(rows.tolist(), top.tolist())]
+    return [books[row] for row in rows.tolist()]
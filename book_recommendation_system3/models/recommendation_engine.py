@@ -1,55 +1,200 @@
 import random
-from collections import defaultdict
-from .collaborative_filtering import UserBasedCollaborativeFiltering 
+import threading
+from collections import OrderedDict, defaultdict
+from itertools import islice
+import numpy as np
+from .collaborative_filtering import UserBasedCollaborativeFiltering, ItemBasedCollaborativeFiltering
+from .matrix_factorization import ALSRecommender
 from .content_based import ContentBasedRecommender 
+from .hybrid import HybridRecommender, Strategy
+from .popularity import PopularityIndex
+from .chat_context import CatalogRetriever, ResponseCache, build_chat_messages
+from .search import SearchIndex
+from .user_directory import UserDirectory
+from .model_cache import ModelCache, data_fingerprint
+from data.rating_log import RatingLog
 from .user import User  
 from .book import Book  
 import os # <--- 确保 os 也被导入，因为 load_ratings_from_file 中用到了
 
+# 可选的协同过滤实现："user" 基于用户邻居，"item" 基于预计算的书籍邻居，"als" 矩阵分解
+CF_METHODS = {
+    "user": UserBasedCollaborativeFiltering,
+    "item": ItemBasedCollaborativeFiltering,
+    "als": ALSRecommender,
+}
+
+# 并行混合推荐中各策略的默认融合权重和截止时间 (秒)
+HYBRID_WEIGHTS = {"cf": 1.0, "content": 0.8, "category": 0.5, "top_rated": 0.3}
+HYBRID_TIMEOUTS = {"cf": 0.2, "content": 0.2, "category": 0.1, "top_rated": 0.1}
+
+# 项目根目录，data/ 与 models/ 都在其下
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
 class RecommendationEngine:
-    def __init__(self, books=None, users=None):
-        self.books = books if books else []
-        self.users = users if users else []
-        self.user_by_username = {} # 方便通过用户名查找用户
+    def __init__(self, books=None, users=None, cf_method="user", cf_options=None, cache_dir=None, result_cache_size=1024,
+                 parallel_hybrid=True, hybrid_weights=None, hybrid_timeouts=None, user_directory=None):
+        if cf_method not in CF_METHODS:
+            raise ValueError(f"Unknown cf_method '{cf_method}', expected one of {sorted(CF_METHODS)}")
+        self.cf_method = cf_method
+        self.cf_options = cf_options if cf_options else {} # 传给协同过滤模型构造函数的参数，如ALS的factors
+        self.cache_dir = cache_dir # 模型缓存目录，None表示每次都重新训练
+        self.books = []
+        self.users = []
+        # 用户名/用户号索引和注册、登录都由用户目录负责；加载用户时目录按 self.users 重建索引
+        self.user_directory = user_directory if user_directory is not None else UserDirectory()
+        self.user_directory.load(self.users)
         self.book_by_id = {}
+        self.book_by_title = {} # 同名的书只记第一本
         self.books_by_category = defaultdict(list)
+        self.popularity = PopularityIndex() # 按 (评分, 评分数) 有序的全局和分类索引
+        # 书目变化时递增；AI对话的检索索引按需重建，回复缓存的键也包含它
+        self.catalog_version = 0
+        self._retriever = None
+        self._retriever_version = None
+        self._retriever_lock = threading.Lock()
+        # 全文检索的倒排索引，第一次搜索或调用 build_search_index 时构建，之后随 add_book 增量更新
+        self.search_index = None
+        self._search_lock = threading.Lock()
+        self.cf_recommender = None
+        self.content_recommender = None
+        self.is_ready = False # 模型是否已经基于完整数据构建完成
+        # 推荐结果的 LRU 缓存：(user_id, n, model_version) -> 推荐列表
+        self.result_cache_size = result_cache_size
+        self.model_version = 0 # 模型或书目整体变化时递增，旧的缓存项随之失效
+        self._rating_versions = defaultdict(int) # 用户号 -> 该用户的评分次数，AI回复缓存的键包含它
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self._result_cache = OrderedDict()
+        self._cached_keys_by_user = defaultdict(set)
+        self._cache_lock = threading.Lock()
+        # 模型替换和增量更新互斥；后台训练期间的新评分记在 _training_journal 中
+        self._model_lock = threading.RLock()
+        self._training_journal = None
+        # 并行混合推荐：各策略同时执行，按权重融合分数；为 False 时按优先级依次回退
+        self.hybrid = None
+        if parallel_hybrid:
+            weights = dict(HYBRID_WEIGHTS, **(hybrid_weights if hybrid_weights else {}))
+            timeouts = dict(HYBRID_TIMEOUTS, **(hybrid_timeouts if hybrid_timeouts else {}))
+            self.hybrid = HybridRecommender([
+                Strategy("cf", self._cf_scored, weights["cf"], timeouts["cf"]),
+                Strategy("content", self._content_scored, weights["content"], timeouts["content"]),
+                Strategy("category", self._category_scored, weights["category"], timeouts["category"]),
+                Strategy("top_rated", self._top_rated_scored, weights["top_rated"], timeouts["top_rated"]),
+            ])
 
-        if books:
-            self._index_books()
-        if users: # 索引用户
-            self._index_users()
-
-        # 初始化新的推荐器
         if books and users:
-            self.cf_recommender = UserBasedCollaborativeFiltering(users, books)
-            self.content_recommender = ContentBasedRecommender(books)
-            self.load_ratings_from_file() # 加载历史评分
+            self.bulk_load(books, users)
         else:
-            self.cf_recommender = None
-            self.content_recommender = None
+            if books:
+                self.books = books
+                self._index_books()
+            if users: # 索引用户
+                self.users = users
+                self._index_users()
+
+    def bulk_load(self, books, users, ratings=None, build_models=True):
+        """批量导入书籍、用户和历史评分，索引和模型都只在最后构建一次
+
+        books 和 users 按引用保存，调用方之后追加的对象会被模型同步。
+        ratings 为 (用户名, 书名, 评分) 记录的可迭代对象 (会被分块消费)，为 None 时从评分日志文件加载。
+        build_models 为 False 时只建立索引，模型稍后由 BackgroundTrainer 在后台构建。
+        """
+        self.is_ready = False
+        self.books = books
+        self.users = users
+        self.cf_recommender = None
+        self.content_recommender = None
+        self._index_books()
+        self._index_users()
+        if ratings is None:
+            self.load_ratings_from_file() # 先加载历史评分，模型只需构建一次
+        else:
+            records = iter(ratings)
+            self._apply_rating_records(iter(lambda: list(islice(records, 100000)), []))
+        if not (self.books and self.users):
+            print("Not enough data to build recommendation models.")
+        elif build_models:
+            self._build_models()
+            self.is_ready = True
+        self.invalidate_recommendations()
+        return self.is_ready
+
+    def _create_cf_recommender(self):
+        """按 cf_method 创建协同过滤推荐器"""
+        return CF_METHODS[self.cf_method](self.users, self.books, **self.cf_options)
+
+    def _build_models(self):
+        """构建协同过滤和内容推荐模型；设置了 cache_dir 时优先从与数据指纹匹配的缓存加载"""
+        cache = ModelCache(self.cache_dir) if self.cache_dir else None
+        self.cf_recommender = self._load_or_train_cf(cache)
+        self.content_recommender = self._load_or_train_content(cache)
+
+    def _load_or_train_cf(self, cache):
+        fingerprint = None
+        if cache: # 协同过滤模型取决于书籍、用户、评分和模型参数
+            fingerprint = data_fingerprint(self.books, self.users, f"{self.cf_method}|{sorted(self.cf_options.items())}")
+        return self._load_or_train(cache, "cf", fingerprint, self._create_cf_recommender,
+                                   lambda state: CF_METHODS[self.cf_method].from_state(self.users, self.books, state, **self.cf_options))
+
+    def _load_or_train_content(self, cache):
+        fingerprint = data_fingerprint(self.books) if cache else None # 内容模型只取决于书籍
+        return self._load_or_train(cache, "content", fingerprint, lambda: ContentBasedRecommender(self.books),
+                                   lambda state: ContentBasedRecommender.from_state(self.books, state))
+
+    def _load_or_train(self, cache, name, fingerprint, train, restore):
+        """指纹命中缓存时恢复模型，否则训练并保存
+
+        指纹在训练前计算；训练期间有新评分时模型可能已经包含它们，与指纹不符，这时不保存。
+        """
+        state = cache.load(name, fingerprint) if cache else None
+        model = restore(state) if state else None
+        if model is not None:
+            return model
+        model = train()
+        with self._model_lock:
+            unchanged = not self._training_journal
+        if cache and unchanged:
+            cache.save(name, fingerprint, model.get_state())
+        return model
 
     def _index_books(self):
         """为图书建立索引，便于快速查找"""
         self.book_by_id = {book.book_id: book for book in self.books}
+        self.book_by_title = {}
         self.books_by_category = defaultdict(list)
         for book in self.books:
+            self.book_by_title.setdefault(book.title, book)
             self.books_by_category[book.category].append(book)
+        self.popularity.rebuild(self.books)
+        self.catalog_version += 1
+        with self._search_lock:
+            self.search_index = None # 书目整体替换，旧索引的文档号已失效
     
     def _index_users(self): # 新增方法
         """为用户建立索引，便于快速查找"""
-        self.user_by_username = {user.username: user for user in self.users}
+        self.user_directory.load(self.users)
+
+    @property
+    def user_by_username(self):
+        """用户名 -> 用户的只读映射 (来自用户目录的哈希索引)"""
+        return self.user_directory.by_username
 
     def add_book(self, book):
         """添加新书到系统"""
-        self.books.append(book)
+        with self._search_lock:
+            self.books.append(book)
+            self._sync_search_index()
         self.book_by_id[book.book_id] = book
+        self.book_by_title.setdefault(book.title, book)
         self.books_by_category[book.category].append(book)
+        self.popularity.add(book)
+        self.catalog_version += 1
+        self.invalidate_recommendations() # 新书可能进入任何用户的推荐
     
     def add_user(self, user):
         """添加新用户到系统"""
-        if user.username not in self.user_by_username: # 避免重复添加
-            self.users.append(user)
-            self.user_by_username[user.username] = user
+        self.user_directory.add(user) # 用户名已存在时不重复添加
 
     def add_rating(self, user_obj, book_obj, rating):
         """添加用户对图书的评分，并更新相关信息"""
@@ -64,72 +209,119 @@ class RecommendationEngine:
         # 更新Book对象的评分信息
         # 假设Book类有add_rating(rating)方法来更新平均分和评分数
         book_obj.add_rating(float(rating))
+        self.popularity.update(book_obj)
 
         # 更新协同过滤推荐器中的数据（如果存在）
-        if self.cf_recommender:
-            # UserBasedCollaborativeFiltering可能需要一个方法来更新特定用户的评分
-            # 或者在获取推荐时动态地从User对象获取最新评分
-            # 一个简单的做法是标记需要重新构建或更新内部数据结构
-            self.cf_recommender.update_user_rating(user_obj, book_obj.book_id, float(rating))
-            # 或者更简单粗暴但可能低效：self.retrain_models() 
-            # 但频繁retrain可能开销大，具体取决于cf_recommender的实现
+        with self._model_lock:
+            if self.cf_recommender:
+                # UserBasedCollaborativeFiltering可能需要一个方法来更新特定用户的评分
+                # 或者在获取推荐时动态地从User对象获取最新评分
+                # 一个简单的做法是标记需要重新构建或更新内部数据结构
+                self.cf_recommender.update_user_rating(user_obj, book_obj.book_id, float(rating))
+                # 或者更简单粗暴但可能低效：self.retrain_models() 
+                # 但频繁retrain可能开销大，具体取决于cf_recommender的实现
+            if self._training_journal is not None: # 后台训练中，换上新模型前要补上这条评分
+                self._training_journal.append((user_obj, book_obj.book_id, float(rating)))
+            self._rating_versions[user_obj.user_id] += 1
+        self.invalidate_recommendations(user_obj)
 
         print(f"Rating added: User '{user_obj.username}' rated '{book_obj.title}' with {rating}")
         # 考虑是否需要在这里重新训练模型，或者标记模型为stale
         # self.retrain_models() # 每次评分都重新训练可能效率不高，看情况决定
 
-    def load_ratings_from_file(self, file_path="data/user_ratings.txt"):
-        """从文件加载历史评分数据并更新到系统中"""
+    def load_ratings_from_file(self, file_path="data/user_ratings.txt", chunk_size=100000):
+        """从评分日志按 chunk_size 分块流式加载历史评分并更新到系统中"""
         try:
             # 修正文件路径的查找方式，使其相对于项目根目录或models目录
             # 这里假设data文件夹与models文件夹在同一父目录下，即项目根目录下的data/
-            current_dir = os.path.dirname(__file__) # models目录
-            project_root = os.path.dirname(current_dir) # 项目根目录
-            actual_file_path = os.path.join(project_root, file_path)
+            actual_file_path = os.path.join(PROJECT_ROOT, file_path)
 
             if not os.path.exists(actual_file_path):
                 print(f"Ratings file not found at {actual_file_path}. No ratings loaded.")
                 return
 
-            with open(actual_file_path, 'r', encoding='utf-8') as f:
-                for line in f:
-                    parts = line.strip().split(',')
-                    if len(parts) == 3:
-                        username, book_title, rating_str = parts
-                        rating = float(rating_str)
-                        
-                        user = self.user_by_username.get(username)
-                        # 需要一种方式通过title找到book_id或book_obj
-                        # 假设book_by_id已经通过book.title索引，或者有一个book_by_title的索引
-                        # 为了简单，我们先假设能通过title找到book对象
-                        # 更好的做法是user_ratings.txt中存储book_id
-                        book = next((b for b in self.books if b.title == book_title), None)
-
-                        if user and book:
-                            # 调用已有的add_rating逻辑，但避免重复写入文件和打印信息
-                            # 这里我们直接更新对象，因为是从文件加载
-                            user.add_rating(book.book_id, rating) # 假设User类有此方法
-                            book.add_rating(rating)      # 假设Book类有此方法
-                            print(f"Loaded rating from file: {username}, {book_title}, {rating}")
-                        else:
-                            if not user:
-                                print(f"Warning: User '{username}' not found while loading ratings.")
-                            if not book:
-                                print(f"Warning: Book '{book_title}' not found while loading ratings.")
-            
-            # 加载完所有评分后，可能需要更新或重新训练推荐模型
-            if self.cf_recommender:
-                 # 理想情况下，cf_recommender应该能批量更新或基于当前用户和书籍对象重建
-                self.cf_recommender.build_similarity_matrix() # 假设有这样的方法
-            print("All ratings loaded from file and models updated.")
+            self._apply_rating_records(RatingLog.replay_chunks(actual_file_path, chunk_size))
 
         except Exception as e:
             print(f"Error loading ratings from file: {e}")
 
+    def _apply_rating_records(self, chunks):
+        """把分块的 (用户名, 书名, 评分) 记录批量应用到书籍和用户上，返回实际加载的评分数
+
+        只建立一次 用户名->用户 和 书名->书 的索引，评分先写入列式数组，
+        去重后一次性更新书籍统计和用户评分，最后只重建一次协同过滤矩阵。
+        """
+        # 同名的书 (和重名的用户) 与 book_by_title、用户目录一致，都取第一个
+        user_index, book_index = {}, {}
+        for i, user in enumerate(self.users):
+            user_index.setdefault(user.username, i)
+        for i, book in enumerate(self.books):
+            book_index.setdefault(book.title, i)
+        user_columns, book_columns, rating_columns = [], [], []
+        total_records = unknown_users = unknown_books = 0
+        for chunk in chunks:
+            count = len(chunk)
+            user_idx = np.fromiter((user_index.get(username, -1) for username, _, _ in chunk), dtype=np.int64, count=count)
+            book_idx = np.fromiter((book_index.get(title, -1) for _, title, _ in chunk), dtype=np.int64, count=count)
+            ratings = np.fromiter((rating for _, _, rating in chunk), dtype=np.float64, count=count)
+            total_records += count
+            unknown_users += int(np.count_nonzero(user_idx < 0))
+            unknown_books += int(np.count_nonzero(book_idx < 0))
+            found = (user_idx >= 0) & (book_idx >= 0)
+            user_columns.append(user_idx[found])
+            book_columns.append(book_idx[found])
+            rating_columns.append(ratings[found])
+
+        if not user_columns:
+            print("No ratings to load.")
+            return 0
+        user_idx = np.concatenate(user_columns)
+        book_idx = np.concatenate(book_columns)
+        ratings = np.concatenate(rating_columns)
+
+        # 同一 (用户, 书) 只保留日志中最后一条评分
+        keys = user_idx * max(len(self.books), 1) + book_idx
+        _, last_from_end = np.unique(keys[::-1], return_index=True)
+        keep = np.sort(len(keys) - 1 - last_from_end)
+        user_idx, book_idx, ratings = user_idx[keep], book_idx[keep], ratings[keep]
+
+        # 书籍评分统计按列一次性累加
+        rating_sums = np.bincount(book_idx, weights=ratings, minlength=len(self.books))
+        rating_counts = np.bincount(book_idx, minlength=len(self.books))
+        for i in np.nonzero(rating_counts)[0]:
+            self.books[i].add_ratings(rating_sums[i], rating_counts[i])
+        # 用户评分按所属的评分存储分组，每个存储整批与 CSR 合并一次
+        book_ids = [book.book_id for book in self.books]
+        rated_users, user_pos = np.unique(user_idx, return_inverse=True)
+        store_rows = np.array([self.users[i].rating_row for i in rated_users.tolist()], dtype=np.int64)
+        store_groups = defaultdict(list) # id(存储) -> rated_users 中的位置
+        for pos, i in enumerate(rated_users.tolist()):
+            store_groups[id(self.users[i].rating_store)].append(pos)
+        for positions in store_groups.values():
+            store = self.users[rated_users[positions[0]]].rating_store
+            selected = np.isin(user_pos, positions) if len(store_groups) > 1 else slice(None)
+            store.set_ratings(store_rows[user_pos[selected]], [book_ids[j] for j in book_idx[selected].tolist()],
+                              ratings[selected])
+        for i, j in zip(user_idx.tolist(), book_idx.tolist()): # 评分过的书也算已读
+            self.users[i].add_read_book(book_ids[j])
+        self.popularity.rebuild(self.books) # 书籍评分批量变化后整体重建一次
+
+        # 加载完所有评分后，一次性重建协同过滤的评分矩阵
+        if self.cf_recommender:
+            self.cf_recommender.build_similarity_matrix()
+        print(f"Loaded {len(keep)} ratings from {total_records} records "
+              f"({unknown_users} with unknown users, {unknown_books} with unknown books).")
+        return len(keep)
+
+
     def get_book_by_id(self, book_id):
         """通过ID获取图书"""
         return self.book_by_id.get(book_id)
     
+    def get_book_by_title(self, title):
+        """通过书名获取图书 (同名时返回书目中的第一本)"""
+        return self.book_by_title.get(title)
+
     def get_books_by_category(self, category):
         """获取特定类别的所有图书"""
         return self.books_by_category.get(category, [])
@@ -139,60 +331,94 @@ class RecommendationEngine:
         return list(self.books_by_category.keys())
     
     def get_top_rated_books(self, n=10):
-        """获取评分最高的n本书"""
-        sorted_books = sorted(self.books, key=lambda x: (x.rating, x.ratings_count), reverse=True)
-        return sorted_books[:n]
+        """获取评分最高的n本书 (从有序索引中直接切片)"""
+        return self.popularity.top(n)
     
-    def get_recommendations_for_user(self, user, n=10):
-        """混合推荐：结合多种策略"""
-        recommended_ids = set()
-        result = []
+    def _category_candidates(self, user, n):
+        """基于用户偏好类别的前n本候选书籍，按评分和评分数排序"""
+        # 按评分和评分数排序 (可以加入NLP相似度作为次要排序依据)
+        return self.popularity.top_in_categories(user.preferences, n)
 
-        # 优先策略：协同过滤 (如果可用且用户有足够评分)
-        if self.cf_recommender and len(user.ratings) > 2: # 假设用户至少有3个评分才用CF
-            cf_recs = self.cf_recommender.recommend(user, n=n*2) # 获取多一些候选
-            for book in cf_recs:
-                if book.book_id not in user.ratings and book.book_id not in recommended_ids:
-                    result.append(book)
-                    recommended_ids.add(book.book_id)
-                if len(result) >= n:
-                    return result[:n]
-        
-        # 第二策略：基于内容的推荐 (如果可用)
-        if self.content_recommender:
-            content_recs = self.content_recommender.recommend(user, n=n*2)
-            for book in content_recs:
-                if book.book_id not in user.ratings and book.book_id not in recommended_ids:
-                    result.append(book)
-                    recommended_ids.add(book.book_id)
-                if len(result) >= n:
-                    return result[:n]
+    def search_catalog(self, query, k=5):
+        """用 TF-IDF 检索与 query 最相关的k本书，返回 [(书, 相似度)]；书目变化后首次调用时重建索引"""
+        with self._retriever_lock:
+            if self._retriever is None or self._retriever_version != self.catalog_version:
+                version = self.catalog_version
+                self._retriever = CatalogRetriever(self.books)
+                self._retriever_version = version
+            retriever = self._retriever
+        return retriever.search(query, k)
+
+    def _sync_search_index(self):
+        """把索引之后加入 self.books 的书补进索引 (需持有 _search_lock)，保证文档号与 self.books 的下标一致"""
+        if self.search_index is not None:
+            for book in self.books[len(self.search_index):]:
+                self.search_index.add(book)
+
+    def build_search_index(self):
+        """构建书名/作者/类别/简介的全文检索索引，可以在后台线程中调用"""
+        books = self.books
+        index = SearchIndex(list(books))
+        with self._search_lock:
+            if books is not self.books: # 构建期间书目被整体替换
+                return None
+            self.search_index = index
+            self._sync_search_index() # 构建期间新加入的书
+        print(f"Search index built for {len(index)} books.")
+        return index
+
+    def _get_search_index(self):
+        index = self.search_index
+        return index if index is not None else self.build_search_index()
+
+    def search_books_rows(self, query, n=10, prefix=False):
+        """全文检索，返回 (self.books 中的下标数组, BM25 分数数组)，按相关度从高到低"""
+        index = self._get_search_index()
+        if index is None:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        return index.search_rows(query, n, prefix)
+
+    def search_books(self, query, n=10, prefix=False):
+        """全文检索，返回 [(书, BM25 分数)]；prefix 为 True 时最后一个词按前缀匹配"""
+        index = self._get_search_index()
+        return index.search(query, n, prefix) if index is not None else []
+
+    def suggest_books(self, query, n=10):
+        """输入提示：按已输入的内容 (最后一个词可以不完整) 返回最相关的n本书"""
+        index = self._get_search_index()
+        return index.suggest(query, n) if index is not None else []
+
+    def chat_messages(self, user, user_message, k=5, n_recommendations=5):
+        """为AI对话构造消息：检索到的相关书籍和该用户的推荐结果写入系统提示词"""
+        relevant_books = [book for book, _ in self.search_catalog(user_message, k)]
+        recommended_books = self.get_recommendations_for_user(user, n_recommendations) if user else []
+        return build_chat_messages(user_message, relevant_books, recommended_books, user.username if user else None)
+
+    def chat_cache_key(self, user, user_message):
+        """AI回复缓存的键：归一化的问题、书目和模型版本、用户及其评分版本
+
+        提示词中包含该用户的推荐结果，用户评分或模型替换后推荐会变，旧的回复随之失效。
+        """
+        if user is None:
+            return ResponseCache.normalize(user_message), self.catalog_version, self.model_version, None, 0
+        return (ResponseCache.normalize(user_message), self.catalog_version, self.model_version,
+                user.user_id, self._rating_versions.get(user.user_id, 0))
 
-        # 第三策略：基于用户偏好类别 (如原有逻辑)
-        preferred_categories = user.preferences
-        if preferred_categories:
-            candidate_books = []
-            for category in preferred_categories:
-                candidate_books.extend(self.books_by_category.get(category, []))
-            
-            # 按评分和评分数排序 (可以加入NLP相似度作为次要排序依据)
-            candidate_books = sorted(candidate_books, key=lambda x: (x.rating, x.ratings_count), reverse=True)
-            for book in candidate_books:
+    def _blend_recommendations(self, user, n, candidate_lists):
+        """按策略优先级依次合并候选列表，跳过已评分和重复的书籍，不足时随机补充
+
+        candidate_lists 可以是生成器，这样排在后面的策略只有在前面的策略不够n本时才会被计算。
+        """
+        recommended_ids = set()
+        result = []
+        for candidates in candidate_lists:
+            for book in candidates:
                 if book.book_id not in user.ratings and book.book_id not in recommended_ids:
                     result.append(book)
                     recommended_ids.add(book.book_id)
                 if len(result) >= n:
                     return result[:n]
         
-        # 第四策略：高评分补充 (如原有逻辑)
-        top_rated = self.get_top_rated_books(n=n*3) # 获取更多候选
-        for book in top_rated:
-            if book.book_id not in user.ratings and book.book_id not in recommended_ids:
-                result.append(book)
-                recommended_ids.add(book.book_id)
-            if len(result) >= n:
-                return result[:n]
-        
         # 最后策略：随机补充 (如原有逻辑)
         if len(result) < n:
             available_books = [book for book in self.books if book.book_id not in user.ratings and book.book_id not in recommended_ids]
@@ -206,12 +432,158 @@ class RecommendationEngine:
                         
         return result[:n]
 
+    def invalidate_recommendations(self, user=None):
+        """使推荐结果缓存失效：指定 user 时只清除该用户的缓存，否则递增模型版本并清空全部缓存"""
+        with self._cache_lock:
+            if user is None:
+                self.model_version += 1
+                self._result_cache.clear()
+                self._cached_keys_by_user.clear()
+                return
+            for key in self._cached_keys_by_user.pop(user.user_id, ()):
+                self._result_cache.pop(key, None)
+
+    def cache_stats(self):
+        """返回推荐结果缓存的命中/未命中次数和当前大小"""
+        with self._cache_lock:
+            return {"hits": self.cache_hits, "misses": self.cache_misses, "size": len(self._result_cache),
+                    "model_version": self.model_version}
+
+    def get_recommendations_for_user(self, user, n=10):
+        """混合推荐 (带结果缓存)：同一用户在评分和模型都未变化时直接返回上次的结果"""
+        key = (user.user_id, n, self.model_version)
+        with self._cache_lock:
+            cached = self._result_cache.get(key)
+            if cached is not None:
+                self._result_cache.move_to_end(key)
+                self.cache_hits += 1
+                return list(cached)
+            self.cache_misses += 1
+
+        rating_version = self._rating_versions.get(user.user_id, 0)
+        result, complete = self._compute_recommendations(user, n)
+        with self._cache_lock:
+            # 计算期间模型被替换、该用户有新评分 (缓存已按用户清除过)、或有策略超时或出错 (降级结果) 时不缓存，下次重新计算
+            if (complete and key[2] == self.model_version and self.result_cache_size > 0
+                    and rating_version == self._rating_versions.get(user.user_id, 0)):
+                self._result_cache[key] = result
+                self._cached_keys_by_user[user.user_id].add(key)
+                while len(self._result_cache) > self.result_cache_size:
+                    old_key, _ = self._result_cache.popitem(last=False)
+                    user_keys = self._cached_keys_by_user.get(old_key[0])
+                    if user_keys is not None:
+                        user_keys.discard(old_key)
+                        if not user_keys:
+                            del self._cached_keys_by_user[old_key[0]]
+        return list(result)
+
+    def _cf_scored(self, user, n):
+        cf_recommender = self.cf_recommender
+        if cf_recommender and len(user.ratings) > 2: # 假设用户至少有3个评分才用CF
+            return cf_recommender.recommend_scored(user, n=n)
+        return []
+
+    def _content_scored(self, user, n):
+        content_recommender = self.content_recommender
+        return content_recommender.recommend_scored(user, n=n) if content_recommender else []
+
+    def _category_scored(self, user, n):
+        return ((book, book.rating) for book in self._category_candidates(user, n + len(user.ratings)))
+
+    def _top_rated_scored(self, user, n):
+        return ((book, book.rating) for book in self.get_top_rated_books(n=n))
+
+    def _compute_recommendations(self, user, n):
+        """混合推荐：并行融合各策略的打分，不足n本时随机补充；返回 (推荐列表, 是否所有策略都按时正常完成)"""
+        if self.hybrid:
+            fused, timed_out, failed = self.hybrid.recommend(user, n, candidates_per_strategy=n * 2)
+            return self._blend_recommendations(user, n, [[book for book, _ in fused]]), not (timed_out or failed)
+        return self._fallback_recommendations(user, n), True
+
+    def _fallback_recommendations(self, user, n):
+        """混合推荐：结合多种策略"""
+        def strategies():
+            # 优先策略：协同过滤 (如果可用且用户有足够评分)
+            if self.cf_recommender and len(user.ratings) > 2: # 假设用户至少有3个评分才用CF
+                yield self.cf_recommender.recommend(user, n=n*2) # 获取多一些候选
+            # 第二策略：基于内容的推荐 (如果可用)
+            if self.content_recommender:
+                yield self.content_recommender.recommend(user, n=n*2)
+            # 第三策略：基于用户偏好类别 (如原有逻辑)
+            if user.preferences:
+                yield self._category_candidates(user, n + len(user.ratings)) # 跳过已评分的书后仍够n本
+            # 第四策略：高评分补充 (如原有逻辑)
+            yield self.get_top_rated_books(n=n*3) # 获取更多候选
+
+        return self._blend_recommendations(user, n, strategies())
+
+    def recommend_many(self, users, n=10, block_size=256):
+        """批量混合推荐，返回与 users 顺序一一对应的推荐列表
+
+        协同过滤和内容推荐按 block_size 分块批量计算，策略按优先级依次回退 (与 parallel_hybrid=False 时相同)。
+        """
+        cf_recs = [[] for _ in users]
+        if self.cf_recommender:
+            cf_positions = [pos for pos, user in enumerate(users) if len(user.ratings) > 2]
+            cf_results = self.cf_recommender.recommend_many([users[pos] for pos in cf_positions],
+                                                            n=n*2, block_size=block_size)
+            for pos, recs in zip(cf_positions, cf_results):
+                cf_recs[pos] = recs
+
+        content_recs = [[] for _ in users]
+        if self.content_recommender:
+            content_recs = self.content_recommender.recommend_many(users, n=n*2, block_size=block_size)
+
+        top_rated = self.get_top_rated_books(n=n*3) # 所有用户共用一份高评分候选
+        results = []
+        for pos, user in enumerate(users):
+            category_recs = self._category_candidates(user, n + len(user.ratings)) if user.preferences else []
+            results.append(self._blend_recommendations(
+                user, n, [cf_recs[pos], content_recs[pos], category_recs, top_rated]))
+        return results
+
     # 你可能还需要一个方法来重新训练/更新推荐模型，例如当有新用户、新书或新评分时
     def retrain_models(self):
-        if self.books and self.users:
-            print("Retraining recommendation models...")
-            self.cf_recommender = UserBasedCollaborativeFiltering(self.users, self.books)
-            self.content_recommender = ContentBasedRecommender(self.books)
+        models = self.train_models()
+        if models:
+            self.swap_models(*models)
             print("Models retrained.")
         else:
-            print("Not enough data to retrain models.")
\ No newline at end of file
+            print("Not enough data to retrain models.")
+
+    def train_models(self, progress_callback=None):
+        """构建一组新的 (协同过滤, 内容) 模型但不替换当前模型，当前模型在此期间继续提供推荐；设置了 cache_dir 时优先从缓存加载
+
+        可以在后台线程中调用；progress_callback(阶段, 进度0~1) 报告进度。数据不足时返回 None。
+        """
+        if not (self.books and self.users):
+            return None
+        with self._model_lock:
+            self._training_journal = [] # 从现在起的新评分在换模型时补进新模型
+        try:
+            print("Retraining recommendation models...")
+            if progress_callback:
+                progress_callback("cf", 0.0)
+            cache = ModelCache(self.cache_dir) if self.cache_dir else None
+            cf_recommender = self._load_or_train_cf(cache)
+            if progress_callback:
+                progress_callback("content", 0.5)
+            content_recommender = self._load_or_train_content(cache)
+            if progress_callback:
+                progress_callback("done", 1.0)
+        except Exception:
+            with self._model_lock:
+                self._training_journal = None
+            raise
+        return cf_recommender, content_recommender
+
+    def swap_models(self, cf_recommender, content_recommender):
+        """原子地换上新模型：先把训练期间的新评分补进新模型，再整体替换并使推荐缓存失效"""
+        with self._model_lock:
+            for user, book_id, rating in self._training_journal if self._training_journal else ():
+                cf_recommender.update_user_rating(user, book_id, rating)
+            self._training_journal = None
+            self.cf_recommender = cf_recommender
+            self.content_recommender = content_recommender
+            self.is_ready = True
+        self.invalidate_recommendations()
\ No newline at end of file
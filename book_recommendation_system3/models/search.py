@@ -0,0 +1,228 @@
+import bisect
+import heapq
+import math
+import threading
+from array import array
+from collections import Counter, defaultdict
+import numpy as np
+from .nlp_utils import tokenize, get_stopwords
+from .ranking import top_n_indices
+
+# 各字段的词频权重：书名里出现的词比简介里出现的更重要
+FIELD_WEIGHTS = (("title", 3), ("author", 2), ("category", 1), ("description", 1))
+
+
+def analyze(text):
+    """检索用的分词：小写、中文二元组、去除英文停用词 (与 TF-IDF 预处理一致)"""
+    if not text:
+        return []
+    stopwords = get_stopwords()
+    return [token for token in tokenize(text.lower()) if token not in stopwords]
+
+
+class SearchIndex:
+    """书名/作者/类别/简介的内存倒排索引，按 BM25 排序
+
+    倒排表按词号存成 CSR (indptr, 文档号, 加权词频) 三个 NumPy 数组；
+    add() 新加入的书先写入尾部的 {词号: [(文档号, 词频)]}，尾部积累到 merge_threshold 条后再合并进 CSR。
+    文档号就是书加入索引的顺序，与 RecommendationEngine.books 中的下标一致。
+    前缀查询在有序词表上用 bisect 找到以该前缀开头的词，按文档频率取前 max_expansions 个展开。
+    """
+
+    k1 = 1.2
+    b = 0.75
+
+    def __init__(self, books=(), merge_threshold=50000, max_expansions=64):
+        self.merge_threshold = merge_threshold
+        self.max_expansions = max_expansions
+        self.books = []
+        self._lock = threading.RLock()
+        self._vocabulary = defaultdict() # 词 -> 词号，新词自动分配下一个编号
+        self._vocabulary.default_factory = self._vocabulary.__len__
+        self._lengths = np.zeros(0, dtype=np.float32) # 每本书的加权词数
+        self._total_length = 0.0
+        self._indptr = np.zeros(1, dtype=np.int64)
+        self._docs = np.zeros(0, dtype=np.int32)
+        self._tfs = np.zeros(0, dtype=np.float32)
+        self._sorted_terms = [] # CSR 中的词，按字典序排列
+        self._new_terms = [] # 上次合并后出现的新词，按字典序排列
+        self._tail = defaultdict(list)
+        self._tail_size = 0
+        self._bulk_add(books)
+
+    def __len__(self):
+        return len(self.books)
+
+    @staticmethod
+    def _term_counts(book):
+        tokens = []
+        for field, weight in FIELD_WEIGHTS:
+            tokens.extend(analyze(getattr(book, field)) * weight)
+        return Counter(tokens), len(tokens)
+
+    def _bulk_add(self, books):
+        """构造时一次性加入很多书：词频先写入列式数组，最后排序生成 CSR"""
+        vocabulary = self._vocabulary
+        first_doc = len(self.books)
+        term_column, tf_column, terms_per_doc, lengths = array('i'), array('f'), array('i'), array('f')
+        for book in books:
+            counts, length = self._term_counts(book)
+            term_column.extend(map(vocabulary.__getitem__, counts))
+            tf_column.extend(counts.values())
+            terms_per_doc.append(len(counts))
+            lengths.append(length)
+            self.books.append(book)
+        if not lengths:
+            return
+        doc_column = np.repeat(np.arange(first_doc, first_doc + len(lengths), dtype=np.int32),
+                               np.frombuffer(terms_per_doc, dtype=np.int32))
+        new_lengths = np.frombuffer(lengths, dtype=np.float32)
+        self._lengths = np.concatenate([self._lengths[:first_doc], new_lengths])
+        self._total_length += float(np.sum(new_lengths, dtype=np.float64))
+        self._merge(np.frombuffer(term_column, dtype=np.int32), doc_column, np.frombuffer(tf_column, dtype=np.float32))
+
+    def _merge(self, term_column=None, doc_column=None, tf_column=None):
+        """把尾部和新的列式倒排记录合并进 CSR，并重建有序词表"""
+        n_terms = len(self._vocabulary)
+        old_terms = np.repeat(np.arange(len(self._indptr) - 1, dtype=np.int32), np.diff(self._indptr))
+        term_parts, doc_parts, tf_parts = [old_terms], [self._docs], [self._tfs]
+        if self._tail:
+            tail = [(term, doc, tf) for term, postings in self._tail.items() for doc, tf in postings]
+            term_parts.append(np.array([term for term, _, _ in tail], dtype=np.int32))
+            doc_parts.append(np.array([doc for _, doc, _ in tail], dtype=np.int32))
+            tf_parts.append(np.array([tf for _, _, tf in tail], dtype=np.float32))
+        if term_column is not None:
+            term_parts.append(term_column)
+            doc_parts.append(doc_column)
+            tf_parts.append(tf_column)
+        terms = np.concatenate(term_parts)
+        docs = np.concatenate(doc_parts)
+        tfs = np.concatenate(tf_parts)
+        order = np.lexsort((docs, terms)) # 按词号、再按文档号排序
+        self._docs = docs[order]
+        self._tfs = tfs[order]
+        self._indptr = np.concatenate([[0], np.cumsum(np.bincount(terms, minlength=n_terms))]).astype(np.int64)
+        if self._sorted_terms: # 已有的有序词表和新词表归并即可，不必重新排序
+            self._sorted_terms = list(heapq.merge(self._sorted_terms, self._new_terms))
+        else:
+            self._sorted_terms = sorted(self._vocabulary)
+        self._new_terms = []
+        self._tail = defaultdict(list)
+        self._tail_size = 0
+
+    def add(self, book):
+        """增量加入一本书，返回它的文档号"""
+        counts, length = self._term_counts(book)
+        with self._lock:
+            doc = len(self.books)
+            self.books.append(book)
+            if doc >= len(self._lengths): # 容量按倍数增长，避免每本书都复制整个数组
+                grown = np.zeros(max(2 * len(self._lengths), 1024), dtype=np.float32)
+                grown[:len(self._lengths)] = self._lengths
+                self._lengths = grown
+            self._lengths[doc] = length
+            self._total_length += length
+            for token, tf in counts.items():
+                is_new = token not in self._vocabulary
+                term = self._vocabulary[token]
+                if is_new:
+                    bisect.insort(self._new_terms, token)
+                self._tail[term].append((doc, float(tf)))
+            self._tail_size += len(counts)
+            if self._tail_size >= self.merge_threshold:
+                self._merge()
+            return doc
+
+    def _postings(self, term):
+        """某个词的 (文档号数组, 词频数组)，包含尚未合并的尾部"""
+        if term + 1 < len(self._indptr):
+            start, end = self._indptr[term], self._indptr[term + 1]
+            docs, tfs = self._docs[start:end], self._tfs[start:end]
+        else:
+            docs, tfs = self._docs[:0], self._tfs[:0]
+        tail = self._tail.get(term)
+        if tail:
+            docs = np.concatenate([docs, np.array([doc for doc, _ in tail], dtype=np.int32)])
+            tfs = np.concatenate([tfs, np.array([tf for _, tf in tail], dtype=np.float32)])
+        return docs, tfs
+
+    def _document_frequency(self, term):
+        frozen = int(self._indptr[term + 1] - self._indptr[term]) if term + 1 < len(self._indptr) else 0
+        return frozen + len(self._tail.get(term, ()))
+
+    def _expand_prefix(self, prefix):
+        """以 prefix 开头的词号，按文档频率取前 max_expansions 个"""
+        terms = []
+        for sorted_terms in (self._sorted_terms, self._new_terms):
+            position = bisect.bisect_left(sorted_terms, prefix)
+            # 很短的前缀可能匹配大量的词，最多检查 max_expansions 的 32 倍
+            for token in sorted_terms[position:position + 32 * self.max_expansions]:
+                if not token.startswith(prefix):
+                    break
+                terms.append(self._vocabulary[token])
+        if len(terms) > self.max_expansions:
+            terms.sort(key=lambda term: -self._document_frequency(term))
+            terms = terms[:self.max_expansions]
+        return terms
+
+    def _query_terms(self, query, prefix):
+        """返回 (完整词的词号列表, 最后一个词按前缀展开的词号列表)"""
+        tokens = tokenize(query.lower())
+        # 正在输入的最后一个词即使像停用词 (如 "a") 也要作为前缀保留
+        last = tokens.pop() if prefix and tokens and not query[-1:].isspace() else None
+        stopwords = get_stopwords()
+        terms = [self._vocabulary[token] for token in dict.fromkeys(tokens)
+                 if token in self._vocabulary and token not in stopwords]
+        expansions = [term for term in self._expand_prefix(last) if term not in terms] if last is not None else []
+        return terms, expansions
+
+    def _term_scores(self, term, n_docs, average_length):
+        """一个词的 (文档号数组, BM25 分数数组)"""
+        docs, tfs = self._postings(term)
+        idf = math.log(1.0 + (n_docs - len(docs) + 0.5) / (len(docs) + 0.5))
+        norm = self.k1 * (1.0 - self.b + self.b * self._lengths[docs] / average_length)
+        return docs, idf * tfs * (self.k1 + 1.0) / (tfs + norm)
+
+    def search_rows(self, query, n=10, prefix=False):
+        """返回 (文档号数组, BM25 分数数组)，按分数从高到低
+
+        多个词之间是"或"的关系，包含越多查询词的书分数越高；
+        prefix 为 True 时查询的最后一个词按前缀匹配 (输入提示)，除非查询以空格结尾。
+        前缀展开出的多个词只取每本书得分最高的一个，避免简介里碰巧有很多同前缀词的书排在前面。
+        """
+        with self._lock:
+            terms, expansions = self._query_terms(query, prefix)
+            n_docs = len(self.books)
+            if not (terms or expansions) or n_docs == 0 or n <= 0:
+                return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+            average_length = self._total_length / n_docs
+            parts = [self._term_scores(term, n_docs, average_length) for term in terms]
+            if expansions:
+                expanded = [self._term_scores(term, n_docs, average_length) for term in expansions]
+                docs, inverse = np.unique(np.concatenate([docs for docs, _ in expanded]), return_inverse=True)
+                best = np.zeros(len(docs))
+                np.maximum.at(best, inverse, np.concatenate([scores for _, scores in expanded]))
+                parts.append((docs, best))
+        parts = [(docs, scores) for docs, scores in parts if len(docs)]
+        if not parts:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        if sum(len(docs) for docs, _ in parts) * 8 < n_docs: # 命中的书少时只对命中的书累加
+            candidates, inverse = np.unique(np.concatenate([docs for docs, _ in parts]), return_inverse=True)
+            scores = np.bincount(inverse, weights=np.concatenate([scores for _, scores in parts]))
+        else: # 命中很多时直接在整个书目的分数数组上累加 (同一个词的倒排表中文档号不重复)
+            candidates = None
+            scores = np.zeros(n_docs, dtype=np.float64)
+            for docs, doc_scores in parts:
+                scores[docs] += doc_scores
+        top = top_n_indices(scores, min(n, int(np.count_nonzero(scores > 0))))
+        rows = top if candidates is None else candidates[top]
+        return rows.astype(np.int64), scores[top].astype(np.float32)
+
+    def search(self, query, n=10, prefix=False):
+        """返回 [(书, BM25 分数)]，按分数从高到低"""
+        rows, scores = self.search_rows(query, n, prefix)
+        return [(self.books[row], float(score)) for row, score in zip(rows.tolist(), scores.tolist())]
+
+    def suggest(self, query, n=10):
+        """输入提示：最后一个词按前缀匹配，返回最相关的n本书"""
+        return [book for book, _ in self.search(query, n, prefix=True)]
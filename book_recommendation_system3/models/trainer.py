@@ -0,0 +1,109 @@
+import threading
+import time
+
+
+class BackgroundTrainer:
+    """在后台线程中重新训练 RecommendationEngine 的模型，训练期间旧模型继续提供推荐
+
+    notify_rating() 记录一条新评分：累计 min_ratings 条，或距第一条未训练的评分已过 max_delay 秒时触发训练；
+    request_retrain() 立即触发。训练好的模型通过 engine.swap_models 原子替换。
+    progress_callback(阶段, 进度0~1) 在后台线程中调用，GUI 需要自己切回主线程更新界面。
+    使用线程而不是进程：模型要直接引用引擎中的 Book/User 对象，且大部分耗时在会释放 GIL 的 NumPy/SciPy 运算中。
+    """
+
+    def __init__(self, engine, min_ratings=20, max_delay=60.0, progress_callback=None):
+        self.engine = engine
+        self.min_ratings = min_ratings
+        self.max_delay = max_delay
+        self.progress_callback = progress_callback
+        self.trainings = 0 # 已完成的训练次数
+        self._pending = 0
+        self._first_pending_time = None
+        self._forced = False
+        self._training = False
+        self._closed = False
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    @property
+    def is_training(self):
+        with self._condition:
+            return self._training
+
+    def notify_rating(self):
+        """记录一条新评分，达到阈值时唤醒训练线程"""
+        with self._condition:
+            if self._pending == 0:
+                self._first_pending_time = time.monotonic()
+            self._pending += 1
+            self._condition.notify()
+
+    def request_retrain(self):
+        """不等待阈值，尽快开始一次训练"""
+        with self._condition:
+            self._forced = True
+            self._condition.notify()
+
+    def _should_train(self):
+        """返回 (是否训练, 还需等待的秒数)"""
+        if self._forced or self._pending >= self.min_ratings:
+            return True, None
+        if not self._pending:
+            return False, None
+        remaining = self._first_pending_time + self.max_delay - time.monotonic()
+        return remaining <= 0, remaining
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._closed:
+                    ready, remaining = self._should_train()
+                    if ready:
+                        break
+                    self._condition.wait(remaining)
+                if self._closed:
+                    return
+                self._forced = False
+                self._pending = 0
+                self._first_pending_time = None
+                self._training = True
+            try:
+                self._report("start", 0.0)
+                models = self.engine.train_models(self._report)
+                if models:
+                    self.engine.swap_models(*models)
+                    self.trainings += 1
+                self._report("swapped", 1.0)
+            except Exception as e:
+                print(f"Background training failed: {e}")
+                self._report("failed", 1.0)
+            finally:
+                with self._condition:
+                    self._training = False
+                    self._condition.notify_all()
+
+    def _report(self, stage, fraction):
+        if self.progress_callback:
+            try:
+                self.progress_callback(stage, fraction)
+            except Exception as e:
+                print(f"Training progress callback failed: {e}")
+
+    def wait_idle(self, timeout=None):
+        """等待没有正在进行或已触发的训练，返回是否在超时前空闲"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            while self._training or self._forced or self._pending >= self.min_ratings:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+            return True
+
+    def close(self, timeout=None):
+        """停止训练线程；正在进行的训练会完成"""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self._thread.join(timeout)
@@ -1,27 +1,63 @@
+from .catalog import RatingsView, default_rating_store
+
+
 class User:
-    def __init__(self, user_id, username, password, preferences=None, read_books=None, ratings=None):
+    """用户：基本资料保存在 __slots__ 中，评分保存在共享的列式 RatingStore 里"""
+
+    __slots__ = ("user_id", "username", "password", "preferences", "_read_books", "_read_set", "_store", "_row", "_ratings")
+
+    def __init__(self, user_id, username, password, preferences=None, read_books=None, ratings=None, store=None):
         self.user_id = user_id
         self.username = username
         self.password = password
         self.preferences = preferences if preferences is not None else []
-        self.read_books = read_books if read_books is not None else [] # 初始化read_books
-        self.ratings = ratings if ratings is not None else {} # 初始化ratings
+        self.read_books = read_books if read_books is not None else [] # 初始化read_books (同时建立集合索引)
+        self._store = store if store is not None else default_rating_store()
+        self._row = self._store.add_user()
+        self._ratings = RatingsView(self._store, self._row) # 初始化ratings
+        if ratings:
+            for book_id, rating in ratings.items():
+                self._store.set_rating(self._row, book_id, rating)
+
+    @property
+    def ratings(self):
+        """{书号: 评分} 的只读映射，修改请使用 add_rating"""
+        return self._ratings
+
+    @property
+    def rating_store(self):
+        return self._store
+
+    @property
+    def rating_row(self):
+        """该用户在 rating_store 中的行号"""
+        return self._row
+
+    @property
+    def read_books(self):
+        """已读书号列表 (按加入顺序)，请通过 add_read_book 追加"""
+        return self._read_books
+
+    @read_books.setter
+    def read_books(self, read_books):
+        self._read_books = list(read_books)
+        self._read_set = set(self._read_books) # 判断是否已读为 O(1)
 
     def add_preference(self, genre):
         if genre not in self.preferences:
             self.preferences.append(genre)
 
     def add_read_book(self, book_id): # 修改参数为 book_id
-        if book_id not in self.read_books:
-            self.read_books.append(book_id)
+        if book_id not in self._read_set:
+            self._read_set.add(book_id)
+            self._read_books.append(book_id)
 
     def add_rating(self, book_id, rating):
         """添加用户对某本书的评分，并确保该书在已读列表中"""
         try:
-            self.ratings[str(book_id)] = float(rating) # 确保book_id是字符串键，rating是浮点数
+            self._store.set_rating(self._row, str(book_id), float(rating)) # 确保book_id是字符串键，rating是浮点数
             # 如果对书评分了，也应该算作已读
-            if str(book_id) not in self.read_books:
-                self.read_books.append(str(book_id))
+            self.add_read_book(str(book_id))
         except ValueError:
             print(f"Error: Rating '{rating}' is not a valid number for book_id '{book_id}'.")
 
@@ -0,0 +1,244 @@
+import hashlib
+import hmac
+import os
+import queue
+import threading
+import time
+from types import MappingProxyType
+from .user import User
+
+# 密码保存为 "pbkdf2_sha256$迭代次数$盐$哈希" (盐和哈希为十六进制)，不含 users.txt 的分隔符 "|"
+HASH_ALGORITHM = "pbkdf2_sha256"
+PBKDF2_ITERATIONS = 200000
+
+
+def hash_password(password, iterations=PBKDF2_ITERATIONS, salt=None):
+    """用随机盐和 PBKDF2-HMAC-SHA256 计算密码哈希，返回可直接保存的字符串"""
+    salt = salt if salt is not None else os.urandom(16)
+    digest = hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), salt, iterations)
+    return f"{HASH_ALGORITHM}${iterations}${salt.hex()}${digest.hex()}"
+
+
+def is_password_hash(stored):
+    return stored.startswith(HASH_ALGORITHM + "$")
+
+
+def verify_password(stored, password):
+    """校验密码；stored 是旧数据中的明文时按明文比较 (常数时间)"""
+    if not is_password_hash(stored):
+        return hmac.compare_digest(stored.encode("utf-8"), password.encode("utf-8"))
+    try:
+        _, iterations, salt, expected = stored.split("$")
+        digest = hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), bytes.fromhex(salt), int(iterations))
+    except ValueError:
+        return False
+    return hmac.compare_digest(digest.hex(), expected)
+
+
+class _Waiter:
+    """同步写入的调用方等待的结果：写完后 done 被设置，error 是写入时的异常 (成功时为 None)
+
+    immediate 为 True 时后台线程不等批量合并，立即写入这条记录。
+    """
+
+    def __init__(self, immediate=True):
+        self.done = threading.Event()
+        self.error = None
+        self.immediate = immediate
+
+
+class UserDirectory:
+    """用户目录：用户名和用户号的哈希索引、单调递增的用户号分配、加盐密码哈希和批量持久化
+
+    users 列表按引用保存 (通常就是 RecommendationEngine.users)，注册的新用户直接追加到其中。
+    新用户和修改过的密码放入队列，由后台线程最多每 flush_interval 秒或每 batch_size 条
+    调用一次 repository.add_users / repository.update_passwords 写入存储；close() 时写完剩余的。
+    register 和 change_password 传入 wait=True 时等待写入结果，写入失败会撤销内存中的修改并抛出异常；
+    同时传入 immediate=False 时记录仍与其他记录一起批量写入，调用方最多多等 flush_interval 秒。
+    旧数据中的明文密码在该用户第一次登录成功时换成哈希。
+    密码哈希 (PBKDF2) 较慢，GUI 应在工作线程中调用 register、authenticate 和 change_password。
+    """
+
+    def __init__(self, users=None, repository=None, batch_size=100, flush_interval=1.0, iterations=PBKDF2_ITERATIONS):
+        self.repository = repository
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.iterations = iterations
+        self._lock = threading.RLock()
+        self._queue = queue.Queue()
+        self._thread = None
+        self.load(users if users is not None else [])
+
+    def load(self, users):
+        """用 users 重建索引和用户号计数器"""
+        with self._lock:
+            self.users = users
+            self._by_username = {}
+            self._by_id = {}
+            for user in users:
+                self._by_username.setdefault(user.username, user)
+                self._by_id.setdefault(user.user_id, user)
+            self._next_id = max(self._by_id, default=0) + 1
+
+    @property
+    def by_username(self):
+        """用户名 -> 用户的只读映射"""
+        return MappingProxyType(self._by_username)
+
+    def get(self, username):
+        return self._by_username.get(username)
+
+    def get_by_id(self, user_id):
+        return self._by_id.get(user_id)
+
+    def __contains__(self, username):
+        return username in self._by_username
+
+    def __len__(self):
+        return len(self._by_username)
+
+    def add(self, user):
+        """把已有的用户对象加入目录 (不写入存储)，用户名已存在时返回 False"""
+        with self._lock:
+            if user.username in self._by_username:
+                return False
+            self.users.append(user)
+            self._by_username[user.username] = user
+            self._by_id[user.user_id] = user
+            self._next_id = max(self._next_id, user.user_id + 1)
+            return True
+
+    def _remove(self, user):
+        """撤销 add (新用户写入存储失败时)"""
+        with self._lock:
+            if self._by_username.get(user.username) is user:
+                del self._by_username[user.username]
+                self._by_id.pop(user.user_id, None)
+                self.users.remove(user)
+
+    def register(self, username, password, preferences=None, wait=False, timeout=10.0, immediate=True):
+        """注册新用户并排队写入存储；用户名已存在时抛出 ValueError
+
+        wait 为 True 时等到写入完成，写入失败时撤销注册并抛出存储的异常；
+        超时抛出 TimeoutError，此时记录仍在队列中，不撤销。immediate 为 False 时等待批量写入。
+        """
+        password_hash = hash_password(password, self.iterations) # 哈希较慢，不在锁内计算
+        with self._lock:
+            if username in self._by_username:
+                raise ValueError(f"Username '{username}' already exists")
+            user = User(self._next_id, username, password_hash, preferences)
+            self._next_id += 1
+            self.add(user)
+        try:
+            self._enqueue("add", user, wait, timeout, immediate)
+        except TimeoutError: # 记录仍在队列中，稍后可能写入成功，不撤销
+            raise
+        except Exception:
+            self._remove(user)
+            raise
+        return user
+
+    def authenticate(self, username, password):
+        """用户名和密码都正确时返回用户，否则返回 None"""
+        user = self._by_username.get(username)
+        if user is None or not verify_password(user.password, password):
+            return None
+        if not is_password_hash(user.password): # 旧的明文密码，登录成功后换成哈希
+            user.password = hash_password(password, self.iterations)
+            self._enqueue("password", user)
+        return user
+
+    def change_password(self, username, current_password, new_password, wait=False, timeout=10.0, immediate=True):
+        """校验当前密码后修改密码，用户名或当前密码错误时返回 None，成功时返回用户
+
+        wait 为 True 时等到写入完成，写入失败时恢复原密码并抛出存储的异常；immediate 的含义同 register。
+        """
+        user = self.authenticate(username, current_password)
+        if user is None:
+            return None
+        old_password = user.password
+        user.password = hash_password(new_password, self.iterations)
+        try:
+            self._enqueue("password", user, wait, timeout, immediate)
+        except TimeoutError:
+            raise
+        except Exception:
+            user.password = old_password
+            raise
+        return user
+
+    def _enqueue(self, kind, user, wait=False, timeout=None, immediate=True):
+        """排队写入；wait 为 True 时写完后返回，写入失败时抛出异常
+
+        immediate 为 True 时不等批量合并立即写入，否则与这段时间内的其他记录一起写入。
+        """
+        if self.repository is None:
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+        waiter = _Waiter(immediate) if wait else None
+        self._queue.put((kind, user, waiter))
+        if waiter is None:
+            return
+        if not waiter.done.wait(timeout):
+            raise TimeoutError("Timed out saving user data")
+        if waiter.error is not None:
+            raise waiter.error
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            # 第一条之后再等 flush_interval 秒，把这段时间内的注册合并成一次写入；
+            # 遇到要求立即写入的记录、flush 标记或停止标记时立即写入
+            batch = [item]
+            deadline = time.monotonic() + self.flush_interval
+            while (len(batch) < self.batch_size and isinstance(batch[-1], tuple)
+                   and (batch[-1][2] is None or not batch[-1][2].immediate)):
+                try:
+                    batch.append(self._queue.get(timeout=max(deadline - time.monotonic(), 0)))
+                except queue.Empty:
+                    break
+            flushes = [entry for entry in batch if isinstance(entry, threading.Event)]
+            entries = [entry for entry in batch if isinstance(entry, tuple)]
+            stopping = None in batch
+            error = self._write(entries)
+            for _, _, waiter in entries:
+                if waiter is not None:
+                    waiter.error = error
+                    waiter.done.set()
+            for flush in flushes:
+                flush.set()
+
+    def _write(self, entries):
+        """写入一批记录，返回写入时的异常 (成功时返回 None)"""
+        new_users = [user for kind, user, _ in entries if kind == "add"]
+        # 同一用户多次修改密码只写最后一次；新用户本身就带着最新的密码
+        changed = {id(user): user for kind, user, _ in entries if kind == "password"}
+        for user in new_users:
+            changed.pop(id(user), None)
+        try:
+            if new_users:
+                self.repository.add_users(new_users)
+            if changed:
+                self.repository.update_passwords(list(changed.values()))
+        except Exception as e:
+            print(f"Error saving users: {e}")
+            return e
+        return None
+
+    def flush(self, timeout=None):
+        """等待此前排队的用户和密码全部写入存储"""
+        if self._thread is None or not self._thread.is_alive():
+            return True
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def close(self, timeout=5):
+        """写完剩余的记录后停止后台线程"""
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join(timeout)
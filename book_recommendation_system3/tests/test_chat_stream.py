@@ -0,0 +1,145 @@
+import time
+import unittest
+from gui.chat_stream import ChatStreamer
+from models.chat_context import ResponseCache
+from utils.fake_chat_server import FakeChatServer
+
+# 运行方式 (在 book_recommendation_system3 目录下)：python -m unittest discover -s tests -t .
+
+MESSAGES = [{"role": "user", "content": "推荐几本书"}]
+
+
+class FakeMaster:
+    """代替 Tk 根窗口：记录 after() 注册的回调，由 pump() 在测试线程中按时间顺序执行"""
+
+    def __init__(self):
+        self.jobs = {}
+        self._next_id = 0
+
+    def after(self, ms, func):
+        self._next_id += 1
+        self.jobs[self._next_id] = (time.monotonic() + ms / 1000, func)
+        return self._next_id
+
+    def after_cancel(self, job):
+        self.jobs.pop(job, None)
+
+    def pump(self, until, timeout=5.0):
+        """执行到期的回调直到 until() 为真，超时返回 False"""
+        deadline = time.monotonic() + timeout
+        while not until():
+            if time.monotonic() > deadline:
+                return False
+            due = [job for job, (when, _) in self.jobs.items() if when <= time.monotonic()]
+            if not due:
+                time.sleep(0.002)
+                continue
+            for job in sorted(due):
+                _, func = self.jobs.pop(job)
+                func()
+        return True
+
+
+class FakeText:
+    """代替 Tk 文本框：记录插入的内容和插入次数"""
+
+    def __init__(self):
+        self.content = ""
+        self.inserts = 0
+
+    def config(self, **kwargs):
+        pass
+
+    def insert(self, index, text):
+        self.content += text
+        self.inserts += 1
+
+    def see(self, index):
+        pass
+
+
+class ChatStreamerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = FakeChatServer(reply="你好" * 100, chunk_size=2, delay=0.001)
+        self.base_url = self.server.start()
+        self.master = FakeMaster()
+        self.text = FakeText()
+        self.finished = []
+        self.streamer = ChatStreamer(self.master, self.text, on_finished=self.finished.append, fps=30,
+                                     api_key="test", base_url=self.base_url, model="fake")
+
+    def tearDown(self):
+        self.streamer.close()
+        self.server.stop()
+
+    def test_chunks_are_batched_per_frame(self):
+        self.streamer.start(MESSAGES)
+        self.assertTrue(self.master.pump(lambda: self.finished))
+        self.assertEqual(self.finished, [None])
+        self.assertEqual(self.text.content, "你好" * 100 + "\n\n")
+        # 100 个数据块在约 33 毫秒一帧的节奏下合并成少数几次插入
+        self.assertLess(self.text.inserts, 30)
+        self.assertEqual(self.server.requests[0]["messages"], MESSAGES)
+        self.assertTrue(self.server.requests[0]["stream"])
+
+    def test_stop_closes_connection_and_discards_pending_text(self):
+        self.server.delay = 0.05
+        self.streamer.start(MESSAGES)
+        self.assertTrue(self.master.pump(lambda: self.text.content))
+        self.streamer.stop()
+        self.assertEqual(self.finished, [None])
+        self.assertFalse(self.streamer.is_active)
+        shown = self.text.content
+        # 服务端在下一次写入时发现客户端已断开
+        deadline = time.monotonic() + 3
+        while not self.server.disconnects and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(self.server.disconnects, 1)
+        self.master.pump(lambda: False, timeout=0.2)
+        self.assertEqual(self.text.content, shown)
+        self.assertTrue(("你好" * 100).startswith(shown))
+        self.assertEqual(self.finished, [None])
+
+    def test_new_message_after_stop_only_shows_new_reply(self):
+        self.server.delay = 0.05
+        self.streamer.start(MESSAGES)
+        self.assertTrue(self.master.pump(lambda: self.text.content))
+        self.streamer.stop()
+        self.text.content = ""
+        self.server.delay = 0.001
+        self.server.reply = "新的回复"
+        self.streamer.start(MESSAGES)
+        self.assertTrue(self.master.pump(lambda: len(self.finished) == 2))
+        self.assertEqual(self.text.content, "新的回复\n\n")
+
+    def test_client_is_reused_between_messages(self):
+        self.streamer.start(MESSAGES)
+        self.assertTrue(self.master.pump(lambda: self.finished))
+        client = self.streamer._client
+        self.streamer.start(MESSAGES)
+        self.assertTrue(self.master.pump(lambda: len(self.finished) == 2))
+        self.assertIs(self.streamer._client, client)
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_cached_reply_skips_request(self):
+        self.streamer.cache = ResponseCache()
+        self.streamer.start(MESSAGES, cache_key="key")
+        self.assertTrue(self.master.pump(lambda: self.finished))
+        self.streamer.start(MESSAGES, cache_key="key")
+        self.assertTrue(self.master.pump(lambda: len(self.finished) == 2))
+        self.assertEqual(len(self.server.requests), 1)
+        self.assertEqual(self.text.content, ("你好" * 100 + "\n\n") * 2)
+
+    def test_missing_api_key_reports_error(self):
+        streamer = ChatStreamer(self.master, self.text, on_finished=self.finished.append, base_url=self.base_url)
+        streamer.api_key = None
+        streamer.start(MESSAGES)
+        self.assertTrue(self.master.pump(lambda: self.finished))
+        self.assertIsInstance(self.finished[0], RuntimeError)
+        self.assertIn("发生错误", self.text.content)
+        self.assertEqual(self.server.requests, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
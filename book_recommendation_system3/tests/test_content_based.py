@@ -0,0 +1,70 @@
+import unittest
+from models.book import Book
+from models.content_based import ContentBasedRecommender
+from models.recommendation_engine import RecommendationEngine
+from models.user import User
+
+# 运行方式 (在 book_recommendation_system3 目录下)：python -m unittest discover -s tests -t .
+
+DESCRIPTIONS = [
+    "dragon magic quest kingdom",
+    "dragon magic sword battle",
+    "space ship galaxy robot",
+    "space robot alien planet",
+    "detective murder mystery city",
+    "detective mystery crime police",
+]
+
+TIMEOUTS = {"cf": 5.0, "content": 5.0, "category": 5.0, "top_rated": 5.0}
+
+
+def make_books():
+    return [Book(str(i), f"Book {i}", "Author", "Fiction", description)
+            for i, description in enumerate(DESCRIPTIONS)]
+
+
+def make_user(user_id, ratings):
+    user = User(user_id, f"user{user_id}", "password")
+    for book_id, rating in ratings.items():
+        user.add_rating(book_id, rating)
+    return user
+
+
+class AddBookAfterFitTest(unittest.TestCase):
+    """模型训练之后 add_book 追加的书籍不在 TF-IDF 矩阵中，推荐时应被忽略而不是报维度错误"""
+
+    def setUp(self):
+        self.books = make_books()
+        self.user = make_user(1, {"0": 5.0, "2": 2.0})
+
+    def test_recommender_ignores_books_added_after_fit(self):
+        recommender = ContentBasedRecommender(self.books)
+        new_book = Book("new", "New Book", "Author", "Fiction", "dragon magic quest")
+        self.books.append(new_book)
+        self.user.add_rating("new", 5.0) # 新书作为种子也应被跳过
+
+        recs = recommender.recommend(self.user, n=10)
+        self.assertEqual(recs[0].book_id, "1")
+        self.assertNotIn(new_book, recs)
+        self.assertEqual(len(recs), len(DESCRIPTIONS) - 2)
+        self.assertEqual(recommender.recommend_many([self.user], n=10), [recs])
+
+    def test_engine_recommends_after_add_book(self):
+        users = [self.user, make_user(2, {"1": 4.0, "3": 5.0})]
+        for parallel_hybrid in (True, False):
+            with self.subTest(parallel_hybrid=parallel_hybrid):
+                engine = RecommendationEngine(make_books(), users, parallel_hybrid=parallel_hybrid,
+                                              hybrid_timeouts=TIMEOUTS)
+                engine.add_book(Book("new", "New Book", "Author", "Fiction", "dragon magic quest"))
+
+                recs = engine.get_recommendations_for_user(self.user, n=3)
+                self.assertEqual(len(recs), 3)
+                self.assertEqual(recs[0].book_id, "1")
+                self.assertEqual(len(engine.recommend_many(users, n=3)), 2)
+                if engine.hybrid:
+                    self.assertEqual(engine.hybrid.stats()["failures"], {})
+                    engine.hybrid.shutdown()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,100 @@
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 本地模拟的流式对话服务，接口与 OpenAI/DeepSeek 的 /chat/completions (stream=True) 相同，
+# 用于在没有网络和 API 密钥时调试 AI 对话标签页：
+#   python -m utils.fake_chat_server --port 8765
+#   DEEPSEEK_BASE_URL=http://127.0.0.1:8765 DEEPSEEK_API_KEY=test python main.py
+
+
+class FakeChatServer:
+    """按 SSE 格式逐块返回固定回复的本地 HTTP 服务"""
+
+    def __init__(self, reply="这是一条来自本地模拟服务的回复。", chunk_size=2, delay=0.02, host="127.0.0.1", port=0):
+        self.reply = reply
+        self.chunk_size = chunk_size # 每个数据块包含的字符数
+        self.delay = delay # 每个数据块之间的间隔 (秒)
+        self.requests = [] # 收到的请求体，便于检查客户端发送的消息
+        self.disconnects = 0 # 客户端在回复结束前断开连接的次数
+        self._server = ThreadingHTTPServer((host, port), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_POST(self):
+                if not self.path.rstrip("/").endswith("/chat/completions"):
+                    self.send_error(404)
+                    return
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                server.requests.append(body)
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Cache-Control", "no-cache")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                try:
+                    for start in range(0, len(server.reply), server.chunk_size):
+                        self._send_chunk(body, {"content": server.reply[start:start + server.chunk_size]}, None)
+                        time.sleep(server.delay)
+                    self._send_chunk(body, {}, "stop")
+                    self.wfile.write(b"data: [DONE]\n\n")
+                    self.wfile.flush()
+                except (BrokenPipeError, ConnectionResetError):
+                    server.disconnects += 1
+                self.close_connection = True
+
+            def _send_chunk(self, body, delta, finish_reason):
+                chunk = {
+                    "id": "chatcmpl-fake",
+                    "object": "chat.completion.chunk",
+                    "created": int(time.time()),
+                    "model": body.get("model", "fake"),
+                    "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+                }
+                self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+                self.wfile.flush()
+
+        return Handler
+
+    def start(self):
+        """在后台线程中启动服务，返回 base_url"""
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self.base_url
+
+    def serve_forever(self):
+        self._server.serve_forever()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="本地模拟的流式对话服务")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--reply", default="这是一条来自本地模拟服务的回复。" * 20)
+    parser.add_argument("--delay", type=float, default=0.02)
+    args = parser.parse_args()
+    fake_server = FakeChatServer(reply=args.reply, delay=args.delay, port=args.port)
+    print(f"Fake chat server listening on {fake_server.base_url}")
+    try:
+        fake_server.serve_forever()
+    except KeyboardInterrupt:
+        fake_server.stop()